@@ -0,0 +1,166 @@
+import os
+import hashlib
+import zipfile
+import argparse
+from io import BytesIO
+from pathlib import Path, PurePosixPath
+
+from fast_copy import NameTable, DIGEST_CHUNK
+
+# ========== 配置 ==========
+ARCHIVE_IMG_EXT = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+DIGEST_STORE_NAME = ".archive_digests.tsv"  # 放在输出目录下，跨次运行持久保存
+PART_SUFFIX = ".part"
+
+
+# ========== 摘要库 ==========
+
+class DigestStore:
+    """已导入内容的持久化摘要表，每行：摘要\\t目标文件名\\t来源。
+
+    启动时整表读入内存，新摘要追加写入（行缓冲），中断不丢已导入的记录。
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.seen = {}
+        self._f = None
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) >= 2 and parts[0]:
+                        self.seen[parts[0]] = parts[1]
+
+    def __contains__(self, digest):
+        return digest in self.seen
+
+    def __len__(self):
+        return len(self.seen)
+
+    def get(self, digest):
+        return self.seen.get(digest)
+
+    def add(self, digest, name, source):
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8", buffering=1)
+        self.seen[digest] = name
+        self._f.write(f"{digest}\t{name}\t{source}\n")
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ========== 流式导入 ==========
+
+def _open_archive(path):
+    if str(path).lower().endswith(".rar"):
+        import rarfile
+        return rarfile.RarFile(path)
+    return zipfile.ZipFile(path)
+
+
+def stream_member(src, dst, keep_bytes=False):
+    """把成员流式写入 dst，同时计算 BLAKE2b，返回 (摘要, 字节数, 内存副本或 None)。"""
+    h = hashlib.blake2b(digest_size=20)
+    buf = BytesIO() if keep_bytes else None
+    size = 0
+    with open(dst, "wb") as out:
+        for chunk in iter(lambda: src.read(DIGEST_CHUNK), b""):
+            h.update(chunk)
+            out.write(chunk)
+            if buf is not None:
+                buf.write(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size, (buf.getvalue() if buf is not None else None)
+
+
+def ingest_archive(archive_path, out_dir, store=None, names=None, hash_images=False):
+    """把 ZIP / RAR 中的图片成员平铺导入 out_dir。
+
+    - 边写边算摘要，摘要已在 store 中的成员删除临时文件并跳过；
+    - 同名不同内容按成员顺序依次加 _1、_2 后缀，不依赖逐个探测磁盘；
+    - hash_images=True 时用内存中的字节直接计算 pHash，返回可并入原图索引的记录。
+    store / names 可由调用方传入以便多个压缩包共享；未传入时使用 out_dir 下的默认摘要库。
+
+    返回报告字典：extracted / skipped_duplicate / bytes_written / failed / entries。
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    own_store = store is None
+    if own_store:
+        store = DigestStore(out_dir / DIGEST_STORE_NAME)
+    if names is None:
+        names = NameTable(out_dir)
+    if hash_images:
+        from build_image_index import _make_entry, file_signature
+
+    report = {"extracted": 0, "skipped_duplicate": 0, "bytes_written": 0, "failed": 0, "entries": []}
+    try:
+        with _open_archive(archive_path) as arc:
+            for member in arc.namelist():
+                name = PurePosixPath(member.replace("\\", "/")).name
+                if not name or PurePosixPath(name).suffix.lower() not in ARCHIVE_IMG_EXT:
+                    continue
+                tmp_path = out_dir / f".{name}{PART_SUFFIX}"
+                try:
+                    with arc.open(member) as src:
+                        digest, size, data = stream_member(src, tmp_path, keep_bytes=hash_images)
+                except Exception:
+                    report["failed"] += 1
+                    if tmp_path.exists():
+                        os.remove(tmp_path)
+                    continue
+
+                if digest in store:
+                    os.remove(tmp_path)
+                    report["skipped_duplicate"] += 1
+                    continue
+
+                final_path = out_dir / names.claim(name)
+                os.replace(tmp_path, final_path)
+                store.add(digest, final_path.name, f"{archive_path}:{member}")
+                report["extracted"] += 1
+                report["bytes_written"] += size
+
+                if hash_images:
+                    try:
+                        report["entries"].append(
+                            _make_entry(str(final_path), BytesIO(data), file_signature(final_path)))
+                    except Exception:
+                        report["failed"] += 1
+    finally:
+        if own_store:
+            store.close()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导入压缩包中的图片（按内容去重）")
+    parser.add_argument("archives", nargs="+", help="ZIP / RAR 文件")
+    parser.add_argument("out_dir")
+    parser.add_argument("--index", default=None, help="同时把新图片并入该原图索引（列表格式 JSON）")
+    args = parser.parse_args()
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    names = NameTable(out_dir)
+    entries = []
+    with DigestStore(out_dir / DIGEST_STORE_NAME) as store:
+        for archive in args.archives:
+            r = ingest_archive(archive, out_dir, store, names, hash_images=bool(args.index))
+            entries.extend(r["entries"])
+            print(f"{archive}: 导入 {r['extracted']}，跳过重复 {r['skipped_duplicate']}，"
+                  f"失败 {r['failed']}，写入 {r['bytes_written'] / (1 << 20):.2f} MB")
+    if args.index and entries:
+        from build_image_index import merge_into_index
+        total = merge_into_index(args.index, entries)
+        print(f"📝 已并入 {len(entries)} 条记录，索引共 {total} 条：{args.index}")
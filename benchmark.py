@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tempfile
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+import match_engine
+from build_image_index import build_image_index
+from binary_index import convert_json_to_binary, BINARY_INDEX_EXT
+from hash_search import HammingIndex
+from fast_copy import CopyEngine
+from fast_hash import phash_file_cascade
+
+# ========== 配置 ==========
+DEFAULT_COUNT = 200
+DEFAULT_RESOLUTION = (1600, 1200)
+DEFAULT_INDEX_SIZES = (1000, 10000, 100000, 1000000)
+LATENCY_QUERIES = 200  # 每个索引规模测量的查询次数
+THRESHOLDS = range(0, 11)
+DISTRACTOR_RATIO = 0.25  # 不在原图库中的干扰查询占比，用于计算精确率
+
+# 低清查询的派生方式：名称 -> (图片 -> (图片, 保存格式, 保存参数))
+TRANSFORMS = {
+    "downscale": lambda img: (img.resize((img.width // 4, img.height // 4), Image.LANCZOS), "JPEG", {"quality": 90}),
+    "jpeg_q30": lambda img: (img, "JPEG", {"quality": 30}),
+    "crop": lambda img: (img.crop((img.width // 33, img.height // 33,
+                                   img.width - img.width // 33, img.height - img.height // 33)),
+                         "JPEG", {"quality": 90}),
+    "png": lambda img: (img.resize((img.width // 2, img.height // 2), Image.BILINEAR), "PNG", {}),
+}
+FORMAT_EXT = {"JPEG": ".jpg", "PNG": ".png"}
+# 方向容错测量用的旋转 / 镜像查询（缩小 1/4 后转向），单独放在 queries_oriented 目录
+ORIENTED_TRANSFORMS = {
+    "rotate_90": Image.Transpose.ROTATE_90,
+    "rotate_270": Image.Transpose.ROTATE_270,
+    "rotate_180": Image.Transpose.ROTATE_180,
+    "mirror": Image.Transpose.FLIP_LEFT_RIGHT,
+}
+ORIENTED_RATIO = 0.25  # 旋转查询数量占原图数量的比例
+
+
+# ========== 合成数据 ==========
+
+def synth_image(seed, size):
+    """按种子生成一张带渐变与随机几何形状的彩色图，同一种子结果相同。"""
+    rnd = random.Random(seed)
+    w, h = size
+    base = np.linspace(0, 255, w, dtype=np.float32)[None, :] * rnd.random() + \
+        np.linspace(0, 255, h, dtype=np.float32)[:, None] * rnd.random()
+    rgb = np.stack([(base * rnd.uniform(0.3, 1.0) + rnd.randrange(128)) % 256 for _ in range(3)], axis=2)
+    img = Image.fromarray(rgb.astype(np.uint8), "RGB")
+    draw = ImageDraw.Draw(img)
+    for _ in range(rnd.randint(6, 14)):
+        x0, y0 = rnd.randrange(w), rnd.randrange(h)
+        x1, y1 = x0 + rnd.randrange(w // 8, w // 2), y0 + rnd.randrange(h // 8, h // 2)
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        shape = rnd.choice((draw.rectangle, draw.ellipse))
+        shape((x0, y0, x1, y1), fill=color)
+    return img.filter(ImageFilter.GaussianBlur(1))
+
+
+def make_corpus(workdir, count, resolution, seed=0):
+    """生成原图库与派生查询，返回 (原图目录, 查询目录, 真值 {查询文件名: 原图路径或 None})。"""
+    originals = os.path.join(workdir, "originals")
+    queries = os.path.join(workdir, "queries")
+    os.makedirs(originals, exist_ok=True)
+    os.makedirs(queries, exist_ok=True)
+    truth = {}
+    names = list(TRANSFORMS)
+    for i in range(count):
+        img = synth_image(seed * 1_000_003 + i, resolution)
+        orig_path = os.path.join(originals, f"orig_{i:06d}.jpg")
+        img.save(orig_path, "JPEG", quality=95)
+        name = names[i % len(names)]
+        q_img, fmt, params = TRANSFORMS[name](img)
+        q_name = f"q_{i:06d}_{name}{FORMAT_EXT[fmt]}"
+        q_img.save(os.path.join(queries, q_name), fmt, **params)
+        truth[q_name] = orig_path
+    # 干扰查询：不在原图库中，任何匹配都算误报
+    for j in range(int(count * DISTRACTOR_RATIO)):
+        img = synth_image(seed * 1_000_003 + count + j, resolution)
+        q_name = f"d_{j:06d}.jpg"
+        img.resize((resolution[0] // 4, resolution[1] // 4), Image.LANCZOS).save(
+            os.path.join(queries, q_name), "JPEG", quality=85)
+        truth[q_name] = None
+    return originals, queries, truth
+
+
+def make_oriented_queries(workdir, originals, count, resolution, seed=0):
+    """按相同种子重建部分原图并旋转 / 镜像，返回 (查询目录, 真值)。"""
+    queries = os.path.join(workdir, "queries_oriented")
+    os.makedirs(queries, exist_ok=True)
+    truth = {}
+    names = list(ORIENTED_TRANSFORMS)
+    for i in range(max(1, int(count * ORIENTED_RATIO))):
+        img = synth_image(seed * 1_000_003 + i, resolution)
+        name = names[i % len(names)]
+        q_img = img.resize((img.width // 4, img.height // 4), Image.LANCZOS).transpose(ORIENTED_TRANSFORMS[name])
+        q_name = f"o_{i:06d}_{name}.jpg"
+        q_img.save(os.path.join(queries, q_name), "JPEG", quality=90)
+        truth[q_name] = os.path.join(originals, f"orig_{i:06d}.jpg")
+    return queries, truth
+
+
+# ========== 计时 ==========
+
+def _percentiles(samples):
+    arr = np.asarray(samples, dtype=np.float64)
+    if not len(arr):
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {"mean": float(arr.mean()), "p50": float(np.percentile(arr, 50)),
+            "p95": float(np.percentile(arr, 95)), "max": float(arr.max())}
+
+
+def bench_build(originals, index_json, workers):
+    t0 = time.perf_counter()
+    build_image_index(originals, index_json, workers=workers, incremental=False)
+    seconds = time.perf_counter() - t0
+    with open(index_json, "r", encoding="utf-8") as f:
+        count = len(json.load(f))
+    return {"images": count, "seconds": seconds, "images_per_second": count / seconds if seconds else 0.0}
+
+
+def bench_load(index_json):
+    """JSON 冷加载、检索缓存加载、.phidx 加载三种方式的耗时（秒）。"""
+    for cache in (index_json + ".pkl", index_json + ".mih.pkl"):
+        if os.path.exists(cache):
+            os.remove(cache)
+    result = {}
+    for label, path in (("json", index_json), ("mih_cache", index_json)):
+        t0 = time.perf_counter()
+        match_engine.load_index(path)
+        result[label] = time.perf_counter() - t0
+    phidx = os.path.splitext(index_json)[0] + BINARY_INDEX_EXT
+    convert_json_to_binary(index_json, phidx)
+    t0 = time.perf_counter()
+    match_engine.load_index(phidx)
+    result["phidx"] = time.perf_counter() - t0
+    return result
+
+
+class _PaddedPaths:
+    """真实路径 + 合成占位路径，避免为百万条记录分配字符串。"""
+
+    def __init__(self, real, total):
+        self.real = real
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, row):
+        row = int(row)
+        return self.real[row] if row < len(self.real) else f"<synthetic {row}>"
+
+
+def padded_index(index, total, seed=0):
+    """在真实索引后补随机哈希，扩到 total 条，用于测量查询延迟随规模的变化。"""
+    n = len(index)
+    extra = max(0, total - n)
+    rng = np.random.default_rng(seed)
+    hashes = np.concatenate([index.hashes, rng.integers(0, 2 ** 64, size=extra, dtype=np.uint64)])
+    sizes = fine = None
+    if index.sizes is not None:
+        sizes = np.concatenate([index.sizes, np.zeros((extra, 2), dtype=np.uint32)])
+    if index.fine is not None:
+        pad = rng.integers(0, 2 ** 64, size=(extra, index.fine.shape[1]), dtype=np.uint64)
+        fine = np.concatenate([index.fine, pad])
+    return HammingIndex(hashes, _PaddedPaths(index.paths, n + extra), index.bits, sizes, fine)
+
+
+def bench_latency(index, hashed, sizes, threshold, seed=0, variant_hashed=None):
+    """每个规模下对真实查询哈希逐条调用 find_best_match，返回延迟统计（微秒）。
+
+    给出 variant_hashed（8 个方向的哈希）时同时测量 find_best_match_any 的一次批量检索。
+    """
+    rows = []
+    samples = hashed[:LATENCY_QUERIES]
+    for total in sizes:
+        t0 = time.perf_counter()
+        big = padded_index(index, total, seed)
+        build_seconds = time.perf_counter() - t0
+        lat = []
+        for coarse, fine in samples:
+            t0 = time.perf_counter()
+            match_engine.find_best_match(coarse, big, threshold, fine)
+            lat.append((time.perf_counter() - t0) * 1e6)
+        rows.append({"index_size": total, "build_seconds": build_seconds, "latency_us": _percentiles(lat)})
+        print(f"  规模 {total:>8}：p50 {rows[-1]['latency_us']['p50']:.1f} µs，"
+              f"p95 {rows[-1]['latency_us']['p95']:.1f} µs")
+        if variant_hashed:
+            lat = []
+            for coarse, fine in variant_hashed[:LATENCY_QUERIES]:
+                t0 = time.perf_counter()
+                match_engine.find_best_match_any(coarse, big, threshold, fine)
+                lat.append((time.perf_counter() - t0) * 1e6)
+            rows[-1]["latency_any_orientation_us"] = _percentiles(lat)
+            print(f"  {'8 方向':>11}：p50 {rows[-1]['latency_any_orientation_us']['p50']:.1f} µs，"
+                  f"p95 {rows[-1]['latency_any_orientation_us']['p95']:.1f} µs")
+        del big
+    return rows
+
+
+def bench_copy(originals, dst):
+    os.makedirs(dst, exist_ok=True)
+    engine = CopyEngine(skip_identical=False)
+    for name in sorted(os.listdir(originals)):
+        engine.submit(os.path.join(originals, name), os.path.join(dst, name))
+    engine.wait()
+    return engine.summary()
+
+
+# ========== 准确率 ==========
+
+def bench_accuracy(index, queries, truth):
+    """阈值 0–10 的召回率 / 精确率（整体与按派生方式）。"""
+    hashed = {}
+    for q_name in sorted(truth):
+        _, coarse, fine = match_engine.hash_query(os.path.join(queries, q_name))
+        hashed[q_name] = (coarse, fine)
+
+    positives = [q for q in truth if truth[q] is not None]
+    rows = []
+    for t in THRESHOLDS:
+        tp = fp = 0
+        per = {name: [0, 0] for name in TRANSFORMS}
+        for q_name, (coarse, fine) in hashed.items():
+            _, match = match_engine.find_best_match(coarse, index, t, fine)
+            expected = truth[q_name]
+            if expected is not None:
+                kind = os.path.splitext(q_name.split("_", 2)[2])[0]
+                per[kind][1] += 1
+            if match is None:
+                continue
+            if match == expected:
+                tp += 1
+                per[kind][0] += 1
+            else:
+                fp += 1
+        rows.append({
+            "threshold": t,
+            "recall": tp / len(positives) if positives else 0.0,
+            "precision": tp / (tp + fp) if tp + fp else 1.0,
+            "true_positives": tp,
+            "false_positives": fp,
+            "recall_by_transform": {k: (v[0] / v[1] if v[1] else 0.0) for k, v in per.items()},
+        })
+    return rows, [hashed[q] for q in sorted(hashed) if truth[q] is not None]
+
+
+def bench_orientation(index, queries, truth, threshold):
+    """旋转 / 镜像查询：单方向与 8 方向的召回率，以及 8 方向哈希增加的耗时（同一次解码）。"""
+    hash_us = {"identity": [], "variants": []}
+    found = {"identity": 0, "any_orientation": 0}
+    variant_hashed = []
+    for q_name in sorted(truth):
+        path = os.path.join(queries, q_name)
+        t0 = time.perf_counter()
+        _, coarse, fine = phash_file_cascade(path)
+        t1 = time.perf_counter()
+        _, coarse_v, fine_v = phash_file_cascade(path, variants=True)
+        t2 = time.perf_counter()
+        hash_us["identity"].append((t1 - t0) * 1e6)
+        hash_us["variants"].append((t2 - t1) * 1e6)
+        variant_hashed.append((coarse_v, fine_v))
+        found["identity"] += match_engine.find_best_match(coarse, index, threshold, fine)[1] == truth[q_name]
+        found["any_orientation"] += match_engine.find_best_match_any(coarse_v, index, threshold, fine_v)[1] == truth[q_name]
+    n = len(truth)
+    result = {
+        "queries": n,
+        "threshold": threshold,
+        "recall": {k: v / n if n else 0.0 for k, v in found.items()},
+        "decode_and_hash_us": {k: _percentiles(v) for k, v in hash_us.items()},
+        "added_hash_us": float(np.mean(hash_us["variants"]) - np.mean(hash_us["identity"])) if n else 0.0,
+    }
+    return result, variant_hashed
+
+
+# ========== 主流程 ==========
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmark(count=DEFAULT_COUNT, resolution=DEFAULT_RESOLUTION, index_sizes=DEFAULT_INDEX_SIZES,
+                  workers=None, seed=0, workdir=None, threshold=match_engine.SIMILARITY_THRESHOLD):
+    """生成语料并跑完全部测量，返回结果字典。"""
+    workdir = workdir or tempfile.mkdtemp(prefix="phash_bench_")
+    print(f"📁 工作目录：{workdir}")
+
+    t0 = time.perf_counter()
+    originals, queries, truth = make_corpus(workdir, count, resolution, seed)
+    print(f"🖼 已生成 {count} 张原图、{len(truth)} 张查询图，用时 {time.perf_counter() - t0:.1f}s")
+
+    index_json = os.path.join(workdir, "bench_index.json")
+    build = bench_build(originals, index_json, workers)
+    print(f"⏱ 建索引：{build['images_per_second']:.1f} 张/秒")
+
+    load = bench_load(index_json)
+    print(f"⏱ 加载：JSON {load['json']:.3f}s，检索缓存 {load['mih_cache']:.3f}s，.phidx {load['phidx']:.3f}s")
+
+    index = match_engine.load_index(index_json)
+    accuracy, hashed = bench_accuracy(index, queries, truth)
+    for row in accuracy:
+        print(f"  阈值 {row['threshold']:>2}：召回 {row['recall']:.3f}，精确 {row['precision']:.3f}")
+
+    oriented_dir, oriented_truth = make_oriented_queries(workdir, originals, count, resolution, seed)
+    orientation, variant_hashed = bench_orientation(index, oriented_dir, oriented_truth, threshold)
+    print(f"🔄 旋转 / 镜像查询 {orientation['queries']} 张：单方向召回 {orientation['recall']['identity']:.3f}，"
+          f"8 方向召回 {orientation['recall']['any_orientation']:.3f}，"
+          f"哈希增加 {orientation['added_hash_us']:.0f} µs/张")
+
+    print("⏱ 查询延迟：")
+    latency = bench_latency(index, hashed, index_sizes, threshold, seed, variant_hashed)
+
+    copy = bench_copy(originals, os.path.join(workdir, "copy_out"))
+    print(f"⏱ 复制：{copy['mb_per_second']} MB/s（{copy['methods']}）")
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "count": count,
+            "resolution": list(resolution),
+            "seed": seed,
+            "workers": workers,
+            "threshold": threshold,
+        },
+        "build": build,
+        "load_seconds": load,
+        "query_latency": latency,
+        "copy": copy,
+        "accuracy": accuracy,
+        "orientation": orientation,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="索引构建 / 加载 / 查询 / 复制 基准测试（合成语料）")
+    parser.add_argument("--count", type=int, default=DEFAULT_COUNT, help="原图数量")
+    parser.add_argument("--resolution", default="x".join(map(str, DEFAULT_RESOLUTION)), help="原图尺寸，如 1600x1200")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_INDEX_SIZES)), help="查询延迟测量的索引规模")
+    parser.add_argument("--workers", type=int, default=None, help="建索引进程数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="语料与中间文件目录，默认临时目录")
+    parser.add_argument("--out", default="benchmark_results.json", help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    width, height = (int(x) for x in args.resolution.lower().split("x"))
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run_benchmark(args.count, (width, height), sizes, args.workers, args.seed, args.workdir)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"📝 结果已保存：{args.out}")
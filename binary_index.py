@@ -0,0 +1,203 @@
+import json
+import mmap
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from hash_search import HammingIndex, ExactIndex, DIGEST_BYTES, exact_key, hash_to_int, pack_wide_hashes
+from fast_hash import EXIF_ALGORITHM, HASH_ALGORITHM
+
+# ========== 文件格式 ==========
+# [头部 32 字节][定长记录表 count x 32 字节][UTF-8 路径串表][可选：细哈希表 count x 32 字节]
+# [可选：精确查重表 count x 28 字节（字节数 + BLAKE2b 摘要）]
+# 头部：magic, 版本, 记录长度, 记录数, 路径表字节数, CRC32(头部之后全部内容), 标志位
+BINARY_INDEX_EXT = ".phidx"
+MAGIC = b"PHIX"
+VERSION = 4
+SUPPORTED_VERSIONS = (1, 2, 3, 4)
+FLAG_FINE = 1  # 含 256 位细哈希表（版本 2 起）
+FLAG_EXACT = 2  # 含精确查重表（版本 3 起）
+FLAG_EXIF = 4  # 全部记录按 EXIF 方向摆正后计算（algorithm 为 EXIF_ALGORITHM，版本 4 起）
+FINE_WORDS = 4
+VERIFY_CHUNK = 1 << 24  # 校验 CRC32 时每次计算的字节数，不复制整个映射
+HEADER = struct.Struct("<4sHHQQII")
+RECORD_DTYPE = np.dtype([
+    ("hash", "<u8"),
+    ("width", "<u4"),
+    ("height", "<u4"),
+    ("path_offset", "<u8"),
+    ("path_length", "<u4"),
+    ("reserved", "<u4"),
+])
+EXACT_DTYPE = np.dtype([
+    ("file_size", "<u8"),
+    ("digest", "u1", (DIGEST_BYTES,)),
+])
+
+
+class BinaryIndexError(Exception):
+    pass
+
+
+# ========== 写入 ==========
+
+def write_binary_index(entries, out_path):
+    """把 [{"path", "phash", "size", "phash_fine", "digest"}] 记录写成二进制索引，返回写入条数。
+
+    只有全部记录都带 256 位 phash_fine 时才写入细哈希表；任一记录带摘要时写入精确查重表；
+    全部记录的 algorithm 都是 EXIF_ALGORITHM 时置 FLAG_EXIF。
+    """
+    records, paths, fine, exact, offset, exif = [], [], [], [], 0, True
+    for e in entries:
+        if "phash" not in e:
+            continue  # 容器占位记录不进入检索结构
+        raw = e["path"].encode("utf-8")
+        width, height = e.get("size") or (0, 0)
+        records.append((hash_to_int(e["phash"]), width, height, offset, len(raw), 0))
+        paths.append(raw)
+        fine.append(e.get("phash_fine"))
+        exact.append(exact_key(e))
+        exif = exif and e.get("algorithm") == EXIF_ALGORITHM
+        offset += len(raw)
+    table = np.array(records, dtype=RECORD_DTYPE).tobytes()
+    path_blob = b"".join(paths)
+    flags, fine_blob = FLAG_EXIF if records and exif else 0, b""
+    if fine and all(f and len(f) == FINE_WORDS * 16 for f in fine):
+        flags |= FLAG_FINE
+        fine_blob = pack_wide_hashes(fine).astype("<u8").tobytes()
+    exact_blob = b""
+    if any(d for _, d in exact):
+        flags |= FLAG_EXACT
+        blank = bytes(DIGEST_BYTES)
+        exact_blob = np.array([(n if d else 0, tuple(bytes.fromhex(d) if d else blank)) for n, d in exact],
+                              dtype=EXACT_DTYPE).tobytes()
+    crc = zlib.crc32(exact_blob, zlib.crc32(fine_blob, zlib.crc32(path_blob, zlib.crc32(table))))
+    with open(out_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, len(records), len(path_blob), crc, flags))
+        f.write(table)
+        f.write(path_blob)
+        f.write(fine_blob)
+        f.write(exact_blob)
+    return len(records)
+
+
+# ========== 读取 ==========
+
+class BinaryIndex:
+    """以 mmap 打开的二进制索引；记录表直接映射为 NumPy 结构数组，不复制。
+
+    支持 len() 与按行号取路径，可直接作为 HammingIndex 的 paths 序列。
+    """
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        self.records = self.fine = self.exact = self._mm = None
+        self._file = open(path, "rb")
+        try:
+            if self._file.seek(0, 2) < HEADER.size:  # 空文件无法 mmap
+                raise BinaryIndexError(f"文件过短：{path}")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse(verify)
+        except Exception as e:
+            # 头部或校验和不符时同样释放映射与文件句柄
+            self.close()
+            if isinstance(e, BinaryIndexError):
+                raise
+            raise BinaryIndexError(f"无法读取二进制索引：{path}（{e}）") from e
+
+    def _parse(self, verify):
+        path = self.path
+        magic, version, rec_size, count, paths_size, crc, flags = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise BinaryIndexError(f"不是二进制索引文件：{path}")
+        if version not in SUPPORTED_VERSIONS or rec_size != RECORD_DTYPE.itemsize:
+            raise BinaryIndexError(f"不支持的索引版本 {version}（记录长度 {rec_size}）")
+        self.count = count
+        self.crc = crc
+        self._paths_start = HEADER.size + count * rec_size
+        fine_start = self._paths_start + paths_size
+        has_fine = version >= 2 and flags & FLAG_FINE
+        has_exact = version >= 3 and flags & FLAG_EXACT
+        self.algorithm = EXIF_ALGORITHM if version >= 4 and flags & FLAG_EXIF else None
+        exact_start = fine_start + (count * FINE_WORDS * 8 if has_fine else 0)
+        if len(self._mm) != exact_start + (count * EXACT_DTYPE.itemsize if has_exact else 0):
+            raise BinaryIndexError(f"文件长度与头部不符：{path}")
+        self.records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)
+        self.fine = None
+        if has_fine:
+            self.fine = np.frombuffer(self._mm, dtype="<u8", count=count * FINE_WORDS,
+                                      offset=fine_start).reshape(count, FINE_WORDS)
+        self.exact = None
+        if has_exact:
+            self.exact = np.frombuffer(self._mm, dtype=EXACT_DTYPE, count=count, offset=exact_start)
+        if verify:
+            self.verify()
+
+    def verify(self):
+        """校验 CRC32，损坏时抛出 BinaryIndexError。"""
+        crc = 0
+        with memoryview(self._mm) as view:
+            for start in range(HEADER.size, len(view), VERIFY_CHUNK):
+                with view[start:start + VERIFY_CHUNK] as chunk:
+                    crc = zlib.crc32(chunk, crc)
+        if crc != self.crc:
+            raise BinaryIndexError(f"校验和不匹配，索引可能已损坏：{self.path}")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        rec = self.records[int(row)]
+        start = self._paths_start + int(rec["path_offset"])
+        return self._mm[start:start + int(rec["path_length"])].decode("utf-8")
+
+    @property
+    def hashes(self):
+        return self.records["hash"]
+
+    def size(self, row):
+        rec = self.records[int(row)]
+        return int(rec["width"]), int(rec["height"])
+
+    def to_hamming_index(self):
+        """建立检索结构；哈希与路径都留在映射内存里。"""
+        sizes = np.stack([self.records["width"], self.records["height"]], axis=1)
+        exact = None
+        if self.exact is not None:
+            exact = ExactIndex(self.exact["file_size"], self.exact["digest"])
+        index = HammingIndex(self.hashes, self, 64, sizes, self.fine, exact)
+        index.stale = 0 if self.algorithm == HASH_ALGORITHM else self.count
+        return index
+
+    def close(self):
+        self.records = None
+        self.fine = None
+        self.exact = None
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+
+# ========== 格式转换 ==========
+
+def load_json_entries(json_in):
+    """读取列表或字典格式的 JSON 索引（见 convert.py），统一为记录列表。"""
+    with open(json_in, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return [e for e in data if "phash" in e and "path" in e]
+    # 字典格式 {phash: path} 不含尺寸与细哈希
+    return [{"phash": h, "path": p, "size": (0, 0)} for h, p in data.items()]
+
+
+def convert_json_to_binary(json_in, out_path):
+    count = write_binary_index(load_json_entries(json_in), out_path)
+    print(f"转换完成！输出保存为：{out_path}，共 {count} 条记录。")
+    return count
+
+
+if __name__ == "__main__":
+    # 用法：python binary_index.py 原图索引.json 原图索引.phidx
+    convert_json_to_binary(sys.argv[1], sys.argv[2])
@@ -1,44 +1,464 @@
 import os
 import json
-from PIL import Image
-import imagehash
+import time
+import hashlib
+import argparse
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from tqdm import tqdm
+from hash_search import search_index_path, DIGEST_BYTES
+from fast_hash import phash_file_cascade, HASH_ALGORITHM
+from embedded_images import CONTAINER_EXTS, is_container, container_of, iter_embedded_images
+from metrics import Metrics, DISABLED, METRICS_SUFFIX
+from index_store import IndexStore, INDEX_STORE_EXT, STORE_BATCH
 
-def build_image_index(base_dir, output_json="image_index.json"):
-    index = []
-    valid_exts = (".jpg", ".jpeg", ".png")
+VALID_EXTS = (".jpg", ".jpeg", ".png")
+INDEX_CONTAINERS = True  # 同时索引 PDF / DOCX 内嵌图片（以虚拟路径记录，不落盘）
+CHUNK_SIZE = 32  # 每个进程任务包含的图片数，减少进程间通信开销
+# 增量构建判断文件是否变化只需这些字段；哈希与摘要只记是否存在，不在内存中保留
+REFRESH_KEYS = ("path", "phash", "phash_fine", "digest", "file_size", "mtime", "inode", "algorithm", "images")
+PAYLOAD_KEYS = ("phash", "phash_fine", "digest")
 
-    # 收集所有待处理图片路径
+def collect_images(base_dir, recursive=True):
+    """收集所有待处理图片路径（排除外宣目录），含 PDF / DOCX 容器文件；recursive=False 时只取 base_dir 本层。"""
+    exts = VALID_EXTS + CONTAINER_EXTS if INDEX_CONTAINERS else VALID_EXTS
     all_images = []
     for root, dirs, files in os.walk(base_dir):
+        if not recursive:
+            dirs[:] = []
         if "外宣" in root:
             continue
         for file in files:
-            if file.lower().endswith(valid_exts):
+            if file.lower().endswith(exts):
                 all_images.append(os.path.join(root, file))
+    return all_images
+
+def file_signature(path):
+    """(文件大小, 修改时间, inode)，用于判断文件是否变化。"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime, st.st_ino
+
+def _make_entry(path, source, signature, timings=None):
+    """source 为图片字节的 BytesIO；同一份字节既算内容摘要，也用于解码。
+
+    timings 不为 None 时累加 decode / hash / digest 各阶段耗时。
+    """
+    file_size, mtime, inode = signature
+    data = source.getvalue()
+    size, phash, fine = phash_file_cascade(source, timings=timings)  # 一次降分辨率解码，同时得到两级哈希
+    t0 = time.perf_counter()
+    digest = hashlib.blake2b(data, digest_size=DIGEST_BYTES).hexdigest()
+    if timings is not None:
+        timings["digest"] = time.perf_counter() - t0
+    entry = {
+        "path": path,
+        "phash": str(phash),
+        "phash_fine": str(fine),
+        "size": size,
+        "file_size": file_size,
+        "mtime": mtime,
+        "inode": inode,
+        "digest": digest,
+        "algorithm": HASH_ALGORITHM
+    }
+    if len(data) != file_size:
+        entry["content_size"] = len(data)  # 内嵌图片：file_size 是容器大小，精确查重用图片本身的字节数
+    return entry
+
+def hash_image_file(path, timings=None):
+    """计算单张图片的索引记录（文件只读一次）。"""
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        data = f.read()
+    if timings is not None:
+        timings["read"] = time.perf_counter() - t0
+        timings["bytes"] = len(data)
+    return _make_entry(path, BytesIO(data), file_signature(path), timings)
+
+def container_marker(path, signature):
+    """没有可索引图片（不含图片或全部失败）的容器文件的占位记录：只有文件信息、没有哈希。
+
+    增量构建据此判断容器未变化，不再每次重新打开扫描；加载检索结构时跳过（见 is_marker）。
+    """
+    file_size, mtime, inode = signature
+    return {"path": path, "file_size": file_size, "mtime": mtime, "inode": inode,
+            "algorithm": HASH_ALGORITHM, "images": 0}
+
+def is_marker(entry):
+    return "phash" not in entry and entry.get("images") == 0
+
+def hash_container_file(path):
+    """在内存中哈希 PDF / DOCX 内嵌的全部图片，返回 (记录列表, [(虚拟路径, 错误)])。
+
+    记录的 path 为虚拟路径，文件信息取自容器文件本身，便于增量判断；
+    一张图片都没有索引上时返回容器的占位记录。
+    """
+    signature = file_signature(path)
+    entries, errors = [], []
+    for vpath, data in iter_embedded_images(path):
+        try:
+            entries.append(_make_entry(vpath, BytesIO(data), signature))
+        except Exception as e:
+            errors.append((vpath, str(e)))
+    if not entries:
+        entries.append(container_marker(path, signature))
+    return entries, errors
+
+def iter_index_entries(output_json, paths=None):
+    """逐条读出列表式索引中的记录（含容器占位记录）；给出 paths 时只产出 path 在其中的记录。
+
+    本模块写出的索引每行一条记录，逐行解析，不整体载入；
+    其它排版（如 json.dump 的缩进格式）退回 json.load，字典格式不产出任何记录。
+    """
+    def wanted(e):
+        return (isinstance(e, dict) and "path" in e and ("phash" in e or is_marker(e))
+                and (paths is None or e["path"] in paths))
 
-    print(f"🔍 共发现 {len(all_images)} 张候选图片，开始计算哈希...")
+    with open(output_json, "r", encoding="utf-8") as f:
+        if f.readline().strip() == "[":
+            parsed = 0
+            for line in f:
+                line = line.strip().rstrip(",")
+                if not line or line == "]":
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    if parsed:
+                        raise
+                    break  # 不是每行一条记录的排版
+                parsed += 1
+                if wanted(entry):
+                    yield entry
+            else:
+                return
+        f.seek(0)
+        data = json.load(f)
+    if isinstance(data, list):
+        yield from (e for e in data if wanted(e))
 
-    for path in tqdm(all_images, desc="正在处理图像"):
+def load_previous_index(output_json, summary=False):
+    """读取已有的列表式索引，返回 {path: 记录}；不存在或无法读取时返回空字典。
+
+    summary=True 时每条只保留 REFRESH_KEYS（哈希与摘要记为 True），供 plan_refresh 使用。
+    """
+    if not os.path.exists(output_json):
+        return {}
+    try:
+        if summary:
+            return {e["path"]: {k: True if k in PAYLOAD_KEYS else e[k] for k in REFRESH_KEYS if k in e}
+                    for e in iter_index_entries(output_json)}
+        return {e["path"]: e for e in iter_index_entries(output_json)}
+    except Exception:
+        return {}
+
+def plan_refresh(all_images, previous):
+    """对比现有索引，返回 (可复用记录, 需重新哈希的文件路径, 统计)；previous 可以是 load_previous_index 的摘要。
+
+    内嵌图片的记录按所属容器文件分组，容器未变化时整组复用。
+    algorithm 与当前哈希算法不一致（如 EXIF 摆正之前生成）的记录视为变化，重新哈希。
+    """
+    by_file = {}
+    for path, entry in previous.items():
+        by_file.setdefault(container_of(path), []).append(entry)
+
+    reused, to_hash = [], []
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    for path in all_images:
+        olds = by_file.get(path)
+        if olds is None:
+            stats["added"] += 1
+            to_hash.append(path)
+            continue
         try:
-            with Image.open(path) as img:
-                img = img.convert("RGB")
-                phash = str(imagehash.phash(img))
-                size = img.size
-            index.append({
-                "path": path,
-                "phash": phash,
-                "size": size
-            })
-        except:
+            sig = file_signature(path)
+        except OSError:
+            stats["removed"] += 1
             continue
+        if all((old.get("file_size"), old.get("mtime"), old.get("inode")) == sig
+               and (is_marker(old) or "phash_fine" in old and "digest" in old)
+               and old.get("algorithm") == HASH_ALGORITHM for old in olds):
+            stats["unchanged"] += 1
+            reused.extend(olds)
+        else:
+            stats["changed"] += 1
+            to_hash.append(path)
+    current = set(all_images)
+    stats["removed"] += sum(1 for p in by_file if p not in current)
+    return reused, to_hash, stats
+
+def invalidate_caches(output_json):
+    """删除由 file.load_hash_index 生成的 .pkl 与检索缓存，避免读到旧数据。"""
+    for cache in (output_json + ".pkl", search_index_path(output_json)):
+        try:
+            os.remove(cache)
+        except FileNotFoundError:
+            pass
+
+def _hash_chunk(paths):
+    """在子进程中处理一批文件，返回 [(path, 记录列表, [(路径, 错误信息)], {阶段: 秒})]。"""
+    results = []
+    for path in paths:
+        timings = {}
+        try:
+            if is_container(path):
+                t0 = time.perf_counter()
+                entries, errors = hash_container_file(path)
+                timings["container"] = time.perf_counter() - t0
+                results.append((path, entries, errors, timings))
+            else:
+                results.append((path, [hash_image_file(path, timings)], [], timings))
+        except Exception as e:
+            # 无法打开的容器同样写占位记录，文件不变时不再反复尝试
+            marker = [container_marker(path, file_signature(path))] if is_container(path) and os.path.exists(path) else []
+            results.append((path, marker, [(path, str(e))], timings))
+    return results
+
+def iter_hashed_images(paths, workers=None, chunk_size=CHUNK_SIZE):
+    """每个输入文件产出一次 (path, 记录列表, [(路径, 错误信息)], 计时)，完成顺序不保证与输入一致。
+
+    普通图片对应一条记录；PDF / DOCX 对应其内嵌的全部图片。
+
+    workers=1 时在当前进程内顺序执行；否则使用进程池，
+    任务按 chunk_size 分块提交，同时在途的块数限制为 workers*2。
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        for path in paths:
+            yield _hash_chunk([path])[0]
+        return
+
+    chunks = (paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size))
+    with ProcessPoolExecutor(max_workers=workers) as exe:
+        pending = set()
+        for chunk in chunks:
+            pending.add(exe.submit(_hash_chunk, chunk))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield from fut.result()
+        for fut in pending:
+            yield from fut.result()
+
+class IndexWriter:
+    """边构建边追加写入的检查点日志。
+
+    每条成功记录立即追加到 <索引>.partial.jsonl，失败写入 <索引>.failures.jsonl；
+    中断后以 resume=True 重新运行会跳过日志中已有的路径。
+    finalize 时把复用的旧记录（可为从旧索引逐条读出的迭代器）与日志流式拼装成最终 JSON，
+    不在内存中保留记录本身。
+    """
+
+    def __init__(self, output_json, resume=False):
+        self.output_json = output_json
+        self.partial_path = output_json + ".partial.jsonl"
+        self.failures_path = output_json + ".failures.jsonl"
+        self.done = set()
+        self.failed = 0
+        if resume:
+            for log_path in (self.partial_path, self.failures_path):
+                self.done.update(self._logged_paths(log_path))
+        mode = "a" if resume else "w"
+        self._partial = open(self.partial_path, mode, encoding="utf-8", buffering=1)
+        self._failures = open(self.failures_path, mode, encoding="utf-8", buffering=1)
+
+    @staticmethod
+    def _logged_paths(log_path):
+        if not os.path.exists(log_path):
+            return
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield container_of(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue  # 中断时写了一半的行
+
+    def add(self, entry):
+        self._partial.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def fail(self, path, error):
+        self.failed += 1
+        self._failures.write(json.dumps({"path": path, "error": error}, ensure_ascii=False) + "\n")
+
+    def finalize(self, reused):
+        """写出最终 JSON（先写临时文件再替换），返回图片记录条数（不含容器占位记录）。
+
+        reused 可以是 iter_index_entries 读取旧索引的迭代器：旧索引在全部写完后才被替换。
+        """
+        self._partial.close()
+        self._failures.close()
+        tmp_path = self.output_json + ".tmp"
+        written = count = 0
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            out.write("[\n")
+            for entry in reused:
+                out.write((",\n" if written else "") + json.dumps(entry, ensure_ascii=False))
+                written += 1
+                count += not is_marker(entry)
+            with open(self.partial_path, "r", encoding="utf-8") as log:
+                for line in log:
+                    line = line.strip()
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    out.write((",\n" if written else "") + line)
+                    written += 1
+                    count += not is_marker(entry)
+            out.write("\n]\n")
+        os.replace(tmp_path, self.output_json)
+        os.remove(self.partial_path)
+        if not self.failed and not os.path.getsize(self.failures_path):
+            os.remove(self.failures_path)
+        invalidate_caches(self.output_json)
+        return count
+
+def hash_into_writer(to_hash, writer, workers=None, metrics=DISABLED, on_progress=None):
+    """多进程哈希 to_hash 并把记录 / 失败写入 IndexWriter。
+
+    on_progress(done, total) 为 None 时用 tqdm 在终端显示进度。
+    """
+    results = iter_hashed_images(to_hash, workers)
+    if on_progress is None:
+        results = tqdm(results, total=len(to_hash), desc="正在处理图像")
+    for done, (path, entries, errors, timings) in enumerate(results, start=1):
+        metrics.add_timings(timings, path)
+        for entry in entries:
+            writer.add(entry)
+        for failed_path, error in errors:
+            writer.fail(failed_path, error)
+        if on_progress is not None:
+            on_progress(done, len(to_hash))
+
+def merge_into_index(output_json, entries):
+    """把新记录并入已有的列表式索引（同路径覆盖），返回总条数。"""
+    previous = load_previous_index(output_json)
+    if not previous and os.path.exists(output_json) and os.path.getsize(output_json) > 8:
+        raise ValueError(f"{output_json} 不是列表格式索引或无法读取，请先全量重建")
+    for entry in entries:
+        previous.pop(entry["path"], None)
+    writer = IndexWriter(output_json)
+    for entry in entries:
+        writer.add(entry)
+    return writer.finalize(previous.values())
+
+def finish_metrics(metrics, index_path, stats, on_log=print):
+    """结束计时并把指标写到 <索引>.metrics.json（cProfile 结果写 <索引>.prof）。"""
+    if not metrics.enabled:
+        return
+    metrics.stop(index_path + ".prof")
+    metrics.written(os.path.getsize(index_path))
+    metrics.extra["index"] = dict(stats)
+    metrics.write_json(index_path + METRICS_SUFFIX)
+    on_log(metrics.summary_text())
+
+def build_index_store(base_dir, db_path, workers=None, incremental=True, metrics=DISABLED, recursive=True,
+                      on_log=print, on_progress=None):
+    """构建 / 增量更新 SQLite 索引库：按批提交事务，构建期间可同时查询；中断后再次运行即从已提交处继续。
+
+    全量重建（incremental=False）时不先清空：新记录逐批覆盖同路径的旧记录，
+    全部提交后才删除本次没有写到的旧记录，读者在重建期间始终能查到完整索引。
+    """
+    metrics.start()
+    with IndexStore(db_path) as store:
+        t0 = time.perf_counter()
+        all_images = collect_images(base_dir, recursive)
+        metrics.add("scan", time.perf_counter() - t0)
+        previous = store.entries_by_path() if incremental else {}
+        reused, to_hash, stats = plan_refresh(all_images, previous)
+
+        # 删除已消失或需要重算的文件的旧记录（PDF / DOCX 连同内嵌图片）
+        keep = {container_of(e["path"]) for e in reused}
+        store.delete_files({container_of(p) for p in previous} - keep)
+        del previous, reused
+
+        on_log(f"🔍 共发现 {len(all_images)} 张候选图片，新增 {stats['added']}、变化 {stats['changed']}、"
+              f"删除 {stats['removed']}，开始计算 {len(to_hash)} 张的哈希...")
+
+        batch, failed = [], 0
+        results = iter_hashed_images(to_hash, workers)
+        if on_progress is None:
+            results = tqdm(results, total=len(to_hash), desc="正在处理图像")
+        for done, (path, entries, errors, timings) in enumerate(results, start=1):
+            if on_progress is not None:
+                on_progress(done, len(to_hash))
+            metrics.add_timings(timings, path)
+            batch.extend(entries)
+            failed += len(errors)
+            for failed_path, error in errors:
+                on_log(f"⚠️ {failed_path}: {error}")
+            if len(batch) >= STORE_BATCH:
+                t0 = time.perf_counter()
+                store.upsert(batch)
+                metrics.add("commit", time.perf_counter() - t0)
+                batch = []
+        t0 = time.perf_counter()
+        store.upsert(batch)
+        metrics.add("commit", time.perf_counter() - t0)
+        if not incremental:
+            # 全量重建：新记录都已提交，再删除已消失文件的旧记录
+            store.delete_files({container_of(p) for p in store.paths()} - set(to_hash))
+        count = stats["entries"] = store.image_count()
+    finish_metrics(metrics, db_path, stats, on_log)
+
+    on_log(f"✅ 索引库更新完成，共 {count} 张图像（失败 {failed}）")
+    on_log(f"📝 已保存至：{db_path}")
+    return stats
+
+def build_image_index(base_dir, output_json="image_index.json", workers=None, incremental=True, resume=False,
+                      metrics=DISABLED, recursive=True, on_log=print, on_progress=None):
+    """构建索引并返回统计（含 entries 总条数）；metrics 启用时把分阶段指标写到 <索引>.metrics.json。
+
+    output_json 以 .sqlite 结尾时写入 SQLite 索引库（见 index_store.py）。
+    on_log(msg) 接收日志（默认打印），on_progress(done, total) 接收哈希进度（默认 tqdm）。
+    """
+    if output_json.endswith(INDEX_STORE_EXT):
+        return build_index_store(base_dir, output_json, workers, incremental, metrics, recursive, on_log, on_progress)
+    metrics.start()
+    t0 = time.perf_counter()
+    # 收集所有待处理图片路径
+    all_images = collect_images(base_dir, recursive)
+    metrics.add("scan", time.perf_counter() - t0)
+
+    # 增量模式：只重新计算新增或变化的文件；旧索引逐条读取，只保留判断变化所需的字段
+    previous = load_previous_index(output_json, summary=True) if incremental else {}
+    reused, to_hash, stats = plan_refresh(all_images, previous)
+    keep = {e["path"] for e in reused}
+    del previous, reused
+
+    # 断点续跑：跳过检查点日志里已记录的路径
+    writer = IndexWriter(output_json, resume=resume)
+    if writer.done:
+        to_hash = [p for p in to_hash if p not in writer.done]
+        on_log(f"⏩ 从检查点续跑，跳过已记录的 {len(writer.done)} 张")
+
+    on_log(f"🔍 共发现 {len(all_images)} 张候选图片，新增 {stats['added']}、变化 {stats['changed']}、"
+          f"删除 {stats['removed']}，开始计算 {len(to_hash)} 张的哈希...")
+
+    hash_into_writer(to_hash, writer, workers, metrics, on_progress)
 
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(index, f, indent=2, ensure_ascii=False)
+    t0 = time.perf_counter()
+    reused = iter_index_entries(output_json, keep) if keep else ()
+    count = stats["entries"] = writer.finalize(reused)
+    metrics.add("finalize", time.perf_counter() - t0)
+    finish_metrics(metrics, output_json, stats, on_log)
 
-    print(f"\n✅ 索引构建完成，共索引图像：{len(index)} 张")
-    print(f"📝 已保存至：{output_json}")
+    on_log(f"✅ 索引构建完成，共索引图像：{count} 张")
+    if writer.failed:
+        on_log(f"⚠️ {writer.failed} 张处理失败，详见：{writer.failures_path}")
+    on_log(f"📝 已保存至：{output_json}")
+    return stats
 
 # 示例用法
 if __name__ == "__main__":
-    build_image_index("/Volumes/My Passport", "原图索引.json")
+    parser = argparse.ArgumentParser(description="构建原图哈希索引")
+    parser.add_argument("base_dir", nargs="?", default="/Volumes/My Passport")
+    parser.add_argument("output_json", nargs="?", default="原图索引.json")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument("--full", action="store_true", help="忽略已有索引，全量重建")
+    parser.add_argument("--resume", action="store_true", help="从上次中断的检查点继续")
+    parser.add_argument("--metrics", action="store_true", help="记录分阶段耗时，写入 <索引>.metrics.json")
+    parser.add_argument("--profile", action="store_true", help="同时用 cProfile 采样主进程（隐含 --metrics）")
+    args = parser.parse_args()
+    metrics = Metrics(profile=args.profile) if args.metrics or args.profile else DISABLED
+    build_image_index(args.base_dir, args.output_json, args.workers, not args.full, args.resume, metrics)
@@ -0,0 +1,91 @@
+import zipfile
+from io import BytesIO
+from pathlib import PurePosixPath
+
+# ========== 配置 ==========
+CONTAINER_EXTS = (".pdf", ".docx")
+EMBEDDED_IMG_EXT = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tif', '.tiff', '.webp'}
+VIRTUAL_SEP = "#"
+PDF_XREF_PREFIX = "xref="
+
+# 虚拟路径：
+#   report.pdf#xref=123               PDF 中 xref 为 123 的图片
+#   doc.docx#word/media/image4.png    DOCX 包内的图片成员
+
+
+def is_container(path):
+    return path.lower().endswith(CONTAINER_EXTS)
+
+
+def is_virtual(path):
+    container, _, member = str(path).rpartition(VIRTUAL_SEP)
+    return bool(container) and is_container(container) and bool(member)
+
+
+def split_virtual(path):
+    """虚拟路径 -> (容器文件路径, 成员)；普通路径返回 (path, None)。"""
+    if not is_virtual(path):
+        return path, None
+    container, _, member = str(path).rpartition(VIRTUAL_SEP)
+    return container, member
+
+
+def container_of(path):
+    return split_virtual(path)[0]
+
+
+# ========== 枚举 ==========
+
+def iter_embedded_images(path):
+    """逐个产出容器内的 (虚拟路径, 图片字节)，不写磁盘；同一 xref 只产出一次。"""
+    if path.lower().endswith(".pdf"):
+        import fitz  # PyMuPDF
+        doc = fitz.open(path)
+        try:
+            seen = set()
+            for page in doc:
+                for img in page.get_images(full=True):
+                    xref = img[0]
+                    if xref in seen:
+                        continue
+                    seen.add(xref)
+                    yield f"{path}{VIRTUAL_SEP}{PDF_XREF_PREFIX}{xref}", doc.extract_image(xref)["image"]
+        finally:
+            doc.close()
+    elif path.lower().endswith(".docx"):
+        with zipfile.ZipFile(path) as zf:
+            for name in zf.namelist():
+                if name.startswith("word/media/") and PurePosixPath(name).suffix.lower() in EMBEDDED_IMG_EXT:
+                    yield f"{path}{VIRTUAL_SEP}{name}", zf.read(name)
+
+
+# ========== 按需提取 ==========
+
+def read_virtual(path):
+    """读取虚拟路径对应的图片字节。"""
+    container, member = split_virtual(path)
+    if member is None:
+        with open(path, "rb") as f:
+            return f.read()
+    if container.lower().endswith(".pdf"):
+        import fitz  # PyMuPDF
+        with fitz.open(container) as doc:
+            return doc.extract_image(int(member[len(PDF_XREF_PREFIX):]))["image"]
+    with zipfile.ZipFile(container) as zf:
+        return zf.read(member)
+
+
+def open_virtual(path):
+    """以文件对象形式打开（普通路径或虚拟路径均可），供 PIL 使用。"""
+    if is_virtual(path):
+        return BytesIO(read_virtual(path))
+    return open(path, "rb")
+
+
+def materialize(path, dst):
+    """把虚拟路径指向的图片写到 dst，返回写入字节数。"""
+    data = read_virtual(path)
+    with open(dst, "wb") as f:
+        f.write(data)
+    return len(data)
+
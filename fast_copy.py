@@ -0,0 +1,215 @@
+import os
+import sys
+import time
+import shutil
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from embedded_images import is_virtual, materialize
+
+# ========== 配置 ==========
+COPY_MODES = ("copy", "hardlink", "symlink")
+COPY_WORKERS = 4  # 跨设备复制的并发数
+DIGEST_CHUNK = 1 << 20
+FICLONE = 0x40049409  # Linux ioctl：整文件 reflink
+
+
+# ========== 工具函数 ==========
+
+def file_digest(path):
+    """BLAKE2b 内容摘要。"""
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DIGEST_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def same_content(src, dst):
+    """目标已存在且大小、摘要都与源相同。"""
+    try:
+        if os.path.getsize(src) != os.path.getsize(dst):
+            return False
+    except OSError:
+        return False
+    return file_digest(src) == file_digest(dst)
+
+
+def _same_device(src, dst):
+    try:
+        return os.stat(src).st_dev == os.stat(os.path.dirname(os.path.abspath(dst))).st_dev
+    except OSError:
+        return False
+
+
+def _reflink(src, dst):
+    """写时复制克隆（Linux FICLONE / macOS clonefile），不支持时抛出 OSError。"""
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return
+    if sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL("libc.dylib", use_errno=True)
+        if os.path.exists(dst):
+            os.remove(dst)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            raise OSError(ctypes.get_errno(), "clonefile 失败")
+        return
+    raise OSError("当前平台不支持 reflink")
+
+
+def _copy_file_range(src, dst):
+    """内核内复制，数据不经过用户态；未能复制完整时抛出 OSError，由调用方退回普通复制。"""
+    with open(src, "rb") as fs, open(dst, "wb") as fd:
+        remaining = os.fstat(fs.fileno()).st_size
+        while remaining > 0:
+            n = os.copy_file_range(fs.fileno(), fd.fileno(), remaining)
+            if n == 0:
+                break
+            remaining -= n
+    if remaining > 0:
+        raise OSError(f"copy_file_range 提前结束，尚余 {remaining} 字节未复制")
+
+
+# ========== 目标文件名 ==========
+
+class NameTable:
+    """目标目录的内存文件名表：启动时列一次目录，之后分配名字不再逐个探测 exists()。"""
+
+    def __init__(self, dst_dir):
+        self.taken = set(os.listdir(dst_dir))
+
+    def claim(self, name):
+        if name not in self.taken:
+            self.taken.add(name)
+            return name
+        stem, suffix = os.path.splitext(name)
+        counter = 1
+        while f"{stem}_{counter}{suffix}" in self.taken:
+            counter += 1
+        name = f"{stem}_{counter}{suffix}"
+        self.taken.add(name)
+        return name
+
+
+# ========== 复制引擎 ==========
+
+class CopyEngine:
+    """可插拔的复制引擎，统计吞吐量。
+
+    mode="copy"：同一文件系统时依次尝试 reflink、copy_file_range，最后退回 shutil.copy2；
+    mode="hardlink" / "symlink"：输出为链接（硬链接跨设备时退回复制）。
+    skip_identical=True 时，目标已存在且大小与摘要相同则跳过。
+    """
+
+    def __init__(self, mode="copy", workers=COPY_WORKERS, skip_identical=True):
+        if mode not in COPY_MODES:
+            raise ValueError(f"未知复制模式: {mode}，可选 {COPY_MODES}")
+        self.mode = mode
+        self.workers = workers
+        self.skip_identical = skip_identical
+        self.methods = Counter()
+        self.bytes = 0
+        self.busy_seconds = 0.0
+        self._started = None
+        self._finished = None
+        self._lock = threading.Lock()
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._futures = []
+
+    def copy(self, src, dst):
+        """同步复制一个文件，返回实际使用的方式。"""
+        t0 = time.perf_counter()
+        size = 0
+        if is_virtual(src):
+            # PDF / DOCX 内嵌图片：命中后才按需提取
+            size = materialize(src, dst)
+            method = "extracted"
+        elif self.skip_identical and os.path.exists(dst) and same_content(src, dst):
+            method = "skipped"
+        else:
+            size = os.path.getsize(src)
+            method = self._link(src, dst) if self.mode != "copy" else None
+            if method is None:
+                method = self._copy(src, dst)
+        t1 = time.perf_counter()
+        with self._lock:
+            self._started = t0 if self._started is None else min(self._started, t0)
+            self._finished = t1 if self._finished is None else max(self._finished, t1)
+            self.busy_seconds += t1 - t0
+            self.methods[method] += 1
+            self.bytes += size
+        return method
+
+    def _link(self, src, dst):
+        if os.path.lexists(dst):
+            os.remove(dst)
+        try:
+            if self.mode == "hardlink":
+                os.link(src, dst)
+            else:
+                os.symlink(os.path.abspath(src), dst)
+            return self.mode
+        except OSError:
+            return None  # 跨设备等情况退回复制
+
+    def _copy(self, src, dst):
+        if _same_device(src, dst):
+            for method, fn in (("reflink", _reflink), ("copy_file_range", _copy_file_range)):
+                if method == "copy_file_range" and not hasattr(os, "copy_file_range"):
+                    continue
+                try:
+                    fn(src, dst)
+                    shutil.copystat(src, dst)
+                    return method
+                except OSError:
+                    continue
+        shutil.copy2(src, dst)
+        return "copy2"
+
+    # ---------- 并发复制 ----------
+
+    def submit(self, src, dst):
+        """提交到有界线程池异步复制，返回 Future。"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots.acquire()
+        fut = self._pool.submit(self.copy, src, dst)
+        fut.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(fut)
+        return fut
+
+    def wait(self):
+        """等待全部异步复制完成，返回失败的 [(Future, 异常)]。"""
+        failed = [(f, f.exception()) for f in self._futures if f.exception() is not None]
+        self._futures = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        return failed
+
+    # ---------- 统计 ----------
+
+    def summary(self):
+        wall = (self._finished - self._started) if self._started is not None else 0.0
+        mb = self.bytes / (1 << 20)
+        return {
+            "files": sum(self.methods.values()),
+            "skipped": self.methods.get("skipped", 0),
+            "megabytes": round(mb, 2),
+            "wall_seconds": round(wall, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+            "mb_per_second": round(mb / wall, 2) if wall > 0 else 0.0,
+            "methods": dict(self.methods),
+        }
+
+    def summary_text(self):
+        s = self.summary()
+        methods = "，".join(f"{k}={v}" for k, v in sorted(s["methods"].items())) or "无"
+        return (f"复制: {s['files']} 个文件（跳过相同 {s['skipped']} 个），{s['megabytes']} MB，"
+                f"耗时 {s['wall_seconds']}s，吞吐 {s['mb_per_second']} MB/s\n复制方式: {methods}\n")
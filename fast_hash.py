@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+
+from PIL import Image, ImageOps
+import imagehash
+import numpy as np
+import scipy.fftpack
+
+# ========== 配置 ==========
+# pHash 最终只用 32x32 灰度图。解码时保留短边至少 DECODE_MIN_SIDE 像素，
+# 再交给 imagehash 做抗锯齿缩放，使哈希与全尺寸解码基本一致。
+DECODE_MIN_SIDE = 256
+FINE_HASH_SIZE = 16  # 第二阶段重排用的高分辨率 pHash（16x16 = 256 位）
+HASH_EXTS = (".jpg", ".jpeg", ".png")
+EXIF_ORIENTATION = True  # 按 EXIF 方向标记摆正后再计算哈希（建索引与查询两侧一致）
+ORIENTATION_TAG = 0x0112
+# 写入每条索引记录的 algorithm 字段；哈希的计算方式变化时需同步修改，旧记录在增量构建时自动重算
+EXIF_ALGORITHM = "phash-exif"
+HASH_ALGORITHM = EXIF_ALGORITHM if EXIF_ORIENTATION else "phash"
+
+# 二面体群的 8 个变换：(是否转置, 转置后是否上下翻转, 转置后是否左右翻转)，名称与 PIL.Image.Transpose 一致
+DIHEDRAL = {
+    "identity": (False, False, False),
+    "mirror": (False, False, True),
+    "flip": (False, True, False),
+    "rotate_180": (False, True, True),
+    "transpose": (True, False, False),
+    "rotate_90": (True, True, False),
+    "rotate_270": (True, False, True),
+    "transverse": (True, True, True),
+}
+VARIANTS = list(DIHEDRAL)
+# EXIF 方向 -> 摆正所需的变换（与 ImageOps.exif_transpose 相同）
+EXIF_TRANSFORMS = {1: "identity", 2: "mirror", 3: "rotate_180", 4: "flip",
+                   5: "transpose", 6: "rotate_270", 7: "transverse", 8: "rotate_90"}
+
+
+# ========== 快速解码 ==========
+
+def open_for_hash(path):
+    """以降分辨率方式打开图片，返回 (原始尺寸, 灰度小图, EXIF 方向)。
+
+    JPEG 使用 draft 模式直接按 1/2、1/4、1/8 缩放解码为灰度；
+    其它格式解码后用 Image.reduce 做整数倍缩小。原始尺寸在缩放前记录。
+    小图不做旋转，方向在 DCT 系数上处理（见 transform_block）。
+    """
+    with Image.open(path) as img:
+        size = img.size
+        w, h = size
+        orientation = img.getexif().get(ORIENTATION_TAG, 1) if EXIF_ORIENTATION else 1
+        if img.format == "JPEG":
+            # draft 会选择不小于请求尺寸的最小缩放比例
+            scale = max(1, min(w, h) // DECODE_MIN_SIDE)
+            img.draft("L", (w // scale, h // scale))
+            small = img.convert("L")
+        else:
+            img.load()
+            factor = min(w, h) // DECODE_MIN_SIDE
+            if factor > 1 and img.mode in ("L", "RGB", "RGBA", "I", "F"):
+                img = img.reduce(factor)
+            small = img.convert("L")
+    return size, small, orientation
+
+
+# ========== 哈希与方向变换 ==========
+
+def dct_lowfreq(small, hash_size):
+    """与 imagehash.phash 相同的缩放与二维 DCT，返回左上角 hash_size x hash_size 的低频系数。"""
+    img_size = hash_size * 4
+    pixels = np.asarray(small.resize((img_size, img_size), imagehash.ANTIALIAS))
+    return scipy.fftpack.dct(scipy.fftpack.dct(pixels, axis=0), axis=1)[:hash_size, :hash_size]
+
+
+def transform_block(block, name):
+    """把图像的二面体变换作用在 DCT 系数上：转置对应系数转置，翻转对应奇数阶系数变号。
+
+    因此 8 种旋转 / 镜像都只需一次解码、一次 DCT。
+    """
+    transpose, flip_rows, flip_cols = DIHEDRAL[name]
+    if transpose:
+        block = block.T
+    sign = (-1.0) ** np.arange(block.shape[0])
+    if flip_rows:
+        block = block * sign[:, None]
+    if flip_cols:
+        block = block * sign[None, :]
+    return block
+
+
+def block_hash(block):
+    return imagehash.ImageHash(block > np.median(block))
+
+
+def hash_small(small, orientation, hash_size=8, fine_size=FINE_HASH_SIZE, variants=False):
+    """由灰度小图计算 (粗哈希, 细哈希)；variants=True 时各为按 VARIANTS 顺序的 8 个哈希列表。"""
+    upright = EXIF_TRANSFORMS.get(orientation, "identity")
+    coarse = transform_block(dct_lowfreq(small, hash_size), upright)
+    fine = transform_block(dct_lowfreq(small, fine_size), upright)
+    if not variants:
+        return block_hash(coarse), block_hash(fine)
+    return ([block_hash(transform_block(coarse, v)) for v in VARIANTS],
+            [block_hash(transform_block(fine, v)) for v in VARIANTS])
+
+
+def phash_file(path, hash_size=8):
+    """快速解码后计算 pHash，返回 (原始尺寸, ImageHash)。"""
+    size, small, orientation = open_for_hash(path)
+    return size, block_hash(transform_block(dct_lowfreq(small, hash_size), EXIF_TRANSFORMS.get(orientation, "identity")))
+
+
+def phash_file_cascade(path, hash_size=8, fine_size=FINE_HASH_SIZE, timings=None, variants=False):
+    """一次解码同时计算粗哈希与高分辨率哈希，返回 (原始尺寸, 粗哈希, 细哈希)。
+
+    variants=True 时粗、细哈希各为 8 种旋转 / 镜像的列表（VARIANTS 顺序，第一个即原方向）。
+    给出 timings 字典时，把解码与哈希耗时（秒）写入其 "decode" / "hash" 键。
+    """
+    if timings is None:
+        size, small, orientation = open_for_hash(path)
+        return (size,) + hash_small(small, orientation, hash_size, fine_size, variants)
+    t0 = time.perf_counter()
+    size, small, orientation = open_for_hash(path)
+    t1 = time.perf_counter()
+    coarse, fine = hash_small(small, orientation, hash_size, fine_size, variants)
+    timings["decode"] = t1 - t0
+    timings["hash"] = time.perf_counter() - t1
+    return size, coarse, fine
+
+
+def phash_file_full(path, hash_size=8, exif=EXIF_ORIENTATION):
+    """全尺寸 RGB 解码路径，仅用于漂移校验；exif=False 即原有路径（不按 EXIF 方向摆正）。"""
+    with Image.open(path) as img:
+        if exif:
+            img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB")
+        return img.size, imagehash.phash(img, hash_size=hash_size)
+
+
+# ========== 漂移校验 ==========
+
+def _drift_stats(dists, threshold):
+    n = len(dists)
+    return {
+        "mean": sum(dists) / n if n else 0.0,
+        "max": max(dists) if n else 0,
+        "exact": sum(1 for d in dists if d == 0),
+        "within_threshold": sum(1 for d in dists if d <= threshold),
+    }
+
+
+def measure_drift(paths, hash_size=8, threshold=5):
+    """比较快速路径与全尺寸路径的哈希距离，返回统计字典。
+
+    顶层统计对比同样按 EXIF 摆正的全尺寸路径（只反映解码方式带来的漂移）；
+    "baseline" 对比原有的不摆正路径，带方向标记的图片会计入差异，反映与旧索引的差距。
+    """
+    dists, baseline, failed = [], [], 0
+    for path in paths:
+        try:
+            _, fast = phash_file(path, hash_size)
+            _, full = phash_file_full(path, hash_size)
+            _, old = phash_file_full(path, hash_size, exif=False) if EXIF_ORIENTATION else (None, full)
+        except Exception:
+            failed += 1
+            continue
+        dists.append(fast - full)
+        baseline.append(fast - old)
+    stats = {"count": len(dists), "failed": failed}
+    stats.update(_drift_stats(dists, threshold))
+    stats["baseline"] = _drift_stats(baseline, threshold)
+    return stats
+
+
+if __name__ == "__main__":
+    # 用法：python fast_hash.py <图片目录> [阈值]
+    base = sys.argv[1]
+    threshold = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    files = []
+    for root, dirs, names in os.walk(base):
+        files.extend(os.path.join(root, n) for n in names if n.lower().endswith(HASH_EXTS))
+    stats = measure_drift(files, threshold=threshold)
+    print(f"共校验 {stats['count']} 张（失败 {stats['failed']}）：完全一致 {stats['exact']}，"
+          f"阈值 {threshold} 内 {stats['within_threshold']}，平均漂移 {stats['mean']:.2f}，最大 {stats['max']}")
+    old = stats["baseline"]
+    print(f"对比原有路径（不按 EXIF 摆正）：完全一致 {old['exact']}，阈值 {threshold} 内 {old['within_threshold']}，"
+          f"平均漂移 {old['mean']:.2f}，最大 {old['max']}")
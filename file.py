@@ -1,17 +1,14 @@
-import os
-import shutil
-import json
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-from PIL import Image
 import imagehash
-import pickle
-from concurrent.futures import ThreadPoolExecutor
-
-# ========== 配置项 ==========
-HASH_SIZE = 8
-SIMILARITY_THRESHOLD = 5  # 阈值：距离 ≤ 5 视为匹配
+import match_engine
+from match_engine import SIMILARITY_THRESHOLD
+from binary_index import BINARY_INDEX_EXT
+from index_store import INDEX_STORE_EXT
+from ui_events import EventBus
+from metrics import Metrics, DISABLED
+from match_client import start_server, ServerError
 
 # ========== UI 更新辅助 ==========
 class UiUpdater:
@@ -22,202 +19,75 @@ class UiUpdater:
     def call(self, fn, *args, **kwargs):
         self.widget.after(0, lambda: fn(*args, **kwargs))
 
-# ========== 主功能函数 ==========
-def load_hash_index(index_path, log_widget, progressbar, convert_label):
-    log_upd = UiUpdater(log_widget)
-    bar_upd = UiUpdater(progressbar)
-    lbl_upd = UiUpdater(convert_label)
-
-    pkl_path = index_path + ".pkl"
-    log_upd.call(log_widget.insert, tk.END, f"[DEBUG] pkl_path={pkl_path}，存在={os.path.exists(pkl_path)}\n")
-    log_upd.call(log_widget.see, tk.END)
-
-    if os.path.exists(pkl_path):
-        log_upd.call(log_widget.insert, tk.END, "检测到 .pkl 缓存，开始快速加载索引…\n")
-        log_upd.call(log_widget.see, tk.END)
-        try:
-            with open(pkl_path, 'rb') as f:
-                hash_index = pickle.load(f)
-        except Exception as e:
-            log_upd.call(log_widget.insert, tk.END, f"[ERROR] pickle.load 失败: {e}\n")
-            log_upd.call(log_widget.see, tk.END)
-            hash_index = {}
-        bar_upd.call(progressbar.config, value=100)
-        lbl_upd.call(convert_label.config, text=f"已转换 {len(hash_index)}/{len(hash_index)}")
-        log_upd.call(log_widget.insert, tk.END, f"快速加载完成，共 {len(hash_index)} 条记录。\n\n")
-        log_upd.call(log_widget.see, tk.END)
-        return hash_index
-
-    log_upd.call(log_widget.insert, tk.END, "未检测到 .pkl，开始从 JSON 加载索引…\n")
-    log_upd.call(log_widget.see, tk.END)
-    try:
-        with open(index_path, 'r') as jf:
-            raw_data = json.load(jf)
-            if isinstance(raw_data, list):
-                raw = {item['phash']: item['path'] for item in raw_data if 'phash' in item and 'path' in item}
-            else:
-                raw = raw_data
-    except Exception as e:
-        log_upd.call(log_widget.insert, tk.END, f"[ERROR] JSON 加载失败: {e}\n")
-        log_upd.call(log_widget.see, tk.END)
-        return {}
-
-    total = len(raw)
-
-    log_upd.call(log_widget.insert, tk.END, "[DEBUG] JSON 索引前 5 条键：\n")
-    for k in list(raw.keys())[:5]:
-        log_upd.call(log_widget.insert, tk.END, f"  {k}\n")
-    log_upd.call(log_widget.see, tk.END)
-
-    log_upd.call(log_widget.insert, tk.END, f"共 {total} 条哈希记录，逐条转换中：\n")
-    log_upd.call(log_widget.see, tk.END)
-    lbl_upd.call(convert_label.config, text=f"已转换 0/{total}")
-
-    hash_index = {}
-
-    def convert_item(item):
-        hstr, path = item
-        try:
-            hobj = imagehash.hex_to_hash(hstr)
-            return hobj, path
-        except Exception as e:
-            return None, (hstr, str(e))
-
-    try:
-        with ThreadPoolExecutor() as exe:
-            for i, result in enumerate(exe.map(convert_item, raw.items()), start=1):
-                hobj, path = result
-                if hobj is None:
-                    log_upd.call(log_widget.insert, tk.END, f"[ERROR] 转换第{i}条失败: {path}\n")
-                else:
-                    hash_index[hobj] = path
-
-                pct = int(i / total * 100)
-                bar_upd.call(progressbar.config, value=pct)
-                lbl_upd.call(convert_label.config, text=f"已转换 {i}/{total}")
-                if i % max(1, total // 10) == 0 or i == total:
-                    log_upd.call(log_widget.insert, tk.END, f"  已转换 {i}/{total} ({pct}%)\n")
-                log_upd.call(log_widget.see, tk.END)
-
-    except Exception as e:
-        log_upd.call(log_widget.insert, tk.END, f"[ERROR] 转换过程异常: {e}\n")
-
-    if not hash_index:
-        log_upd.call(log_widget.insert, tk.END, "[ERROR] 哈希索引为空，检查 JSON 文件内容。\n")
-    else:
-        log_upd.call(log_widget.insert, tk.END, "[DEBUG] 成功构建哈希索引，前 3 条：\n")
-        for h, p in list(hash_index.items())[:3]:
-            log_upd.call(log_widget.insert, tk.END, f"  {h} → {p}\n")
-
-    log_upd.call(log_widget.insert, tk.END, "哈希转换完成，开始保存 .pkl 缓存…\n")
-    try:
-        with open(pkl_path, 'wb') as pf:
-            pickle.dump(hash_index, pf)
-        log_upd.call(log_widget.insert, tk.END, "[DEBUG] 已成功保存为 .pkl 缓存。\n")
-    except Exception as e:
-        log_upd.call(log_widget.insert, tk.END, f"[ERROR] 保存 .pkl 失败: {e}\n")
-    log_upd.call(log_widget.see, tk.END)
-
-    return hash_index
+def widget_events(log_widget, progressbar, convert_label, level="INFO"):
+    """建立与控件绑定的事件总线：日志合并插入，进度与标签只刷新最新值。"""
+    events = EventBus(log_widget, level=level)
 
-def find_best_match(low_hash, hash_index, log_widget=None):
-    assert isinstance(low_hash, imagehash.ImageHash), f"low_hash 类型错误: {type(low_hash)}"
-    
-    min_dist, best = float('inf'), None
-    for stored_hash, full_path in hash_index.items():
-        if not isinstance(stored_hash, imagehash.ImageHash):
-            continue  # 跳过非哈希对象
-        d = stored_hash - low_hash
-        if d < min_dist:
-            min_dist, best = d, full_path
-            if d == 0:
-                break
-
-    if log_widget:
-        log_widget.insert(tk.END, f"[DEBUG] 当前比对图与最佳匹配的距离: {min_dist}\n")
+    def write_lines(lines):
+        log_widget.insert(tk.END, "\n".join(lines) + "\n")
         log_widget.see(tk.END)
-    print(f"[DEBUG] 当前比对图与最佳匹配的距离: {min_dist}")
 
-    return best if min_dist <= SIMILARITY_THRESHOLD else None
+    events.add_log_sink(write_lines)
+    events.on("progress", lambda value: progressbar.config(value=value))
+    events.on("convert", lambda text: convert_label.config(text=text))
+    return events
 
+# ========== 主功能函数（界面适配，核心逻辑见 match_engine.py） ==========
+def load_hash_index(index_path, log_widget, progressbar, convert_label, events=None):
+    if events is None:
+        events = widget_events(log_widget, progressbar, convert_label)
+        UiUpdater(log_widget).call(events.start)
 
-    if log_widget:
-        log_widget.insert(tk.END, f"[DEBUG] 当前比对图与最佳匹配的距离: {min_dist}\n")
-        log_widget.see(tk.END)
-    print(f"[DEBUG] 当前比对图与最佳匹配的距离: {min_dist}")
-
-    return best if min_dist <= SIMILARITY_THRESHOLD else None
-
-def process_images(index_path, input_folder, output_folder, log_widget, progressbar, convert_label):
-    log_upd = UiUpdater(log_widget)
-    log_widget.insert(tk.END, "步骤 1/2：加载并转换索引\n")
-    log_widget.see(tk.END)
-    hash_index = load_hash_index(index_path, log_widget, progressbar, convert_label)
-
-    UiUpdater(progressbar).call(progressbar.config, value=0)
-    UiUpdater(convert_label).call(convert_label.config, text="")
-
-    log_widget.insert(tk.END, "步骤 2/2：开始图片匹配\n")
-    log_widget.see(tk.END)
-    unmatched_dir = os.path.join(output_folder, "未找到原图")
-    os.makedirs(unmatched_dir, exist_ok=True)
-    os.makedirs(output_folder, exist_ok=True)
-
-    files = [f for f in os.listdir(input_folder) if f.lower().endswith(('.jpg','.jpeg','.png'))]
-    total = len(files)
-    log_widget.insert(tk.END, f"发现 {total} 张图片待匹配\n")
-    log_widget.see(tk.END)
-
-    matched, unmatched = 0, 0
-    for i, fname in enumerate(files, start=1):
-        pct = int(i / total * 100)
-        UiUpdater(progressbar).call(progressbar.config, value=pct)
-        log_widget.insert(tk.END, f"  处理 {i}/{total}：{fname} … ")
-        log_widget.see(tk.END)
-        path = os.path.join(input_folder, fname)
-        try:
-            img = Image.open(path)
-            img = img.convert('RGB')  # 防止透明图像影响哈希
-            width, height = img.size
-            log_widget.insert(tk.END, f"[DEBUG] 图像尺寸: {width}x{height}\n")
-            log_widget.see(tk.END)
-
-            low_hash = imagehash.phash(img, hash_size=HASH_SIZE)
-            log_widget.insert(tk.END, f"[DEBUG] 当前图片哈希: {str(low_hash)}\n")
-            log_widget.see(tk.END)
-
-            match = find_best_match(low_hash, hash_index, log_widget)
-            if match:
-                shutil.copy2(match, os.path.join(output_folder, fname))
-                matched += 1
-                log_widget.insert(tk.END, "匹配成功\n")
-            else:
-                shutil.copy2(path, os.path.join(unmatched_dir, fname))
-                unmatched += 1
-                log_widget.insert(tk.END, "未匹配，已复制低清图\n")
-        except Exception as e:
-            log_widget.insert(tk.END, f"[ERROR] 处理失败：{e}\n")
-            unmatched += 1
-        log_widget.see(tk.END)
+    def on_progress(done, total):
+        events.emit("progress", int(done / total * 100) if total else 100)
+        events.emit("convert", f"已转换 {done}/{total}")
 
-    log_widget.insert(tk.END, f"\n完成：匹配 {matched} 张，未匹配 {unmatched} 张。\n")
-    log_widget.see(tk.END)
-    try:
-        with open(os.path.join(output_folder, "整理日志.txt"), 'w', encoding='utf-8') as lf:
-            lf.write(f"匹配: {matched}\n未匹: {unmatched}\n")
-        log_widget.insert(tk.END, "整理日志已保存。\n")
-    except Exception as e:
-        log_upd.call(log_widget.insert, tk.END, f"[ERROR] 日志保存失败：{e}\n")
-    log_widget.see(tk.END)
+    # 常驻匹配服务在运行时直接查询，不再在界面进程里加载索引
+    return match_engine.open_index(index_path, events.log, on_progress)
 
-    UiUpdater(log_widget).call(lambda: messagebox.showinfo("完成", f"共 {len(files)} 张，匹配 {matched} 张，未匹配 {unmatched} 张。"))
+def find_best_match(low_hash, hash_index, log_widget=None):
+    assert isinstance(low_hash, imagehash.ImageHash), f"low_hash 类型错误: {type(low_hash)}"
+
+    min_dist, best = match_engine.find_best_match(low_hash, hash_index, SIMILARITY_THRESHOLD)
+    if log_widget:
+        UiUpdater(log_widget).call(log_widget.insert, tk.END, f"[DEBUG] 当前比对图与最佳匹配的距离: {min_dist}\n")
+    return best
+
+def process_images(index_path, input_folder, output_folder, log_widget, progressbar, convert_label, events=None,
+                   metrics=DISABLED, on_metrics=None, any_orientation=False):
+    """on_metrics(text) 在主线程接收指标汇总（仅 metrics 启用时）；any_orientation 见 match_engine.match_folder。"""
+    if events is None:
+        events = widget_events(log_widget, progressbar, convert_label)
+        UiUpdater(log_widget).call(events.start)
+    events.log("步骤 1/2：加载并转换索引")
+    hash_index = load_hash_index(index_path, log_widget, progressbar, convert_label, events)
+
+    events.emit("progress", 0)
+    events.emit("convert", "")
+
+    events.log("步骤 2/2：开始图片匹配")
+    summary = match_engine.match_folder(
+        hash_index, input_folder, output_folder, SIMILARITY_THRESHOLD,
+        on_log=events.log,
+        on_progress=lambda done, total: events.emit("progress", int(done / total * 100)),
+        debug=events.enabled("DEBUG"),
+        metrics=metrics,
+        any_orientation=any_orientation,
+    )
+    if metrics.enabled and on_metrics:
+        text = metrics.summary_text()
+        events.call(lambda: on_metrics(text))
+
+    events.call(lambda: messagebox.showinfo(
+        "完成", f"共 {summary['total']} 张，匹配 {summary['matched']} 张"
+              f"（逐字节相同 {summary['exact']['hits']} 张），未匹配 {summary['unmatched']} 张。"))
 
 # ========== GUI ==========
 class App:
     def __init__(self, root):
         self.root = root
         root.title("图片高清原图匹配工具")
-        root.geometry("720x600")
+        root.geometry("720x760")
 
         self.index_path = tk.StringVar()
         self.input_folder = tk.StringVar()
@@ -226,7 +96,7 @@ class App:
         frame = ttk.Frame(root, padding=10)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        ttk.Label(frame, text="原图哈希索引 JSON：").pack(anchor="w")
+        ttk.Label(frame, text="原图哈希索引（JSON / .phidx / .sqlite）：").pack(anchor="w")
         ttk.Entry(frame, textvariable=self.index_path, width=80).pack()
         ttk.Button(frame, text="选择索引文件", command=self.select_index).pack(pady=(0,10))
 
@@ -248,10 +118,32 @@ class App:
         self.progressbar = ttk.Progressbar(frame, orient="horizontal", length=600, mode="determinate")
         self.progressbar.pack(pady=(5, 10))
 
-        ttk.Button(frame, text="开始匹配", command=self.start_process).pack()
+        self.debug_log = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="显示调试日志", variable=self.debug_log).pack(anchor="w")
+
+        self.any_orientation = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="容忍旋转 / 镜像（8 种方向）", variable=self.any_orientation).pack(anchor="w")
+
+        self.record_metrics = tk.BooleanVar(value=False)
+        ttk.Checkbutton(frame, text="记录性能指标（写入整理指标.json）", variable=self.record_metrics).pack(anchor="w")
+
+        metrics_frame = ttk.LabelFrame(frame, text="性能指标")
+        metrics_frame.pack(fill=tk.X, pady=(5, 5))
+        self.metrics_text = tk.Text(metrics_frame, height=7, font=("Courier", 10))
+        self.metrics_text.pack(fill=tk.X)
+
+        buttons = ttk.Frame(frame)
+        buttons.pack()
+        ttk.Button(buttons, text="开始匹配", command=self.start_process).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="启动常驻匹配服务", command=self.start_server).pack(side=tk.LEFT, padx=5)
+
+        # 工作线程只向事件总线投递，界面按固定节拍刷新
+        self.events = widget_events(self.log_widget, self.progressbar, self.convert_label)
+        self.events.start()
 
     def select_index(self):
-        path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json")])
+        path = filedialog.askopenfilename(filetypes=[("JSON files", "*.json"), ("Binary index", "*" + BINARY_INDEX_EXT),
+                                                     ("SQLite index", "*" + INDEX_STORE_EXT)])
         if path:
             self.index_path.set(path)
 
@@ -272,6 +164,9 @@ class App:
         self.log_widget.delete("1.0", tk.END)
         self.progressbar["value"] = 0
         self.convert_label.config(text="已转换 0/0")
+        self.events.set_level("DEBUG" if self.debug_log.get() else "INFO")
+        self.metrics_text.delete("1.0", tk.END)
+        metrics = Metrics() if self.record_metrics.get() else DISABLED
         threading.Thread(
             target=process_images,
             args=(
@@ -280,11 +175,42 @@ class App:
                 self.output_folder.get(),
                 self.log_widget,
                 self.progressbar,
-                self.convert_label
+                self.convert_label,
+                self.events,
+                metrics,
+                self.show_metrics,
+                self.any_orientation.get()
             ),
             daemon=True
         ).start()
 
+    def start_server(self):
+        """在后台启动常驻匹配服务，之后每次匹配都直接查询，不再加载索引。"""
+        index_path = self.index_path.get()
+        if not index_path:
+            messagebox.showerror("错误", "请先选择索引文件。")
+            return
+        self.events.log(f"正在启动常驻匹配服务：{index_path}")
+
+        def worker():
+            try:
+                state, detail = start_server(index_path)
+            except (ServerError, OSError) as e:
+                self.events.log(f"[ERROR] 常驻匹配服务启动失败，匹配时将在本进程加载索引：{e}")
+                return
+            if state == "running":
+                self.events.log(f"常驻匹配服务已在运行：{detail}")
+            elif state == "started":
+                self.events.log(f"常驻匹配服务已就绪：{detail}")
+            else:
+                self.events.log(f"常驻匹配服务仍在加载索引（加载完成后自动使用），日志：{detail}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def show_metrics(self, text):
+        self.metrics_text.delete("1.0", tk.END)
+        self.metrics_text.insert(tk.END, text)
+
 if __name__ == "__main__":
     root = tk.Tk()
     app = App(root)
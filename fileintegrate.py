@@ -1,10 +1,7 @@
 import os
-import shutil
-import zipfile
-import rarfile
 import fitz  # PyMuPDF
 import docx
-from pathlib import Path
+from pathlib import Path, PurePath
 from PIL import Image
 from io import BytesIO
 import tkinter as tk
@@ -13,6 +10,9 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from PIL import Image
 import imagehash
+from fast_copy import CopyEngine, NameTable, COPY_WORKERS
+from archive_ingest import DigestStore, DIGEST_STORE_NAME, ingest_archive
+from ui_events import EventBus
 
 
 # ========== 配置 ==========
@@ -21,6 +21,8 @@ ALLOWED_DOCX = {'.docx'}
 ALLOWED_PDF = {'.pdf'}
 ALLOWED_ZIP = {'.zip'}
 ALLOWED_RAR = {'.rar'}
+RAW_PDF_IMAGE_EXT = {'jpeg', 'jpg', 'png', 'jpx', 'jp2', 'bmp', 'tiff', 'tif', 'gif'}  # 可直接落盘的格式
+PDF_PARALLEL_MIN_PAGES = 20  # 页数达到该值才启用进程池
 
 # ========== 工具函数 ==========
 
@@ -30,17 +32,6 @@ def get_target_year(path):
             return f"{part[:4]}年年报"
     return None
 
-def safe_copy(src, dst_dir):
-    dst_dir.mkdir(parents=True, exist_ok=True)
-    base_name = Path(src).name
-    dst_path = dst_dir / base_name
-    counter = 1
-    while dst_path.exists():
-        dst_path = dst_dir / f"{dst_path.stem}_{counter}{dst_path.suffix}"
-        counter += 1
-    shutil.copy2(src, dst_path)
-    return dst_path.name
-
 def extract_images_from_docx(docx_path, out_dir):
     doc = docx.Document(docx_path)
     rels = doc.part._rels
@@ -55,50 +46,81 @@ def extract_images_from_docx(docx_path, out_dir):
             count += 1
     return count
 
-def extract_images_from_pdf(pdf_path, out_dir):
+def _extract_pdf_xrefs(pdf_path, out_dir, jobs):
+    """在（子）进程中按 xref 提取图片，原始字节直接落盘。返回 (提取数, 写入字节, 失败数)。"""
     doc = fitz.open(pdf_path)
-    count = 0
-    for page_index in range(len(doc)):
-        page = doc[page_index]
-        images = page.get_images(full=True)
-        for img_index, img in enumerate(images):
-            xref = img[0]
+    extracted, written, failed = 0, 0, 0
+    for xref, page_index, img_index in jobs:
+        try:
             base_image = doc.extract_image(xref)
             img_bytes = base_image["image"]
-            img_ext = base_image["ext"]
-            img = Image.open(BytesIO(img_bytes))
-            out_path = out_dir / f"img_from_pdf_{page_index}_{img_index}.{img_ext}"
-            img.save(out_path)
-            count += 1
-    return count
+            img_ext = base_image["ext"].lower()
+            if img_ext not in RAW_PDF_IMAGE_EXT:
+                # 非常规格式（如 JBIG2）才解码转存为 PNG
+                img = Image.open(BytesIO(img_bytes))
+                buf = BytesIO()
+                img.save(buf, format="PNG")
+                img_bytes, img_ext = buf.getvalue(), "png"
+            out_path = Path(out_dir) / f"img_from_pdf_{page_index}_{img_index}.{img_ext}"
+            with open(out_path, "wb") as f:
+                f.write(img_bytes)
+            extracted += 1
+            written += len(img_bytes)
+        except Exception:
+            failed += 1
+    doc.close()
+    return extracted, written, failed
+
+def extract_pdf_images(pdf_path, out_dir, workers=None):
+    """提取 PDF 中的全部图片：每个 xref 只提取一次，不重新编码，大文档按页分给进程池。
+
+    返回报告字典：extracted / skipped_duplicate / bytes_written / failed。
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # 先只列出引用关系（不解码），按首次出现的页码去重
+    doc = fitz.open(pdf_path)
+    page_count = len(doc)
+    jobs, seen, duplicates = [], set(), 0
+    for page_index in range(page_count):
+        for img_index, img in enumerate(doc[page_index].get_images(full=True)):
+            xref = img[0]
+            if xref in seen:
+                duplicates += 1
+                continue
+            seen.add(xref)
+            jobs.append((xref, page_index, img_index))
+    doc.close()
+
+    workers = workers or os.cpu_count() or 1
+    if page_count < PDF_PARALLEL_MIN_PAGES or workers <= 1 or len(jobs) < 2:
+        results = [_extract_pdf_xrefs(str(pdf_path), str(out_dir), jobs)]
+    else:
+        # 按页顺序切块，每个进程各自打开文档
+        size = max(1, -(-len(jobs) // workers))
+        chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+        with ProcessPoolExecutor(max_workers=workers) as exe:
+            results = list(exe.map(_extract_pdf_xrefs, [str(pdf_path)] * len(chunks),
+                                   [str(out_dir)] * len(chunks), chunks))
+
+    return {
+        "extracted": sum(r[0] for r in results),
+        "skipped_duplicate": duplicates,
+        "bytes_written": sum(r[1] for r in results),
+        "failed": sum(r[2] for r in results),
+    }
 
-def extract_from_zip(zip_path, out_dir):
-    count = 0
-    with zipfile.ZipFile(zip_path, 'r') as zf:
-        for f in zf.namelist():
-            if Path(f).suffix.lower() in ALLOWED_IMG_EXT:
-                target_path = out_dir / Path(f).name
-                target_path.parent.mkdir(parents=True, exist_ok=True)
-                with zf.open(f) as source, open(target_path, 'wb') as target:
-                    shutil.copyfileobj(source, target)
-                count += 1
-    return count
+def extract_images_from_pdf(pdf_path, out_dir):
+    return extract_pdf_images(pdf_path, out_dir)["extracted"]
 
-def extract_from_rar(rar_path, out_dir):
-    count = 0
-    with rarfile.RarFile(rar_path) as rf:
-        for f in rf.namelist():
-            if Path(f).suffix.lower() in ALLOWED_IMG_EXT:
-                rf.extract(f, out_dir)
-                count += 1
-    return count
+def extract_from_zip(zip_path, out_dir, store=None, names=None):
+    return ingest_archive(zip_path, out_dir, store, names)["extracted"]
 
-def log_operation(log_path, content, file_path=None):
-    with open(log_path, 'a', encoding='utf-8') as f:
-        if file_path:
-            file_stat = file_path.stat()
-            content += f" | 创建时间: {file_stat.st_ctime} | 修改时间: {file_stat.st_mtime}"
-        f.write(content + '\n')
+def extract_from_rar(rar_path, out_dir, store=None, names=None):
+    return ingest_archive(rar_path, out_dir, store, names)["extracted"]
 
 def extract_images_from_docx_and_pdf(source_file, target_folder, status_callback):
     """从 docx 或 pdf 文件中提取图片并保存到目标文件夹的子文件夹"""
@@ -126,22 +148,10 @@ def extract_images_from_docx_and_pdf(source_file, target_folder, status_callback
             status_callback(f"[DOCX] 提取了 {count} 张图片 <- {source_file}")
 
         elif source_file.suffix.lower() == '.pdf':
-            # 处理 pdf 文件
-            doc = fitz.open(source_file)
-            count = 0
-            for page_index in range(len(doc)):
-                page = doc[page_index]
-                images = page.get_images(full=True)
-                for img_index, img in enumerate(images):
-                    xref = img[0]
-                    base_image = doc.extract_image(xref)
-                    img_bytes = base_image["image"]
-                    img_ext = base_image["ext"]
-                    img = Image.open(BytesIO(img_bytes))
-                    out_path = sub_folder / f"img_from_pdf_{page_index}_{img_index}.{img_ext}"
-                    img.save(out_path, quality=95)  # 提高保存质量
-                    count += 1
-            status_callback(f"[PDF] 提取了 {count} 张图片 <- {source_file}")
+            # 处理 pdf 文件：原始字节直接写出，重复引用的图片只提取一次
+            report = extract_pdf_images(source_file, sub_folder)
+            status_callback(f"[PDF] 提取了 {report['extracted']} 张图片（跳过重复 {report['skipped_duplicate']} 处，"
+                            f"写入 {report['bytes_written'] / (1 << 20):.1f} MB，失败 {report['failed']}）<- {source_file}")
 
         else:
             status_callback(f"[ERROR] 不支持的文件类型: {source_file.suffix}")
@@ -160,62 +170,70 @@ def is_similar(img1_path, img2_path, threshold=5):
         return False
 
 def find_hd_images(low_res_dir, output_dir, index_json, logger=None, threshold=8):
-    import json
-    import imagehash
-    from PIL import Image
-
-    with open(index_json, "r", encoding="utf-8") as f:
-        index = json.load(f)
+    from hash_search import HammingIndex, ShardedIndex
+    from index_store import StoreIndex
+    from match_client import RemoteIndex
+    from match_engine import open_index, hash_query, FINE_THRESHOLD, HASH_SIZE
+    from query_cache import QueryHashCache
 
     log = []
+    # 索引只解析一次，之后每张低清图只查阈值内的候选
+    index = open_index(index_json, on_log=logger or (lambda msg: None))
+    if not isinstance(index, (HammingIndex, ShardedIndex, StoreIndex, RemoteIndex)):
+        msg = f"❌ 索引无法加载或格式不支持：{index_json}"
+        if logger: logger(msg)
+        return
+
     not_found_dir = os.path.join(output_dir, "未找到原图")
     os.makedirs(not_found_dir, exist_ok=True)
 
     low_images = [f for f in os.listdir(low_res_dir) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-
-    for img_name in low_images:
-        low_img_path = os.path.join(low_res_dir, img_name)
-        try:
-            low_img = Image.open(low_img_path).convert("RGB")
-            low_hash = imagehash.phash(low_img)
-        except Exception as e:
-            msg = f"❌ 无法读取低清图 {img_name}: {e}"
-            log.append(msg)
-            if logger: logger(msg)
-            continue
-
-        best_match_path = None
-        best_match_size = 0
-
-        if logger: logger(f"🔍 正在比对：{img_name}")
-
-        for entry in index:
+    copier = CopyEngine()
+    # 与 file.py 共用低清图哈希缓存，重复运行只做索引查询
+    cache = QueryHashCache(low_res_dir, HASH_SIZE)
+    try:
+        for img_name in low_images:
+            low_img_path = os.path.join(low_res_dir, img_name)
             try:
-                entry_hash = imagehash.hex_to_hash(entry["phash"])
-                distance = low_hash - entry_hash
-                if distance <= threshold:
-                    size = entry["size"][0] * entry["size"][1]
-                    if size > best_match_size:
-                        best_match_path = entry["path"]
-                        best_match_size = size
-            except:
+                _, low_hash, fine_hash = hash_query(low_img_path, cache=cache)
+            except Exception as e:
+                msg = f"❌ 无法读取低清图 {img_name}: {e}"
+                log.append(msg)
+                if logger: logger(msg)
                 continue
 
-        if best_match_path:
-            shutil.copy2(best_match_path, os.path.join(output_dir, img_name))
-            msg = f"{img_name} ✅ 匹配成功：{best_match_path}"
-        else:
-            shutil.copy2(low_img_path, os.path.join(not_found_dir, img_name))
-            msg = f"{img_name} ❌ 未找到匹配原图"
+            if logger: logger(f"🔍 正在比对：{img_name}")
+
+            # 阈值内分辨率最大的原图
+            best = index.largest_within(low_hash, threshold, fine_hash, FINE_THRESHOLD)
+            best_match_path = best[2] if best else None
 
+            # 复制交给有界线程池，比对不必等待磁盘
+            if best_match_path:
+                copier.submit(best_match_path, os.path.join(output_dir, img_name))
+                msg = f"{img_name} ✅ 匹配成功：{best_match_path}"
+            else:
+                copier.submit(low_img_path, os.path.join(not_found_dir, img_name))
+                msg = f"{img_name} ❌ 未找到匹配原图"
+
+            log.append(msg)
+            if logger: logger(msg)
+    finally:
+        cache.close()
+    for fut, e in copier.wait():
+        msg = f"❌ 复制失败：{e}"
         log.append(msg)
         if logger: logger(msg)
+    stats = cache.stats()
+    if stats["enabled"]:
+        log.append(f"哈希缓存：命中 {stats['hits']}，新计算 {stats['misses']}")
 
     # 写日志
     log_path = os.path.join(output_dir, "matching_log.txt")
     with open(log_path, 'w', encoding='utf-8') as f:
         for line in log:
             f.write(line + "\n")
+        f.write(copier.summary_text())
 
 
 
@@ -227,62 +245,141 @@ ALLOWED_COMPRESSED = {'.zip', '.rar'}
 
 import re
 
-def process_photos(source_root, target_root, status_callback):
-    source_root = Path(source_root)
-    target_root = Path(target_root)
-    total_files = 0
+LOG_BUFFER = 1 << 16  # 年份日志的写缓冲大小
+
 
-    for root, dirs, files in os.walk(source_root):
-        root_path = Path(root)
-        year = get_target_year(root_path)
-        if not year:
-            continue  # 如果无法识别年份，跳过该文件夹
+class YearLog:
+    """每个年份目录一个带缓冲的 log.txt 句柄，整理结束时统一关闭。"""
 
-        # 创建目标年份文件夹
-        target_year_dir = target_root / year
-        target_year_dir.mkdir(parents=True, exist_ok=True)
-        log_path = target_year_dir / "log.txt"
+    def __init__(self, log_path):
+        self._f = open(log_path, 'a', encoding='utf-8', buffering=LOG_BUFFER)
 
-        # 用于编号无中文名文件
-        no_chinese_counter = 1
+    def write(self, content, entry=None):
+        if entry is not None:
+            file_stat = entry.stat()
+            content += f" | 创建时间: {file_stat.st_ctime} | 修改时间: {file_stat.st_mtime}"
+        self._f.write(content + '\n')
 
-        for file in files:
-            file_path = root_path / file
-            suffix = file_path.suffix.lower()
+    def close(self):
+        self._f.close()
 
-            try:
-                # 如果是图片文件，复制到目标文件夹
-                if suffix in ALLOWED_IMG_EXT:
-                    # 判断文件名是否包含中文
-                    if not contains_chinese(file):
-                        # 获取上一级文件夹名称作为事件名称
-                        event_name = root_path.name
-                        # 生成新的文件名
-                        new_file_name = f"{event_name}_{no_chinese_counter}{suffix}"
-                        no_chinese_counter += 1
-                    else:
-                        new_file_name = file
-
-                    # 复制文件并重命名
-                    copied_name = safe_copy(file_path, target_year_dir / new_file_name)
-                    log_operation(log_path, f"[IMG] {copied_name} <- {file_path}", file_path)
-                    status_callback(f"[IMG] {copied_name}")
-
-                # 如果是压缩包，提取图片到目标文件夹
-                elif suffix in ALLOWED_COMPRESSED:
-                    if suffix == '.zip':
-                        count = extract_from_zip(file_path, target_year_dir)
-                    elif suffix == '.rar':
-                        count = extract_from_rar(file_path, target_year_dir)
-                    log_operation(log_path, f"[COMPRESSED] Extracted {count} images <- {file_path}", file_path)
-                    status_callback(f"[COMPRESSED] {count} images")
 
-            except Exception as e:
-                log_operation(log_path, f"[ERROR] {file_path}: {str(e)}")
-                status_callback(f"[ERROR] {file_path.name}")
-            total_files += 1
+def scan_year_dirs(source_root):
+    """用 os.scandir 深度优先遍历，产出 (目录路径, 年份, 文件 DirEntry 列表)。
+
+    年份沿路径向下继承：祖先已识别年份时子目录不再重复解析；
+    尚未识别年份的目录不收集文件，只继续向下找带年份的子目录。
+    """
+    stack = [(str(source_root), get_target_year(Path(source_root)))]
+    while stack:
+        dir_path, year = stack.pop()
+        files, subdirs = [], []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append((entry.path, year or get_target_year(PurePath(entry.name))))
+                    elif year and entry.is_file():
+                        files.append(entry)
+        except OSError:
+            continue
+        # 逆序压栈，保持与 os.walk 相同的先序遍历顺序
+        stack.extend(reversed(subdirs))
+        if year:
+            yield dir_path, year, files
+
+
+def process_photos(source_root, target_root, status_callback, workers=COPY_WORKERS, index_json=None):
+    """按年份整理图片；index_json 不为空时，压缩包中新导入的图片同时并入该原图索引。"""
+    target_root = Path(target_root)
+    total_files = 0
+
+    copier = CopyEngine(workers=workers)
+    logs, names, stores, pending = {}, {}, {}, []
+    image_dirs = {}  # 图片子文件夹 -> NameTable
+    new_entries = []
+
+    try:
+        for dir_path, year, files in scan_year_dirs(source_root):
+            # 创建目标年份文件夹，日志句柄与文件名表按年份复用
+            target_year_dir = target_root / year
+            if year not in logs:
+                target_year_dir.mkdir(parents=True, exist_ok=True)
+                logs[year] = YearLog(target_year_dir / "log.txt")
+                names[year] = NameTable(target_year_dir)
+                stores[year] = DigestStore(target_year_dir / DIGEST_STORE_NAME)
+            log = logs[year]
+
+            # 用于编号无中文名文件
+            no_chinese_counter = 1
+
+            for entry in files:
+                file = entry.name
+                suffix = os.path.splitext(file)[1].lower()
+
+                try:
+                    # 如果是图片文件，复制到目标文件夹
+                    if suffix in ALLOWED_IMG_EXT:
+                        # 判断文件名是否包含中文
+                        if not contains_chinese(file):
+                            # 获取上一级文件夹名称作为事件名称
+                            event_name = os.path.basename(dir_path)
+                            # 生成新的文件名
+                            new_file_name = f"{event_name}_{no_chinese_counter}{suffix}"
+                            no_chinese_counter += 1
+                        else:
+                            new_file_name = file
+
+                        # 归档布局与原来一致：按新文件名建子文件夹，图片保留原文件名放在其中
+                        image_dir = target_year_dir / new_file_name
+                        if image_dir not in image_dirs:
+                            image_dir.mkdir(parents=True, exist_ok=True)
+                            image_dirs[image_dir] = NameTable(image_dir)
+                        # 名字在主线程分配，复制交给线程池
+                        copied_name = image_dirs[image_dir].claim(file)
+                        fut = copier.submit(entry.path, image_dir / copied_name)
+                        pending.append((fut, year, entry.path))
+                        log.write(f"[IMG] {copied_name} <- {entry.path}", entry)
+                        status_callback(f"[IMG] {copied_name}")
+
+                    # 如果是压缩包，按内容去重后提取图片到目标文件夹
+                    elif suffix in ALLOWED_COMPRESSED:
+                        report = ingest_archive(entry.path, target_year_dir, stores[year], names[year],
+                                                hash_images=index_json is not None)
+                        new_entries.extend(report["entries"])
+                        log.write(f"[COMPRESSED] Extracted {report['extracted']} images, "
+                                  f"skipped {report['skipped_duplicate']} duplicates <- {entry.path}", entry)
+                        status_callback(f"[COMPRESSED] {report['extracted']} images"
+                                        f"（重复跳过 {report['skipped_duplicate']}）")
+
+                except Exception as e:
+                    log.write(f"[ERROR] {entry.path}: {str(e)}")
+                    status_callback(f"[ERROR] {file}")
+                total_files += 1
+
+        copier.wait()
+        for fut, year, src in pending:
+            error = fut.exception()
+            if error is not None:
+                logs[year].write(f"[ERROR] {src}: {str(error)}")
+                status_callback(f"[ERROR] {os.path.basename(src)}")
+        # 本次整理的复制统计记入各年份日志
+        summary = copier.summary_text().strip()
+        for log in logs.values():
+            log.write(summary)
+    finally:
+        for log in logs.values():
+            log.close()
+        for store in stores.values():
+            store.close()
+
+    if index_json and new_entries:
+        from build_image_index import merge_into_index
+        merge_into_index(index_json, new_entries)
+        status_callback(f"📝 压缩包新图片 {len(new_entries)} 张已并入索引：{index_json}")
 
     status_callback(f"处理完成，共处理 {total_files} 个文件")
+    status_callback(summary)
 
 def contains_chinese(text):
     """判断字符串是否包含中文字符"""
@@ -291,46 +388,16 @@ def contains_chinese(text):
             return True
     return False
 
-def build_image_index(base_dir, output_json, logger=None):
-    import imagehash
-    from PIL import Image
-    import json
-    import os
-
-    index = []
-    valid_exts = (".jpg", ".jpeg", ".png")
-
-    all_images = []
-    for root, dirs, files in os.walk(base_dir):
-        if "外宣" in root:
-            continue
-        for file in files:
-            if file.lower().endswith(valid_exts):
-                all_images.append(os.path.join(root, file))
-
-    if logger: logger(f"📦 共发现图像 {len(all_images)} 张，开始处理...")
-
-    for i, path in enumerate(all_images):
-        try:
-            with Image.open(path) as img:
-                img = img.convert("RGB")
-                phash = str(imagehash.phash(img))
-                size = img.size
-            index.append({
-                "path": path,
-                "phash": phash,
-                "size": size
-            })
-            if logger and i % 50 == 0:
-                logger(f"已完成 {i}/{len(all_images)} 张")
-        except Exception as e:
-            continue
+def build_image_index(base_dir, output_json, logger=None, workers=None, incremental=True, resume=False):
+    """界面入口：构建流程（含 .sqlite 输出、增量与续跑）全部交给 build_image_index.py，这里只转发日志与进度。"""
+    from build_image_index import build_image_index as build
 
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(index, f, indent=2, ensure_ascii=False)
+    def on_progress(done, total):
+        if logger and (done % 50 == 0 or done == total):
+            logger(f"已完成 {done}/{total} 张")
 
-    if logger:
-        logger(f"✅ 共索引 {len(index)} 张图像，索引文件已保存")
+    return build(base_dir, output_json, workers, incremental, resume,
+                 on_log=logger or (lambda msg: None), on_progress=on_progress)
 
 # ========== GUI ==========
 
@@ -380,7 +447,10 @@ def start_gui():
             messagebox.showerror("错误", "请指定源目录和目标目录")
             return
         status_list.delete(0, tk.END)
-        process_photos(src, tgt, lambda msg: status_list.insert(tk.END, msg))
+        status_list.insert(tk.END, "📁 正在整理图片，请稍候...")
+
+        # 后台线程遍历与复制，界面保持响应
+        threading.Thread(target=process_photos, args=(src, tgt, events.log), daemon=True).start()
 
     def run_extract():
         file_path = file_entry.get()
@@ -402,12 +472,8 @@ def start_gui():
         status_list.insert(tk.END, "🔍 正在查找高清原图，请稍候...")
 
         def run():
-            def log(msg):
-                status_list.insert(tk.END, msg)
-                status_list.yview_moveto(1)
-
-            find_hd_images(low, out, base, log)
-            status_list.insert(tk.END, "✅ 查找完成，结果已输出到目标文件夹")
+            find_hd_images(low, out, base, events.log)
+            events.log("✅ 查找完成，结果已输出到目标文件夹")
 
         threading.Thread(target=run, daemon=True).start()
 
@@ -436,8 +502,8 @@ def start_gui():
         status_list.insert(tk.END, "🔍 正在构建哈希索引，请稍候...")
 
         def task():
-            build_image_index(src_dir, out_file, lambda msg: status_list.insert(tk.END, msg))
-            status_list.insert(tk.END, f"✅ 索引构建完成，已保存至：{out_file}")
+            build_image_index(src_dir, out_file, events.log)
+            events.log(f"✅ 索引构建完成，已保存至：{out_file}")
 
         threading.Thread(target=task, daemon=True).start()
 
@@ -486,6 +552,15 @@ def start_gui():
     status_list = tk.Listbox(root, width=100, height=20)
     status_list.grid(row=9, column=0, columnspan=3, padx=10, pady=10)
 
+    # 后台线程的日志经事件总线按节拍合并写入列表
+    def write_lines(lines):
+        status_list.insert(tk.END, *lines)
+        status_list.yview_moveto(1)
+
+    events = EventBus(root)
+    events.add_log_sink(write_lines)
+    events.start()
+
     root.mainloop()
 
 
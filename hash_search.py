@@ -0,0 +1,682 @@
+import os
+import pickle
+from functools import lru_cache
+from itertools import combinations
+
+import imagehash
+import numpy as np
+
+# ========== 配置 ==========
+NUM_CHUNKS = 4      # 64 位哈希切成 4 段，每段 16 位
+MAX_PROBE_BITS = 2  # 每段最多枚举翻转的位数，超过则退回线性扫描
+QUERY_BLOCK = 256   # 批量比对时每块查询数
+INDEX_BLOCK = 16384 # 批量比对时每块索引条数（256 x 16384 的距离矩阵约 4MB）
+DIGEST_BYTES = 20   # 精确查重用的 BLAKE2b 摘要长度，与 fast_copy.file_digest 一致
+CACHE_VERSION = 2   # .mih.pkl 检索缓存格式；保存的字段变化时递增，旧缓存自动作废
+
+
+# ========== 工具函数 ==========
+
+def _packed_bits(h):
+    """ImageHash 的位按 str(ImageHash) 的顺序打包成字节；位数不是 8 的倍数时返回 None。"""
+    bits = h.hash.reshape(-1)
+    return np.packbits(bits).tobytes() if bits.size % 8 == 0 else None
+
+
+def hash_to_int(h):
+    """ImageHash 或十六进制字符串 -> 整数，位序与 str(ImageHash) 一致。"""
+    if isinstance(h, imagehash.ImageHash):
+        packed = _packed_bits(h)  # 直接打包位数组，比先转十六进制字符串快得多
+        if packed is not None:
+            return int.from_bytes(packed, "big")
+        h = str(h)
+    return int(h, 16)
+
+
+def hash_bits(h):
+    """哈希的总位数（8x8 pHash 为 64）。"""
+    if isinstance(h, imagehash.ImageHash):
+        return h.hash.size
+    return len(h) * 4
+
+
+_BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount_u64(arr):
+    """uint64 数组逐元素 popcount，返回 uint8 数组。"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(arr).astype(np.uint8, copy=False)
+    as_bytes = arr.view(np.uint8).reshape(arr.shape + (8,))
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+
+def pack_wide_hashes(hexes):
+    """一组等长的宽哈希（如 256 位）打包为 (N, 位数/64) 的 uint64 数组。"""
+    if hexes and all(isinstance(h, imagehash.ImageHash) and h.hash.size % 64 == 0 for h in hexes):
+        return np.array([np.frombuffer(_packed_bits(h), dtype=">u8") for h in hexes], dtype=np.uint64)
+    hexes = [str(h) for h in hexes]
+    words = len(hexes[0]) // 16 if hexes else 0
+    return np.array([[int(h[i * 16:(i + 1) * 16], 16) for i in range(words)] for h in hexes],
+                    dtype=np.uint64).reshape(len(hexes), words)
+
+
+def _pack_fine(fine_hashes):
+    """批量查询的细哈希 -> ((Q, k) uint64 数组, 是否给出细哈希的布尔数组)；全部缺失时返回 None。"""
+    if fine_hashes is None or all(f is None for f in fine_hashes):
+        return None
+    has_fine = np.array([f is not None for f in fine_hashes])
+    packed = pack_wide_hashes([f for f in fine_hashes if f is not None])
+    out = np.zeros((len(fine_hashes), packed.shape[1]), dtype=np.uint64)
+    out[has_fine] = packed
+    return out, has_fine
+
+
+def pack_hashes(hashes):
+    """一组 64 位哈希（ImageHash / 十六进制 / 整数）打包为 uint64 数组。"""
+    return np.array([h if isinstance(h, int) else hash_to_int(h) for h in hashes], dtype=np.uint64)
+
+
+def batch_nearest(queries, index_arr, radius):
+    """分块计算 queries x index 的 XOR + popcount 距离。
+
+    返回 (dists, rows)：每条查询的最近距离与行号，超出 radius 的行号为 -1。
+    """
+    n = len(queries)
+    best_d = np.full(n, 255, dtype=np.uint8)
+    best_row = np.full(n, -1, dtype=np.int64)
+    for qs in range(0, n, QUERY_BLOCK):
+        q = queries[qs:qs + QUERY_BLOCK, None]
+        bd = best_d[qs:qs + QUERY_BLOCK]
+        br = best_row[qs:qs + QUERY_BLOCK]
+        for start in range(0, len(index_arr), INDEX_BLOCK):
+            dist = popcount_u64(q ^ index_arr[None, start:start + INDEX_BLOCK])
+            col = dist.argmin(axis=1)
+            d = dist[np.arange(len(col)), col]
+            better = d < bd
+            bd[better] = d[better]
+            br[better] = col[better] + start
+    best_row[best_d > radius] = -1
+    return best_d, best_row
+
+
+def batch_candidates(queries, index_arr, radius):
+    """分块计算 queries x index 的距离，返回距离 ≤ radius 的全部配对 (查询序号, 行号, 距离)，各为一维数组。"""
+    qi, rows, dists = [], [], []
+    for qs in range(0, len(queries), QUERY_BLOCK):
+        q = queries[qs:qs + QUERY_BLOCK, None]
+        for start in range(0, len(index_arr), INDEX_BLOCK):
+            dist = popcount_u64(q ^ index_arr[None, start:start + INDEX_BLOCK])
+            a, b = np.nonzero(dist <= radius)
+            qi.append(a + qs)
+            rows.append(b + start)
+            dists.append(dist[a, b])
+    if not qi:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.uint8)
+    return np.concatenate(qi), np.concatenate(rows), np.concatenate(dists)
+
+
+def _flip_variants(value, bits, max_flips):
+    """枚举与 value 汉明距离 ≤ max_flips 的所有 bits 位整数。"""
+    yield value
+    for k in range(1, max_flips + 1):
+        for positions in combinations(range(bits), k):
+            v = value
+            for p in positions:
+                v ^= 1 << p
+            yield v
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits, max_flips):
+    """_flip_variants 的异或掩码数组（含 0），用于一次为多个段值生成探测值。"""
+    return np.fromiter(_flip_variants(0, bits, max_flips), dtype=np.int64)
+
+
+# ========== 多索引哈希 ==========
+
+def exact_key(entry):
+    """精确查重用的 (字节数, 摘要)；旧记录没有摘要时为 (0, None)。"""
+    if not entry.get("digest"):
+        return 0, None
+    return entry.get("content_size", entry.get("file_size", 0)), entry["digest"]
+
+
+class ExactIndex:
+    """文件大小 + 内容摘要（BLAKE2b）的精确查重表。
+
+    按大小排序存放，查询时先二分定位同大小的记录，只有大小命中才需要计算查询文件的摘要。
+    file_sizes 为 0 的行视为没有摘要，不进入表中。
+    """
+
+    def __init__(self, file_sizes, digests):
+        file_sizes = np.asarray(file_sizes, dtype=np.uint64)
+        digests = np.asarray(digests, dtype=np.uint8).reshape(-1, DIGEST_BYTES)
+        rows = np.flatnonzero(file_sizes)
+        order = rows[np.argsort(file_sizes[rows], kind="stable")]
+        self.file_sizes = file_sizes[order]
+        self.digests = digests[order]
+        self.rows = order.astype(np.int64)
+
+    @classmethod
+    def from_keys(cls, keys):
+        """由与索引行一一对应的 [exact_key(记录)] 构建。"""
+        blank = bytes(DIGEST_BYTES)
+        raw = b"".join(bytes.fromhex(d) if d else blank for _, d in keys)
+        sizes = [int(n or 0) if d else 0 for n, d in keys]
+        return cls(sizes, np.frombuffer(raw, dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def has_size(self, size):
+        i = np.searchsorted(self.file_sizes, size)
+        return i < len(self.file_sizes) and int(self.file_sizes[i]) == size
+
+    def lookup(self, size, digest):
+        """返回内容完全相同的第一条记录的行号，没有则 -1；digest 为 20 字节或十六进制串。"""
+        if isinstance(digest, str):
+            digest = bytes.fromhex(digest)
+        lo = np.searchsorted(self.file_sizes, size, side="left")
+        hi = np.searchsorted(self.file_sizes, size, side="right")
+        for i in range(lo, hi):
+            if self.digests[i].tobytes() == digest:
+                return int(self.rows[i])
+        return -1
+
+    def columns(self):
+        """按索引行号还原 (大小数组, 摘要数组)，用于持久化。"""
+        n = int(self.rows.max()) + 1 if len(self.rows) else 0
+        sizes = np.zeros(n, dtype=np.uint64)
+        digests = np.zeros((n, DIGEST_BYTES), dtype=np.uint8)
+        sizes[self.rows] = self.file_sizes
+        digests[self.rows] = self.digests
+        return sizes, digests
+
+
+class HammingIndex:
+    """感知哈希的多索引（鸽巢原理）检索结构。
+
+    把每个哈希切成 NUM_CHUNKS 段，每段按段值排序建一张查找表。
+    若两哈希距离 ≤ r，则至少有一段的距离 ≤ r // NUM_CHUNKS，
+    因此只需查询每段附近的少量段值，再对候选做精确校验。
+    哈希以 uint64 数组保存（最多 64 位）；paths 可以是任何支持下标访问的序列；
+    sizes 为可选的 (宽, 高) 数组，用于按分辨率排序候选；
+    fine 为可选的高分辨率哈希（(N, k) uint64），只用于对少量候选做第二阶段重排；
+    exact 为可选的 ExactIndex，用于在解码前识别逐字节相同的文件。
+    stale 为由旧版哈希算法生成的记录数（加载时给出，用于提示重建）。
+    """
+
+    def __init__(self, hashes, paths, bits=64, sizes=None, fine=None, exact=None):
+        if bits > 64:
+            raise ValueError(f"多索引检索仅支持 ≤64 位哈希，当前为 {bits} 位")
+        self.hashes = hashes if isinstance(hashes, np.ndarray) else pack_hashes(hashes)
+        self.paths = paths if hasattr(paths, "__getitem__") else list(paths)
+        self.bits = bits
+        self.sizes = None if sizes is None else np.asarray(sizes, dtype=np.uint32).reshape(-1, 2)
+        self.fine = None if fine is None or not len(fine) else np.asarray(fine, dtype=np.uint64)
+        self.exact = exact if exact is not None and len(exact) else None
+        self.stale = 0
+        self.chunk_bits = bits // NUM_CHUNKS
+        self.chunk_mask = (1 << self.chunk_bits) - 1
+        self.tables = []
+        for seg in self._segments(self.hashes):
+            order = np.argsort(seg, kind="stable")
+            self.tables.append((seg[order], order))
+
+    @classmethod
+    def from_hash_dict(cls, hash_index):
+        """由 {ImageHash: path} 字典构建。"""
+        hashes, paths, bits = [], [], None
+        for h, path in hash_index.items():
+            if not isinstance(h, imagehash.ImageHash):
+                continue  # 跳过非哈希对象
+            if bits is None:
+                bits = hash_bits(h)
+            hashes.append(hash_to_int(h))
+            paths.append(path)
+        return cls(hashes, paths, bits or 64)
+
+    @classmethod
+    def from_hex_pairs(cls, pairs, sizes=None, fine=None, exact=None):
+        """由 [(十六进制哈希, path)] 构建，保留重复哈希；sizes、fine、exact（exact_key 列表）与 pairs 一一对应。"""
+        hashes, paths, bits = [], [], None
+        for h, path in pairs:
+            if bits is None:
+                bits = hash_bits(h)
+            hashes.append(hash_to_int(h))
+            paths.append(path)
+        if fine is not None:
+            fine = pack_wide_hashes(fine)
+        if exact is not None:
+            exact = ExactIndex.from_keys(exact)
+        return cls(hashes, paths, bits or 64, sizes, fine, exact)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def items(self):
+        """兼容旧代码按 {ImageHash: path} 遍历。"""
+        width = self.bits // 4
+        for row, h in enumerate(self.hashes):
+            yield imagehash.hex_to_hash(format(int(h), f"0{width}x")), self.paths[row]
+
+    def _segments(self, arr):
+        for c in range(NUM_CHUNKS):
+            yield ((arr >> np.uint64(c * self.chunk_bits)) & np.uint64(self.chunk_mask)).astype(np.int64)
+
+    def search(self, h, radius):
+        """返回所有距离 ≤ radius 的 (distance, row)，按距离升序。"""
+        q = hash_to_int(h) if not isinstance(h, (int, np.integer)) else int(h)
+        flips = radius // NUM_CHUNKS
+        if flips > MAX_PROBE_BITS:
+            rows = np.arange(len(self.hashes))
+        else:
+            found = []
+            q_segs = [int(x[0]) for x in self._segments(np.array([q], dtype=np.uint64))]
+            for (values, order), seg in zip(self.tables, q_segs):
+                probes = np.fromiter(_flip_variants(seg, self.chunk_bits, flips), dtype=np.int64)
+                lo = np.searchsorted(values, probes, side="left")
+                hi = np.searchsorted(values, probes, side="right")
+                found.extend(order[a:b] for a, b in zip(lo, hi) if b > a)
+            if not found:
+                return []
+            rows = np.unique(np.concatenate(found))
+        d = popcount_u64(self.hashes[rows] ^ np.uint64(q))
+        keep = d <= radius
+        rows, d = rows[keep], d[keep]
+        ranked = np.lexsort((rows, d))
+        return [(int(d[i]), int(rows[i])) for i in ranked]
+
+    def rerank(self, hits, fine_h, fine_radius):
+        """第二阶段：用高分辨率哈希过滤并重排 [(distance, row)]。
+
+        返回 [(细距离, 粗距离, row)]，按细距离升序；索引不含细哈希时原样按粗距离返回。
+        """
+        if self.fine is None or fine_h is None or not hits:
+            return [(d, d, row) for d, row in hits]
+        rows = np.array([row for _, row in hits], dtype=np.int64)
+        q = pack_wide_hashes([fine_h])[0]
+        fine_d = popcount_u64(self.fine[rows] ^ q[None, :]).sum(axis=1, dtype=np.int64)
+        ranked = sorted((int(fd), d, row) for fd, (d, row) in zip(fine_d, hits) if fine_radius is None or fd <= fine_radius)
+        return ranked
+
+    def nearest(self, h, radius, fine_h=None, fine_radius=None):
+        """返回距离 ≤ radius 的最近一条 (distance, path)，没有则 (None, None)。
+
+        给出 fine_h 时启用两级级联：粗哈希召回候选，再按细哈希距离选最优。
+        """
+        hits = self.search(h, radius)
+        if fine_h is not None and self.fine is not None:
+            hits = [(d, row) for _, d, row in self.rerank(hits, fine_h, fine_radius)]
+        if not hits:
+            return None, None
+        d, row = hits[0]
+        return d, self.paths[row]
+
+    def search_variants(self, hs, radius):
+        """一组查询哈希（如一张图的 8 种旋转 / 镜像）一次检索。
+
+        各段的探测值合并后只查一遍表，候选对全部变体一次算出距离；
+        返回 [(distance, row, 变体序号)]，每行只保留距离最近的变体，按距离升序。
+        """
+        qs = pack_hashes(hs)
+        flips = radius // NUM_CHUNKS
+        if flips > MAX_PROBE_BITS:
+            rows = np.arange(len(self.hashes))
+        else:
+            found = []
+            masks = _flip_masks(self.chunk_bits, flips)
+            for (values, order), segs in zip(self.tables, self._segments(qs)):
+                probes = np.unique((segs[:, None] ^ masks[None, :]).ravel())
+                lo = np.searchsorted(values, probes, side="left")
+                counts = np.searchsorted(values, probes, side="right") - lo
+                if counts.any():
+                    # 各探测值命中的区间 [lo, lo+count) 一次展开，不逐个切片
+                    total = int(counts.sum())
+                    found.append(order[np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(total)])
+            if not found:
+                return []
+            rows = np.unique(np.concatenate(found))
+        dist = popcount_u64(self.hashes[rows][:, None] ^ qs[None, :])
+        variant = dist.argmin(axis=1)
+        d = dist[np.arange(len(rows)), variant]
+        keep = d <= radius
+        rows, d, variant = rows[keep], d[keep], variant[keep]
+        ranked = np.lexsort((rows, d))
+        return [(int(d[i]), int(rows[i]), int(variant[i])) for i in ranked]
+
+    def rerank_variants(self, hits, fine_hs, fine_radius):
+        """search_variants 结果的第二阶段：每行用其最近变体的细哈希重排，返回 [(细距离, 粗距离, row, 变体)]。"""
+        if self.fine is None or fine_hs is None or not hits:
+            return [(d, d, row, v) for d, row, v in hits]
+        rows = np.array([row for _, row, _ in hits], dtype=np.int64)
+        variants = np.array([v for _, _, v in hits], dtype=np.int64)
+        q = pack_wide_hashes(fine_hs)
+        fine_d = popcount_u64(self.fine[rows] ^ q[variants]).sum(axis=1, dtype=np.int64)
+        return sorted((int(fd), d, row, v) for fd, (d, row, v) in zip(fine_d, hits)
+                      if fine_radius is None or fd <= fine_radius)
+
+    def nearest_variants(self, hs, radius, fine_hs=None, fine_radius=None):
+        """任一变体距离 ≤ radius 的最近一条 (distance, path, 变体序号)，没有则 (None, None, None)。"""
+        hits = self.search_variants(hs, radius)
+        if fine_hs is not None and self.fine is not None:
+            hits = [(d, row, v) for _, d, row, v in self.rerank_variants(hits, fine_hs, fine_radius)]
+        if not hits:
+            return None, None, None
+        d, row, v = hits[0]
+        return d, self.paths[row], v
+
+    def exact_match(self, size, digest):
+        """逐字节相同的原图 path，没有或索引不含摘要时为 None。"""
+        if self.exact is None:
+            return None
+        row = self.exact.lookup(size, digest)
+        return self.paths[row] if row >= 0 else None
+
+    def hash_at(self, row):
+        """第 row 条记录的 ImageHash。"""
+        return imagehash.hex_to_hash(format(int(self.hashes[row]), f"0{self.bits // 4}x"))
+
+    def pixels(self, row):
+        """第 row 条原图的像素数，未记录尺寸时为 0。"""
+        if self.sizes is None:
+            return 0
+        w, h = self.sizes[row]
+        return int(w) * int(h)
+
+    def candidates(self, h, radius, fine_h=None, fine_radius=None):
+        """返回距离 ≤ radius 的全部候选 [(距离, 像素数, path)]，按距离升序、像素数降序。
+
+        给出 fine_h 时先剔除细哈希距离超过 fine_radius 的候选。
+        """
+        hits = self.search(h, radius)
+        if fine_h is not None and self.fine is not None:
+            hits = [(d, row) for _, d, row in self.rerank(hits, fine_h, fine_radius)]
+        ranked = [(d, self.pixels(row), row) for d, row in hits]
+        ranked.sort(key=lambda c: (c[0], -c[1], c[2]))
+        return [(d, px, self.paths[row]) for d, px, row in ranked]
+
+    def largest_within(self, h, radius, fine_h=None, fine_radius=None):
+        """阈值内分辨率最大的候选 (距离, 像素数, path)，同分辨率取距离更近者；没有则 None。"""
+        found = self.candidates(h, radius, fine_h, fine_radius)
+        if not found:
+            return None
+        return max(found, key=lambda c: (c[1], -c[0]))
+
+    def as_array(self):
+        """全部哈希的 uint64 数组。"""
+        return self.hashes
+
+    def batch_ranked(self, queries, radius, fine=None, fine_radius=None):
+        """整批比对的底层实现：queries 为 uint64 数组，fine 为 _pack_fine 的结果（可为 None）。
+
+        返回 (细距离, 粗距离, 行号) 三个数组，每条查询取 (细距离, 粗距离, 行号) 最小的候选，没有则行号为 -1；
+        不启用级联时细距离即粗距离。级联时先整批召回阈值内的全部候选，只对这些候选计算细距离。
+        """
+        n = len(queries)
+        best_fd = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        best_d = np.full(n, 255, dtype=np.int64)
+        best_row = np.full(n, -1, dtype=np.int64)
+        if not n or not len(self.hashes):
+            return best_fd, best_d, best_row
+        if fine is None or self.fine is None:
+            dists, rows = batch_nearest(queries, self.hashes, radius)
+            hit = rows >= 0
+            best_fd[hit] = best_d[hit] = dists[hit]
+            best_row[hit] = rows[hit]
+            return best_fd, best_d, best_row
+        qi, rows, dists = batch_candidates(queries, self.hashes, radius)
+        dists = dists.astype(np.int64)
+        fine_q, has_fine = fine
+        has_fine = has_fine[qi]
+        fd = np.where(has_fine, popcount_u64(self.fine[rows] ^ fine_q[qi]).sum(axis=1, dtype=np.int64), dists)
+        if fine_radius is not None:
+            keep = ~has_fine | (fd <= fine_radius)
+            qi, rows, dists, fd = qi[keep], rows[keep], dists[keep], fd[keep]
+        order = np.lexsort((rows, dists, fd, qi))
+        first = order[np.r_[True, qi[order][1:] != qi[order][:-1]]] if len(order) else order
+        best_fd[qi[first]] = fd[first]
+        best_d[qi[first]] = dists[first]
+        best_row[qi[first]] = rows[first]
+        return best_fd, best_d, best_row
+
+    def batch_nearest(self, hashes, radius, fine_hashes=None, fine_radius=None):
+        """整批查询，返回与 hashes 等长的 [(distance, path) 或 (None, None)]。
+
+        给出 fine_hashes（与 hashes 一一对应，元素可为 None）时与 nearest 相同地做两级级联。
+        """
+        if not len(hashes):
+            return []
+        _, dists, rows = self.batch_ranked(pack_hashes(hashes), radius, _pack_fine(fine_hashes), fine_radius)
+        return [(int(d), self.paths[r]) if r >= 0 else (None, None)
+                for d, r in zip(dists, rows)]
+
+    # ---------- 持久化 ----------
+
+    def save(self, path):
+        exact = self.exact.columns() if self.exact is not None else None
+        with open(path, "wb") as f:
+            pickle.dump({"version": CACHE_VERSION, "bits": self.bits, "hashes": self.hashes, "paths": list(self.paths),
+                         "sizes": self.sizes, "fine": self.fine, "exact": exact, "stale": self.stale}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+            raise ValueError(f"检索缓存格式已过期：{path}")
+        exact = ExactIndex(*data["exact"]) if data.get("exact") is not None else None
+        index = cls(data["hashes"], data["paths"], data["bits"], data.get("sizes"), data.get("fine"), exact)
+        index.stale = data.get("stale", 0)
+        return index
+
+
+# ========== 分片联合检索 ==========
+
+def remap_path(path, remap):
+    """按 [(旧前缀, 新前缀)] 改写路径（卷挂载位置变化时使用），取第一条匹配的规则。"""
+    for old, new in remap or ():
+        old = old.rstrip("/\\")
+        if path == old or (path.startswith(old) and path[len(old)] in "/\\#"):
+            return new.rstrip("/\\") + path[len(old):]
+    return path
+
+
+class _ShardedPaths:
+    """按全局行号取路径（已套用分片的前缀改写）。"""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __len__(self):
+        return len(self.owner)
+
+    def __getitem__(self, row):
+        k, local = self.owner.locate(row)
+        return remap_path(self.owner.shards[k].paths[local], self.owner.remaps[k])
+
+
+class _ShardedSizes:
+    """按全局行号取 (宽, 高)，未记录尺寸的分片返回 (0, 0)。"""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __getitem__(self, row):
+        k, local = self.owner.locate(row)
+        sizes = self.owner.shards[k].sizes
+        return sizes[local] if sizes is not None else np.zeros(2, dtype=np.uint32)
+
+
+class _ShardedExact:
+    """各分片 ExactIndex 的联合查询，lookup 返回全局行号。"""
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def __len__(self):
+        return sum(len(s.exact) for s in self.owner.shards if s.exact is not None)
+
+    def has_size(self, size):
+        return any(s.exact is not None and s.exact.has_size(size) for s in self.owner.shards)
+
+    def lookup(self, size, digest):
+        for k, s in enumerate(self.owner.shards):
+            if s.exact is not None and s.exact.has_size(size):
+                row = s.exact.lookup(size, digest)
+                if row >= 0:
+                    return int(self.owner.offsets[k]) + row
+        return -1
+
+
+class ShardedIndex:
+    """多个分片 HammingIndex 的联合检索：查询分发到每个分片再合并结果，不拼接数组或路径。
+
+    全局行号 = 分片起始偏移 + 分片内行号，paths / sizes / exact 按全局行号访问，
+    因此可以直接替代 HammingIndex 交给 match_engine 的流水线。
+    remaps 与 shards 一一对应，为各分片的 [(旧前缀, 新前缀)]。
+    只有全部分片都带同宽度的细哈希时才启用两级级联。
+    """
+
+    def __init__(self, shards, remaps=None, names=None):
+        self.shards = list(shards)
+        self.remaps = list(remaps) if remaps is not None else [None] * len(self.shards)
+        self.names = list(names) if names is not None else [str(k) for k in range(len(self.shards))]
+        bits = {s.bits for s in self.shards if len(s)}
+        if len(bits) > 1:
+            raise ValueError(f"分片的哈希位数不一致：{sorted(bits)}")
+        self.bits = bits.pop() if bits else 64
+        self.offsets = np.cumsum([0] + [len(s) for s in self.shards], dtype=np.int64)
+        widths = {s.fine.shape[1] if s.fine is not None else None for s in self.shards}
+        self.fine = [s.fine for s in self.shards] if self.shards and None not in widths and len(widths) == 1 else None
+        self.paths = _ShardedPaths(self)
+        self.sizes = _ShardedSizes(self)
+        self.exact = _ShardedExact(self) if any(s.exact is not None for s in self.shards) else None
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def locate(self, row):
+        """全局行号 -> (分片序号, 分片内行号)。"""
+        k = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        return k, int(row) - int(self.offsets[k])
+
+    def items(self):
+        for k, s in enumerate(self.shards):
+            for h, path in s.items():
+                yield h, remap_path(path, self.remaps[k])
+
+    def search(self, h, radius):
+        """各分片的 (distance, 全局行号) 合并后按距离升序。"""
+        hits = []
+        for k, s in enumerate(self.shards):
+            off = int(self.offsets[k])
+            hits.extend((d, off + row) for d, row in s.search(h, radius))
+        hits.sort()
+        return hits
+
+    def _ranked(self, h, radius, fine_h, fine_radius):
+        """[(细距离, 粗距离, 全局行号)]；不启用级联时细距离即粗距离。"""
+        ranked = []
+        for k, s in enumerate(self.shards):
+            off = int(self.offsets[k])
+            hits = s.search(h, radius)
+            if fine_h is not None and self.fine is not None:
+                hits = s.rerank(hits, fine_h, fine_radius)
+            else:
+                hits = [(d, d, row) for d, row in hits]
+            ranked.extend((fd, d, off + row) for fd, d, row in hits)
+        ranked.sort()
+        return ranked
+
+    def nearest(self, h, radius, fine_h=None, fine_radius=None):
+        ranked = self._ranked(h, radius, fine_h, fine_radius)
+        if not ranked:
+            return None, None
+        _, d, row = ranked[0]
+        return d, self.paths[row]
+
+    def nearest_variants(self, hs, radius, fine_hs=None, fine_radius=None):
+        ranked = []
+        for k, s in enumerate(self.shards):
+            off = int(self.offsets[k])
+            hits = s.search_variants(hs, radius)
+            if fine_hs is not None and self.fine is not None:
+                hits = s.rerank_variants(hits, fine_hs, fine_radius)
+            else:
+                hits = [(d, d, row, v) for d, row, v in hits]
+            ranked.extend((fd, d, off + row, v) for fd, d, row, v in hits)
+        if not ranked:
+            return None, None, None
+        _, d, row, v = min(ranked)
+        return d, self.paths[row], v
+
+    def exact_match(self, size, digest):
+        if self.exact is None:
+            return None
+        row = self.exact.lookup(size, digest)
+        return self.paths[row] if row >= 0 else None
+
+    def hash_at(self, row):
+        k, local = self.locate(row)
+        return self.shards[k].hash_at(local)
+
+    def pixels(self, row):
+        k, local = self.locate(row)
+        return self.shards[k].pixels(local)
+
+    def candidates(self, h, radius, fine_h=None, fine_radius=None):
+        ranked = [(d, self.pixels(row), row) for _, d, row in self._ranked(h, radius, fine_h, fine_radius)]
+        ranked.sort(key=lambda c: (c[0], -c[1], c[2]))
+        return [(d, px, self.paths[row]) for d, px, row in ranked]
+
+    def largest_within(self, h, radius, fine_h=None, fine_radius=None):
+        found = self.candidates(h, radius, fine_h, fine_radius)
+        if not found:
+            return None
+        return max(found, key=lambda c: (c[1], -c[0]))
+
+    def batch_nearest(self, hashes, radius, fine_hashes=None, fine_radius=None):
+        """逐分片整批比对，保留 (细距离, 粗距离) 最小者（同距离取靠前的分片）。"""
+        if not len(hashes):
+            return []
+        queries = pack_hashes(hashes)
+        fine = _pack_fine(fine_hashes) if self.fine is not None else None
+        best = np.full(len(queries), np.iinfo(np.int64).max, dtype=np.int64)
+        best_d = np.full(len(queries), 255, dtype=np.int64)
+        best_row = np.full(len(queries), -1, dtype=np.int64)
+        for k, s in enumerate(self.shards):
+            fd, d, rows = s.batch_ranked(queries, radius, fine, fine_radius)
+            better = (rows >= 0) & ((fd < best) | ((fd == best) & (d < best_d)))
+            best[better] = fd[better]
+            best_d[better] = d[better]
+            best_row[better] = rows[better] + self.offsets[k]
+        return [(int(d), self.paths[r]) if r >= 0 else (None, None) for d, r in zip(best_d, best_row)]
+
+
+def search_index_path(index_path):
+    """检索结构缓存文件，与 .pkl 放在一起。"""
+    return index_path + ".mih.pkl"
+
+
+def load_cached_search_index(index_path):
+    """读取不旧于索引文件、格式版本一致的检索缓存，缺失、过期或损坏时返回 None。"""
+    mih_path = search_index_path(index_path)
+    if not os.path.exists(mih_path):
+        return None
+    if os.path.exists(index_path) and os.path.getmtime(mih_path) < os.path.getmtime(index_path):
+        return None
+    try:
+        return HammingIndex.load(mih_path)
+    except Exception:
+        return None
+
+
+def save_search_index(index_path, index):
+    try:
+        index.save(search_index_path(index_path))
+        return True
+    except Exception:
+        return False
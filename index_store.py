@@ -0,0 +1,397 @@
+import os
+import sys
+import sqlite3
+import argparse
+import threading
+
+import imagehash
+import numpy as np
+
+from hash_search import (HammingIndex, NUM_CHUNKS, MAX_PROBE_BITS, exact_key, hash_to_int, _flip_variants,
+                         pack_hashes, pack_wide_hashes, popcount_u64)
+from fast_hash import HASH_ALGORITHM
+
+# ========== 配置 ==========
+INDEX_STORE_EXT = ".sqlite"
+STORE_BATCH = 500  # 构建时每批提交的记录数，读者在提交后即可看到新记录
+CHUNK_BITS = 64 // NUM_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+SEGMENTS = [f"seg{c}" for c in range(NUM_CHUNKS)]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS originals (
+    id           INTEGER PRIMARY KEY,
+    path         TEXT    NOT NULL UNIQUE,
+    phash        TEXT    NOT NULL,
+    phash_fine   TEXT,
+    width        INTEGER NOT NULL DEFAULT 0,
+    height       INTEGER NOT NULL DEFAULT 0,
+    file_size    INTEGER,
+    mtime        REAL,
+    inode        INTEGER,
+    digest       TEXT,
+    content_size INTEGER,
+    algorithm    TEXT,
+    {", ".join(f"{s} INTEGER NOT NULL" for s in SEGMENTS)}
+);
+{"".join(f"CREATE INDEX IF NOT EXISTS originals_{s} ON originals ({s});" for s in SEGMENTS)}
+CREATE INDEX IF NOT EXISTS originals_digest ON originals (digest);
+"""
+
+COLUMNS = ["path", "phash", "phash_fine", "width", "height", "file_size", "mtime", "inode",
+           "digest", "content_size", "algorithm"] + SEGMENTS
+ENTRY_COLUMNS = COLUMNS[:11]  # 还原记录字典所需的列
+
+
+def segments(h):
+    """64 位哈希切成 NUM_CHUNKS 段，与 hash_search.HammingIndex 的分段一致。"""
+    return [(h >> (c * CHUNK_BITS)) & CHUNK_MASK for c in range(NUM_CHUNKS)]
+
+
+def _row(entry):
+    if "phash" not in entry:
+        # 容器占位记录（见 build_image_index.container_marker）：phash 为空串、分段为 -1，分段查询不会命中
+        return [entry["path"], "", None, 0, 0, entry.get("file_size"), entry.get("mtime"), entry.get("inode"),
+                None, None, entry.get("algorithm")] + [-1] * NUM_CHUNKS
+    h = hash_to_int(entry["phash"])
+    if h >> 64:
+        raise ValueError(f"索引库仅支持 64 位哈希：{entry['path']}")
+    width, height = entry.get("size") or (0, 0)
+    return [entry["path"], entry["phash"], entry.get("phash_fine"), width, height, entry.get("file_size"),
+            entry.get("mtime"), entry.get("inode"), entry.get("digest"), entry.get("content_size"),
+            entry.get("algorithm")] + segments(h)
+
+
+def _entry(row):
+    """数据库行 -> 与 JSON 列表格式相同的记录字典（省略空字段）。"""
+    path, phash, fine, width, height, file_size, mtime, inode, digest, content_size, algorithm = row[:11]
+    entry = {"path": path, "phash": phash, "size": [width, height]} if phash else {"path": path, "images": 0}
+    for key, value in (("phash_fine", fine), ("file_size", file_size), ("mtime", mtime), ("inode", inode),
+                       ("digest", digest), ("content_size", content_size), ("algorithm", algorithm)):
+        if value is not None:
+            entry[key] = value
+    return entry
+
+
+# ========== 索引库 ==========
+
+class IndexStore:
+    """SQLite（WAL 模式）原图索引库。
+
+    - 每个原图一行，哈希相同的原图各自保留；path 唯一，重复写入即更新；
+    - seg0..seg3 为哈希的 4 个 16 位分段并各建索引，按鸽巢原理只取分段相近的候选；
+    - 写入以批为单位提交事务，构建过程中其它进程可以同时读。
+    """
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(originals)")}
+        if not readonly and "algorithm" not in existing:
+            # 旧版索引库补上 algorithm 列；原有记录为 NULL，下次增量构建时重新哈希
+            with self.conn:
+                self.conn.execute("ALTER TABLE originals ADD COLUMN algorithm TEXT")
+            existing.add("algorithm")
+        # 只读打开旧版索引库时，缺少的列按 NULL 读出
+        self._select = ", ".join(c if c in existing else f"NULL AS {c}" for c in ENTRY_COLUMNS)
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM originals").fetchone()[0]
+
+    def image_count(self):
+        """图片记录条数（不含容器占位记录）。"""
+        return self.conn.execute("SELECT COUNT(*) FROM originals WHERE phash != ''").fetchone()[0]
+
+    # ---------- 写入 ----------
+
+    def upsert(self, entries):
+        """在一个事务内写入一批记录，返回条数。"""
+        rows = [_row(e) for e in entries]
+        placeholders = ", ".join("?" * len(COLUMNS))
+        updates = ", ".join(f"{c} = excluded.{c}" for c in COLUMNS[1:])
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT INTO originals ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}", rows)
+        return len(rows)
+
+    def delete_files(self, paths):
+        """删除文件对应的记录；PDF / DOCX 连同其内嵌图片的虚拟路径一起删除。"""
+        with self.conn:
+            for p in paths:
+                # 虚拟路径形如 "<容器>#<成员>"，'#' 之后的下一个字符是 '$'，用范围查询走唯一索引
+                self.conn.execute("DELETE FROM originals WHERE path = ? OR (path >= ? AND path < ?)",
+                                  (p, p + "#", p + "$"))
+
+    def clear(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM originals")
+
+    # ---------- 读取 ----------
+
+    def iter_entries(self):
+        cur = self.conn.execute(f"SELECT {self._select} FROM originals ORDER BY id")
+        for row in cur:
+            yield _entry(row)
+
+    def paths(self):
+        """全部记录的 path（含容器占位记录）。"""
+        return [row[0] for row in self.conn.execute("SELECT path FROM originals")]
+
+    def entries_by_path(self):
+        """{path: 记录}，供增量构建判断文件是否变化。"""
+        return {e["path"]: e for e in self.iter_entries()}
+
+    def near_rows(self, qs, radius):
+        """按分段列召回可能与 qs 中任一哈希距离 ≤ radius 的行 [(id, 记录列...)]，未校验距离。
+
+        radius // NUM_CHUNKS 超过 MAX_PROBE_BITS 时枚举量过大，退回全表扫描。
+        """
+        flips = radius // NUM_CHUNKS
+        cols = f"id, {self._select}"
+        if flips > MAX_PROBE_BITS:
+            return self.conn.execute(f"SELECT {cols} FROM originals WHERE phash != ''").fetchall()
+        seen, rows = set(), []
+        for c, seg_col in enumerate(SEGMENTS):
+            probes = sorted({p for q in qs for p in _flip_variants(segments(q)[c], CHUNK_BITS, flips)})
+            for i in range(0, len(probes), 500):  # SQLite 参数个数上限
+                part = probes[i:i + 500]
+                cur = self.conn.execute(
+                    f"SELECT {cols} FROM originals WHERE {seg_col} IN ({', '.join('?' * len(part))})", part)
+                for row in cur:
+                    if row[0] not in seen:
+                        seen.add(row[0])
+                        rows.append(row)
+        return rows
+
+    def candidates(self, h, radius):
+        """距离 ≤ radius 的全部记录 [(距离, 记录)]，按距离升序。"""
+        q = hash_to_int(h) if not isinstance(h, int) else h
+        found = []
+        for row in self.near_rows([q], radius):
+            row = row[1:]
+            if not row[1]:
+                continue  # 容器占位记录
+            d = bin(int(row[1], 16) ^ q).count("1")
+            if d <= radius:
+                found.append((d, _entry(row)))
+        found.sort(key=lambda x: (x[0], x[1]["path"]))
+        return found
+
+    def nearest(self, h, radius):
+        """返回 (距离, path)，阈值内没有时 (None, None)。"""
+        found = self.candidates(h, radius)
+        return (found[0][0], found[0][1]["path"]) if found else (None, None)
+
+    def to_hamming_index(self):
+        """整表载入为 HammingIndex（含尺寸、细哈希与精确查重表），用于批量匹配。"""
+        pairs, sizes, fine, exact, stale = [], [], [], [], 0
+        for e in self.iter_entries():
+            if "phash" not in e:
+                continue  # 容器占位记录
+            pairs.append((e["phash"], e["path"]))
+            sizes.append(e["size"])
+            fine.append(e.get("phash_fine"))
+            exact.append(exact_key(e))
+            stale += e.get("algorithm") != HASH_ALGORITHM
+        if not fine or None in fine or len(set(map(len, fine))) != 1:
+            fine = None
+        index = HammingIndex.from_hex_pairs(pairs, sizes, fine, exact)
+        index.stale = stale
+        return index
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ========== 直接在索引库上检索 ==========
+
+class _StoreColumn:
+    """按行号（originals.id）取一列，供 match_engine 以 index.paths[row] / index.sizes[row] 访问。"""
+
+    def __init__(self, owner, sql, convert=lambda row: row[0]):
+        self.owner = owner
+        self.sql = sql
+        self.convert = convert
+
+    def __getitem__(self, row):
+        found = self.owner.query(f"SELECT {self.sql} FROM originals WHERE id = ?", (int(row),))
+        if not found:
+            raise IndexError(row)
+        return self.convert(found[0])
+
+
+class _StoreExact:
+    """精确查重：打开时读入全部字节数（有序）在内存中判断，大小命中后再按摘要查库。"""
+
+    def __init__(self, owner):
+        self.owner = owner
+        rows = owner.query("SELECT DISTINCT COALESCE(content_size, file_size) FROM originals "
+                           "WHERE digest IS NOT NULL AND phash != ''")
+        self.file_sizes = np.sort(np.array([r[0] for r in rows if r[0]], dtype=np.uint64))
+
+    def __len__(self):
+        return len(self.file_sizes)
+
+    def has_size(self, size):
+        i = np.searchsorted(self.file_sizes, size)
+        return i < len(self.file_sizes) and int(self.file_sizes[i]) == size
+
+    def lookup(self, size, digest):
+        if isinstance(digest, bytes):
+            digest = digest.hex()
+        found = self.owner.query("SELECT id FROM originals WHERE digest = ? AND COALESCE(content_size, file_size) = ? "
+                                 "AND phash != '' ORDER BY id LIMIT 1", (digest, int(size)))
+        return found[0][0] if found else -1
+
+
+class StoreIndex:
+    """不整表载入内存，每次查询用 seg0..seg3 列召回候选再校验距离。
+
+    查询接口与 HammingIndex 一致（nearest / nearest_variants / candidates / largest_within / exact），
+    行号为 originals.id；构建仍在进行时，新提交的记录下一次查询即可见。多个线程可同时查询。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.store = IndexStore(path, readonly=True)
+        self._lock = threading.Lock()
+        self.bits = 64
+        self.entries = self.store.image_count()
+        missing_fine = self.query("SELECT COUNT(*) FROM originals WHERE phash != '' AND phash_fine IS NULL")[0][0]
+        self.fine = True if self.entries and not missing_fine else None
+        self.stale = self.query(f"SELECT COUNT(*) FROM (SELECT {self.store._select} FROM originals WHERE phash != '') "
+                                "WHERE algorithm IS NULL OR algorithm != ?", (HASH_ALGORITHM,))[0][0]
+        self.paths = _StoreColumn(self, "path")
+        self.sizes = _StoreColumn(self, "width, height", lambda row: (row[0], row[1]))
+        self.exact = _StoreExact(self)
+        if not len(self.exact):
+            self.exact = None
+
+    def __len__(self):
+        return self.entries
+
+    def query(self, sql, params=()):
+        with self._lock:
+            return self.store.conn.execute(sql, params).fetchall()
+
+    def hash_at(self, row):
+        return imagehash.hex_to_hash(self.query("SELECT phash FROM originals WHERE id = ?", (int(row),))[0][0])
+
+    def pixels(self, row):
+        w, h = self.sizes[row]
+        return int(w) * int(h)
+
+    def _hits(self, hs, radius):
+        """[(距离, id, 变体序号, 记录行)]：每行取距离最近的变体，按 (距离, id) 升序。"""
+        qs = [int(q) for q in pack_hashes(hs)]
+        with self._lock:
+            rows = self.store.near_rows(qs, radius)
+        hits = []
+        for row in rows:
+            h = int(row[2], 16)
+            dists = [bin(h ^ q).count("1") for q in qs]
+            d = min(dists)
+            if d <= radius:
+                hits.append((d, row[0], dists.index(d), row))
+        hits.sort(key=lambda x: (x[0], x[1]))
+        return hits
+
+    def _reranked(self, hits, fine_hs, fine_radius):
+        """与 HammingIndex.rerank 相同：按细距离过滤并重排，返回 [(距离, id, 变体序号, 记录行)]。"""
+        if self.fine is None or fine_hs is None or not hits:
+            return hits
+        q = pack_wide_hashes(fine_hs)
+        fine = pack_wide_hashes([row[3] for _, _, _, row in hits])
+        fine_d = popcount_u64(fine ^ q[[v for _, _, v, _ in hits]]).sum(axis=1, dtype=np.int64)
+        ranked = [(int(fd), hit) for fd, hit in zip(fine_d, hits) if fine_radius is None or fd <= fine_radius]
+        ranked.sort(key=lambda x: (x[0], x[1][0], x[1][1]))
+        return [hit for _, hit in ranked]
+
+    def nearest(self, h, radius, fine_h=None, fine_radius=None):
+        hits = self._hits([h], radius)
+        if fine_h is not None:
+            hits = self._reranked(hits, [fine_h], fine_radius)
+        return (hits[0][0], hits[0][3][1]) if hits else (None, None)
+
+    def nearest_variants(self, hs, radius, fine_hs=None, fine_radius=None):
+        hits = self._reranked(self._hits(hs, radius), fine_hs, fine_radius)
+        return (hits[0][0], hits[0][3][1], hits[0][2]) if hits else (None, None, None)
+
+    def exact_match(self, size, digest):
+        if self.exact is None:
+            return None
+        row = self.exact.lookup(size, digest)
+        return self.paths[row] if row >= 0 else None
+
+    def candidates(self, h, radius, fine_h=None, fine_radius=None):
+        hits = self._hits([h], radius)
+        if fine_h is not None:
+            hits = self._reranked(hits, [fine_h], fine_radius)
+        ranked = sorted(((d, int(row[4]) * int(row[5]), i, row[1]) for d, i, _, row in hits),
+                        key=lambda c: (c[0], -c[1], c[2]))
+        return [(d, px, path) for d, px, _, path in ranked]
+
+    def largest_within(self, h, radius, fine_h=None, fine_radius=None):
+        found = self.candidates(h, radius, fine_h, fine_radius)
+        if not found:
+            return None
+        return max(found, key=lambda c: (c[1], -c[0]))
+
+    def close(self):
+        self.store.close()
+
+
+# ========== 导入 ==========
+
+def import_json(json_in, db_path):
+    """把列表或字典格式的 JSON 索引导入索引库，返回导入条数。
+
+    字典格式（convert.py 生成）在转换时已按哈希去重，被覆盖的原图无法找回，建议从列表格式导入。
+    """
+    from binary_index import load_json_entries
+    entries = load_json_entries(json_in)
+    with IndexStore(db_path) as store:
+        for i in range(0, len(entries), STORE_BATCH):
+            store.upsert(entries[i:i + STORE_BATCH])
+        return len(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite 原图索引库")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_import = sub.add_parser("import", help="从 JSON 索引导入")
+    p_import.add_argument("json_in")
+    p_import.add_argument("db")
+    p_query = sub.add_parser("query", help="查询阈值内的原图")
+    p_query.add_argument("db")
+    p_query.add_argument("phash", help="十六进制 pHash")
+    p_query.add_argument("--radius", type=int, default=5)
+    p_stats = sub.add_parser("stats", help="记录数")
+    p_stats.add_argument("db")
+    args = parser.parse_args()
+
+    if args.cmd == "import":
+        count = import_json(args.json_in, args.db)
+        print(f"导入完成！索引库 {args.db} 共 {count} 条记录。")
+    elif args.cmd == "query":
+        with IndexStore(args.db, readonly=True) as store:
+            for d, e in store.candidates(args.phash, args.radius):
+                print(f"{d}\t{e['path']}")
+    else:
+        if not os.path.exists(args.db):
+            sys.exit(f"找不到索引库：{args.db}")
+        with IndexStore(args.db, readonly=True) as store:
+            print(f"{args.db}：{store.image_count()} 条记录")
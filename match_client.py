@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import base64
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+
+import imagehash
+import numpy as np
+
+from fast_hash import VARIANTS
+
+# ========== 配置 ==========
+SERVER_HOST = "127.0.0.1"  # 只监听本机
+SERVER_PORT = 8765
+CONNECT_TIMEOUT = 0.3  # 探测服务是否在运行，超时即按未运行处理
+REQUEST_TIMEOUT = 120
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "match_server.py")
+SERVER_LOG = os.path.join(tempfile.gettempdir(), "match_server.log")  # 后台启动的服务输出写到这里
+START_TIMEOUT = 10.0  # 启动后等待服务就绪的时间（秒），大索引可能仍在加载
+START_POLL = 0.5
+
+
+class ServerError(Exception):
+    pass
+
+
+def server_url(host=SERVER_HOST, port=SERVER_PORT):
+    return f"http://{host}:{port}"
+
+
+def call(url, route, payload=None, timeout=REQUEST_TIMEOUT):
+    """GET（payload 为 None）或 POST JSON，返回解析后的响应；服务端报错时抛出 ServerError。"""
+    data = None if payload is None else json.dumps(payload).encode("utf-8")
+    req = urllib.request.Request(url + route, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        raise ServerError(e.read().decode("utf-8", "replace") or str(e)) from e
+
+
+def same_index(a, b):
+    return os.path.normcase(os.path.realpath(a)) == os.path.normcase(os.path.realpath(b))
+
+
+# ========== 远程索引 ==========
+
+class _RowCache:
+    """精确命中时服务端返回的记录，按本地行号保存，供流水线用 paths / sizes / hash_at 取回。"""
+
+    def __init__(self):
+        self._rows = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._rows.append(record)
+            return len(self._rows) - 1
+
+    def __getitem__(self, row):
+        return self._rows[row]
+
+
+class _Column:
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+
+    def __getitem__(self, row):
+        return self.cache[row][self.key]
+
+
+class _RemoteExact:
+    """大小表在连接时取回本地判断，只有大小命中时才向服务端查询摘要。"""
+
+    def __init__(self, owner, sizes):
+        self.owner = owner
+        self.file_sizes = sizes
+
+    def __len__(self):
+        return len(self.file_sizes)
+
+    def has_size(self, size):
+        i = np.searchsorted(self.file_sizes, size)
+        return i < len(self.file_sizes) and int(self.file_sizes[i]) == size
+
+    def lookup(self, size, digest):
+        if isinstance(digest, bytes):
+            digest = digest.hex()
+        found = call(self.owner.url, "/exact", {"items": [{"size": int(size), "digest": digest}]})["results"][0]
+        if found is None:
+            return -1
+        return self.owner.rows.add(found)
+
+
+class RemoteIndex:
+    """常驻匹配服务的客户端，接口与 HammingIndex 的查询部分一致，可直接交给 match_engine。
+
+    哈希在本地计算，服务端只做检索；批量比对一次请求完成整批。
+    """
+
+    def __init__(self, url, status):
+        self.url = url
+        self.index_path = status["index"]
+        self.bits = status["bits"]
+        self.entries = status["entries"]
+        self.generation = status["generation"]
+        self.fine = True if status["fine"] else None
+        self.rows = _RowCache()
+        self.paths = _Column(self.rows, "path")
+        self.sizes = _Column(self.rows, "size")
+        self.exact = None
+        if status["exact"]:
+            raw = base64.b64decode(call(url, "/exact_sizes")["sizes"])
+            self.exact = _RemoteExact(self, np.frombuffer(raw, dtype="<u8"))
+
+    def __len__(self):
+        return self.entries
+
+    def hash_at(self, row):
+        return imagehash.hex_to_hash(self.rows[row]["phash"])
+
+    def _query(self, hashes, fines, threshold, fine_threshold=None, mode="nearest"):
+        """hashes 的元素为单个哈希，或 mode="variants" 时为 8 个方向的哈希列表。"""
+        def hexes(h):
+            return None if h is None else [str(x) for x in h] if isinstance(h, list) else str(h)
+
+        fines = fines if fines is not None else [None] * len(hashes)
+        payload = {"threshold": threshold, "fine_threshold": fine_threshold, "mode": mode,
+                   "queries": [{"phash": hexes(h), "fine": hexes(f)} for h, f in zip(hashes, fines)]}
+        return call(self.url, "/match", payload)["results"]
+
+    def match_batch(self, hashes, fines, threshold, fine_threshold=None, any_orientation=False):
+        """整批最近邻，返回 [(distance, path) 或 (None, None)]；细哈希阈值以服务端配置为准。
+
+        any_orientation=True 时每个元素为 8 个方向的哈希，返回 [(distance, path, 变换名)]。
+        """
+        if not len(hashes):
+            return []
+        if any_orientation:
+            return [(r["distance"], r["path"], r["orientation"]) if r else (None, None, None)
+                    for r in self._query(hashes, fines, threshold, fine_threshold, mode="variants")]
+        return [(r["distance"], r["path"]) if r else (None, None)
+                for r in self._query(hashes, fines, threshold, fine_threshold)]
+
+    def nearest_variants(self, hs, radius, fine_hs=None, fine_radius=None):
+        """与 HammingIndex.nearest_variants 相同，返回 (distance, path, 变体序号)。"""
+        d, path, name = self.match_batch([hs], [fine_hs], radius, fine_radius, any_orientation=True)[0]
+        return d, path, VARIANTS.index(name) if name is not None else None
+
+    def nearest(self, h, radius, fine_h=None, fine_radius=None):
+        return self.match_batch([h], [fine_h], radius, fine_radius)[0]
+
+    def largest_within(self, h, radius, fine_h=None, fine_radius=None):
+        r = self._query([h], [fine_h], radius, fine_radius, mode="largest")[0]
+        return (r["distance"], r["pixels"], r["path"]) if r else None
+
+    def batch_nearest(self, hashes, radius):
+        return self.match_batch(hashes, None, radius)
+
+
+def connect(index_path, url=None, timeout=CONNECT_TIMEOUT):
+    """服务在运行且加载的正是 index_path 时返回 RemoteIndex，否则 None。"""
+    url = url or server_url()
+    try:
+        status = call(url, "/status", timeout=timeout)
+        if not same_index(status["index"], index_path):
+            return None
+        return RemoteIndex(url, status)
+    except (OSError, ValueError, KeyError, ServerError):
+        return None
+
+
+def spawn_server(index_path, port=SERVER_PORT, log_path=SERVER_LOG):
+    """在后台启动常驻匹配服务（与当前进程脱离），输出写入 log_path，返回 Popen。"""
+    with open(log_path, "wb") as log:
+        kwargs = {"stdin": subprocess.DEVNULL, "stdout": log, "stderr": subprocess.STDOUT}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS
+        else:
+            kwargs["start_new_session"] = True
+        return subprocess.Popen([sys.executable, "-u", SERVER_SCRIPT, index_path, "--port", str(port)], **kwargs)
+
+
+def _log_tail(log_path, lines=1):
+    try:
+        with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+            return "".join(f.readlines()[-lines:]).strip()
+    except OSError:
+        return ""
+
+
+def start_server(index_path, port=SERVER_PORT, timeout=START_TIMEOUT, log_path=SERVER_LOG):
+    """确保常驻匹配服务在提供 index_path：返回 (状态, 说明)。
+
+    状态为 "running"（已在运行）、"started"（新启动并已就绪）、"loading"（进程仍在加载索引）；
+    端口被其它索引的服务占用、或服务进程启动后退出时抛出 ServerError，说明中附服务日志末尾。
+    """
+    url = server_url(port=port)
+    if connect(index_path, url) is not None:
+        return "running", url
+    try:
+        other = call(url, "/status", timeout=CONNECT_TIMEOUT)
+        raise ServerError(f"端口 {port} 已有常驻匹配服务在提供其它索引：{other.get('index')}")
+    except (OSError, ValueError):
+        pass  # 端口上没有服务
+    proc = spawn_server(index_path, port, log_path)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if connect(index_path, url) is not None:
+            return "started", url
+        if proc.poll() is not None:
+            raise ServerError(f"常驻匹配服务已退出（返回码 {proc.returncode}）：{_log_tail(log_path) or log_path}")
+        time.sleep(START_POLL)
+    return "loading", log_path
@@ -0,0 +1,555 @@
+import os
+import sys
+import json
+import pickle
+import time
+import queue
+import argparse
+import threading
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import imagehash
+
+from hash_search import HammingIndex, ShardedIndex, exact_key, load_cached_search_index, save_search_index
+from fast_hash import phash_file_cascade, VARIANTS, HASH_ALGORITHM
+from binary_index import BinaryIndex, BINARY_INDEX_EXT
+from fast_copy import CopyEngine, COPY_MODES, file_digest
+from metrics import Metrics, DISABLED
+from query_cache import QueryHashCache
+from index_store import IndexStore, StoreIndex, INDEX_STORE_EXT
+from shards import MANIFEST_EXT, load_manifest
+from match_client import RemoteIndex, connect
+
+# ========== 配置项 ==========
+HASH_SIZE = 8
+SIMILARITY_THRESHOLD = 5  # 阈值：距离 ≤ 5 视为匹配
+FINE_THRESHOLD = 64  # 第二阶段 256 位哈希的距离上限（约 25%）
+BATCH_MATCH = True  # 先计算整个文件夹的哈希，再用 NumPy 一次性批量比对
+EXACT_FAST_PATH = True  # 解码前先按 文件大小 + BLAKE2b 摘要 查找逐字节相同的原图
+QUERY_CACHE = True  # 低清图哈希缓存在输入文件夹的 .phash_cache.sqlite，重复运行不再解码
+PIPELINE_QUEUE_SIZE = 64  # 每个阶段允许积压的图片数
+MATCH_BATCH = 64  # 比对阶段每次最多合并的图片数
+IO_WORKERS = 4  # 复制线程数
+QUERY_EXTS = ('.jpg', '.jpeg', '.png')
+UNMATCHED_DIR = "未找到原图"
+REPORT_NAME = "整理日志.txt"
+METRICS_NAME = "整理指标.json"  # 启用指标时与整理日志放在一起
+ANY_ORIENTATION = False  # 同时尝试 8 种旋转 / 镜像，用于被转向或镜像过的低清图
+USE_SERVER = True  # 常驻匹配服务（match_server.py）正在提供同一索引时，直接向它查询而不在本进程加载
+STORE_LOOKUP = True  # .sqlite 索引库直接按分段列查询，不整表载入内存（关闭则载入为 HammingIndex 整批比对）
+
+
+# 精确命中时代替 (尺寸, 粗哈希, 细哈希)，尺寸与哈希取自索引记录
+ExactHit = namedtuple("ExactHit", "size hash row")
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+# ========== 索引加载 ==========
+
+def load_index(index_path, on_log=_noop, on_progress=_noop, in_memory=False):
+    """加载原图索引，返回检索结构（HammingIndex，超过 64 位时为 {ImageHash: path}）。
+
+    依次尝试：.shards.json 分片清单 / .phidx 二进制索引 / .sqlite 索引库 → .mih.pkl 检索缓存 → 旧版 .pkl → JSON。
+    分片清单返回 ShardedIndex，各分片分别加载、查询时分发。
+    .sqlite 在 STORE_LOOKUP 时返回直接查库的 StoreIndex；in_memory=True（如作为分片）时仍整表载入。
+    on_log(msg) 接收日志，on_progress(done, total) 接收进度。
+    索引中有旧版哈希算法生成的记录时给出提示（这些原图与按 EXIF 摆正的查询哈希可能对不上）。
+    """
+    index = _load_index(index_path, on_log, on_progress, in_memory)
+    if isinstance(index, (HammingIndex, StoreIndex)) and index.stale:
+        on_log(f"[WARN] {index_path} 中有 {index.stale} 条记录由旧版哈希算法生成（未按 EXIF 方向摆正），"
+               f"带方向标记的原图可能匹配不上；重新运行 build_image_index.py 增量构建即可更新。")
+    return index
+
+
+def _load_index(index_path, on_log, on_progress, in_memory=False):
+    if index_path.endswith(MANIFEST_EXT):
+        try:
+            return load_manifest(index_path, on_log, on_progress)
+        except Exception as e:
+            on_log(f"[ERROR] 分片清单加载失败: {e}")
+            return {}
+
+    if index_path.endswith(BINARY_INDEX_EXT):
+        # 二进制索引：mmap 打开并校验 CRC32，无需 JSON 解析与缓存
+        try:
+            index = BinaryIndex(index_path, verify=True).to_hamming_index()
+        except Exception as e:
+            on_log(f"[ERROR] 二进制索引加载失败: {e}")
+            return {}
+        on_progress(len(index), len(index))
+        on_log(f"二进制索引加载完成，共 {len(index)} 条记录。")
+        return index
+
+    if index_path.endswith(INDEX_STORE_EXT):
+        # SQLite 索引库：只读打开，构建进行中也可查询已提交的记录
+        try:
+            if STORE_LOOKUP and not in_memory:
+                index = StoreIndex(index_path)
+            else:
+                with IndexStore(index_path, readonly=True) as store:
+                    index = store.to_hamming_index()
+        except Exception as e:
+            on_log(f"[ERROR] 索引库加载失败: {e}")
+            return {}
+        on_progress(len(index), len(index))
+        on_log(f"索引库{'已打开' if isinstance(index, StoreIndex) else '加载完成'}，共 {len(index)} 条记录。")
+        return index
+
+    cached = load_cached_search_index(index_path)
+    if cached is not None:
+        on_progress(len(cached), len(cached))
+        on_log(f"检测到检索缓存，快速加载完成，共 {len(cached)} 条记录。")
+        return cached
+
+    pkl_path = index_path + ".pkl"
+    # 与检索缓存相同：JSON 已不在时直接使用 .pkl
+    if os.path.exists(pkl_path) and (not os.path.exists(index_path)
+                                     or os.path.getmtime(pkl_path) >= os.path.getmtime(index_path)):
+        on_log("检测到 .pkl 缓存，开始快速加载索引…")
+        try:
+            with open(pkl_path, 'rb') as f:
+                return _finish_index(index_path, pickle.load(f), on_log, on_progress)
+        except Exception as e:
+            on_log(f"[ERROR] pickle.load 失败: {e}")
+
+    on_log("未检测到缓存，开始从 JSON 加载索引…")
+    try:
+        with open(index_path, 'r', encoding='utf-8') as jf:
+            raw_data = json.load(jf)
+    except Exception as e:
+        on_log(f"[ERROR] JSON 加载失败: {e}")
+        return {}
+    if isinstance(raw_data, list):
+        items = [(item['phash'], item['path'], item.get('size') or (0, 0), item.get('phash_fine'), exact_key(item))
+                 for item in raw_data if 'phash' in item and 'path' in item]
+        stale = sum(1 for item in raw_data if 'phash' in item and item.get('algorithm') != HASH_ALGORITHM)
+    else:
+        items = [(h, p, (0, 0), None, (0, None)) for h, p in raw_data.items()]  # 字典格式不含尺寸、细哈希与摘要
+        stale = len(items)
+
+    total = len(items)
+    on_log(f"共 {total} 条哈希记录，转换中…")
+    pairs, sizes, fine, exact = [], [], [], []
+    for i, (hstr, path, size, fine_hex, key) in enumerate(items, start=1):
+        try:
+            int(hstr, 16)
+            pairs.append((hstr, path))
+            sizes.append(size)
+            fine.append(fine_hex)
+            exact.append(key)
+        except (TypeError, ValueError) as e:
+            on_log(f"[ERROR] 转换第{i}条失败: {(hstr, str(e))}")
+        if i % max(1, total // 10) == 0 or i == total:
+            on_progress(i, total)
+            on_log(f"  已转换 {i}/{total} ({int(i / total * 100)}%)")
+
+    try:
+        # 只有全部记录都带细哈希时才启用两级级联（旧索引增量重建后会补齐）
+        if not fine or None in fine or len(set(map(len, fine))) != 1:
+            fine = None
+        index = HammingIndex.from_hex_pairs(pairs, sizes, fine, exact)
+        index.stale = stale
+    except ValueError:
+        # 超过 64 位的哈希无法放入多索引结构，退回 {ImageHash: path} 线性比对
+        return {imagehash.hex_to_hash(h): p for h, p in pairs}
+    return _finish_index(index_path, index, on_log, on_progress)
+
+
+def open_index(index_path, on_log=_noop, on_progress=_noop, use_server=USE_SERVER):
+    """优先连接提供同一索引的常驻匹配服务，服务未运行时在本进程加载。"""
+    if use_server:
+        remote = connect(index_path)
+        if remote is not None:
+            on_progress(len(remote), len(remote))
+            on_log(f"已连接常驻匹配服务 {remote.url}，共 {len(remote)} 条记录，无需加载索引。")
+            return remote
+    return load_index(index_path, on_log, on_progress)
+
+
+def _finish_index(index_path, index, on_log, on_progress):
+    """把旧版 {ImageHash: path} 字典转成检索结构，并保存检索缓存。"""
+    if not isinstance(index, HammingIndex):
+        try:
+            index = HammingIndex.from_hash_dict(index)
+            index.stale = len(index)  # 旧版 .pkl 不含算法标记
+        except ValueError as e:
+            on_log(f"[ERROR] 检索结构构建失败，退回线性比对: {e}")
+            return index
+    if not len(index):
+        on_log("[ERROR] 哈希索引为空，检查 JSON 文件内容。")
+    elif save_search_index(index_path, index):
+        on_log("[DEBUG] 已保存检索缓存。")
+    on_progress(len(index), len(index))
+    on_log(f"索引就绪，共 {len(index)} 条记录。")
+    return index
+
+
+# ========== 匹配 ==========
+
+def hash_query(path, hash_size=HASH_SIZE, timings=None, cache=None, variants=False):
+    """计算低清图的 (尺寸, pHash, 256 位细哈希)，与建索引共用快速解码路径；给出 cache 时先查缓存。
+
+    variants=True 时两级哈希各为 8 种旋转 / 镜像的列表（由同一次解码的 DCT 系数变换得到）；
+    cache 需以相同的 variants 创建。
+    """
+    if cache is not None:
+        return cache.hash(path, timings)
+    return phash_file_cascade(path, hash_size=hash_size, timings=timings, variants=variants)
+
+
+def exact_lookup(index, path):
+    """精确查重快速路径：返回 (行号, 是否计算了摘要)，未命中时行号为 -1。
+
+    只有索引中存在同样大小的记录时才读取文件计算摘要，其余文件零额外开销。
+    """
+    exact = getattr(index, "exact", None)
+    if not EXACT_FAST_PATH or exact is None:
+        return -1, False
+    size = os.path.getsize(path)
+    if not exact.has_size(size):
+        return -1, False
+    return exact.lookup(size, file_digest(path)), True
+
+
+def find_best_match(low_hash, index, threshold=SIMILARITY_THRESHOLD, fine_hash=None):
+    """返回 (距离, 原图路径)；阈值内无匹配时路径为 None。
+
+    索引带细哈希且给出 fine_hash 时，先用粗哈希召回，再用细哈希重排并过滤。
+    """
+    if isinstance(index, (HammingIndex, ShardedIndex, StoreIndex, RemoteIndex)):
+        # 多索引检索：只校验阈值内的候选，不再全表扫描
+        return index.nearest(low_hash, threshold, fine_hash, FINE_THRESHOLD)
+    min_dist, best = None, None
+    for stored_hash, full_path in index.items():
+        if not isinstance(stored_hash, imagehash.ImageHash):
+            continue  # 跳过非哈希对象
+        d = stored_hash - low_hash
+        if min_dist is None or d < min_dist:
+            min_dist, best = d, full_path
+            if d == 0:
+                break
+    if min_dist is None or min_dist > threshold:
+        return min_dist, None
+    return min_dist, best
+
+
+def find_best_match_any(low_hashes, index, threshold=SIMILARITY_THRESHOLD, fine_hashes=None):
+    """方向容错比对：low_hashes / fine_hashes 为 VARIANTS 顺序的 8 个哈希。
+
+    返回 (距离, 原图路径, 变换名)；多索引结构把 8 个变体合成一次检索。
+    """
+    if isinstance(index, (HammingIndex, ShardedIndex, StoreIndex, RemoteIndex)):
+        d, path, v = index.nearest_variants(low_hashes, threshold, fine_hashes, FINE_THRESHOLD)
+    else:
+        found = [find_best_match(h, index, threshold) + (v,) for v, h in enumerate(low_hashes)]
+        found = [f for f in found if f[1] is not None]
+        d, path, v = min(found) if found else (None, None, None)
+    return d, path, VARIANTS[v] if v is not None else None
+
+
+def list_queries(input_dir):
+    return [f for f in os.listdir(input_dir) if f.lower().endswith(QUERY_EXTS)]
+
+
+def match_hashes(index, hashes, fine, threshold, any_orientation=False):
+    """对一批哈希做比对，返回 [(距离, 路径)]；fine 为与 hashes 一一对应的细哈希（元素可为 None）。
+
+    any_orientation=True 时每个元素为 8 个方向的哈希列表，返回 [(距离, 路径, 变换名)]。
+    """
+    if isinstance(index, RemoteIndex):
+        return index.match_batch(hashes, fine, threshold, FINE_THRESHOLD, any_orientation)  # 整批一次请求
+    if any_orientation:
+        return [find_best_match_any(h, index, threshold, f) for h, f in zip(hashes, fine)]
+    if BATCH_MATCH and isinstance(index, (HammingIndex, ShardedIndex)) and index.bits == 64:
+        # 整批召回阈值内的候选，索引带细哈希时只对这些候选做第二阶段重排
+        try:
+            return index.batch_nearest(hashes, threshold, fine, FINE_THRESHOLD)
+        except Exception:
+            pass  # 退回逐张比对
+    return [find_best_match(h, index, threshold, f) for h, f in zip(hashes, fine)]
+
+
+def _match_batch(index, items, threshold, any_orientation=False):
+    """对一小批已哈希的图片做比对，返回 [(距离, 路径)] 或 [(距离, 路径, 变换名)]。"""
+    return match_hashes(index, [result[1] for _, _, result in items], [result[2] for _, _, result in items], threshold,
+                        any_orientation)
+
+
+def _run_pipeline(files, input_dir, output_dir, index, threshold, workers, io_workers, copier, emit,
+                  metrics=DISABLED, cache=None, any_orientation=False):
+    """三段流水线：解码/哈希线程池 → 比对线程 → 复制线程池，阶段之间用有界队列衔接。
+
+    各阶段乱序完成，emit(i, record) 在主线程按输入顺序调用。
+    哈希阶段先走精确查重快速路径，命中的图片不解码、不参与比对。
+    any_orientation=True 时每张图带 8 个方向的哈希，record 的 orientation 记录命中的变换。
+    返回快速路径统计 {"hits", "misses", "digests"}。
+    metrics 启用时记录 exact / decode / hash / match / copy 各阶段耗时。
+    """
+    unmatched_dir = os.path.join(output_dir, UNMATCHED_DIR)
+    hashed_q = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    done_q = queue.Queue()
+    hash_slots = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE)
+    io_slots = threading.BoundedSemaphore(PIPELINE_QUEUE_SIZE)
+    exact_stats = Counter(hits=0, misses=0, digests=0)
+    stats_lock = threading.Lock()
+
+    def hash_one(i, fname):
+        path = os.path.join(input_dir, fname)
+        timings = {} if metrics.enabled else None
+        try:
+            t0 = time.perf_counter()
+            row, digested = exact_lookup(index, path)
+            if timings is not None:
+                timings["exact"] = time.perf_counter() - t0
+                timings["bytes"] = os.path.getsize(path)
+            if row >= 0:
+                size = tuple(int(x) for x in index.sizes[row]) if index.sizes is not None else (0, 0)
+                result = ExactHit(size, index.hash_at(row), row)
+            else:
+                result = hash_query(path, timings=timings, cache=cache, variants=any_orientation)
+            with stats_lock:
+                exact_stats["hits" if row >= 0 else "misses"] += 1
+                exact_stats["digests"] += digested
+        except Exception as e:
+            result = e
+        metrics.add_timings(timings, fname)
+        hashed_q.put((i, fname, result))
+        hash_slots.release()
+
+    def feed():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for i, fname in enumerate(files):
+                    hash_slots.acquire()
+                    pool.submit(hash_one, i, fname)
+        finally:
+            hashed_q.put(None)  # 无论是否出错都通知比对阶段结束
+
+    def copy_one(i, fname, result, dist, match, orientation=None):
+        record = {"file": fname, "status": "error", "match": None, "distance": dist}
+        try:
+            if isinstance(result, Exception):
+                raise result
+            (width, height), low_hash, _ = result
+            if isinstance(low_hash, list):
+                low_hash = low_hash[0]  # 方向容错模式：记录原方向的哈希
+            record.update(hash=str(low_hash), size=[width, height], exact=isinstance(result, ExactHit))
+            if match and orientation not in (None, "identity"):
+                record["orientation"] = orientation
+            t0 = time.perf_counter()
+            if match:
+                copier.copy(match, os.path.join(output_dir, fname))
+                record.update(status="matched", match=match)
+            else:
+                copier.copy(os.path.join(input_dir, fname), os.path.join(unmatched_dir, fname))
+                record.update(status="unmatched")
+            metrics.add("copy", time.perf_counter() - t0, fname)
+        except Exception as e:
+            record["error"] = str(e)
+        done_q.put((i, record))
+        io_slots.release()
+
+    def match_stage():
+        try:
+            with ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+                finished = False
+                while not finished:
+                    # 取一项（阻塞），再顺带取出队列里已就绪的项，凑成一小批比对
+                    items = [hashed_q.get()]
+                    while items[-1] is not None and len(items) < MATCH_BATCH:
+                        try:
+                            items.append(hashed_q.get_nowait())
+                        except queue.Empty:
+                            break
+                    if items[-1] is None:
+                        finished = True
+                        items.pop()
+                    ok = [it for it in items if not isinstance(it[2], (Exception, ExactHit))]
+                    t0 = time.perf_counter()
+                    try:
+                        found = _match_batch(index, ok, threshold, any_orientation) if ok else []
+                    except Exception as e:
+                        # 整批比对失败（如常驻服务中途停止）：本批每张图记为错误，继续处理后续批次
+                        found = [e] * len(ok)
+                    matches = dict(zip((it[0] for it in ok), found))
+                    if ok and metrics.enabled:
+                        share = (time.perf_counter() - t0) / len(ok)  # 批量比对的耗时平摊到每张图
+                        for _, fname, _ in ok:
+                            metrics.add("match", share, fname)
+                    for i, _, result in items:
+                        if isinstance(result, ExactHit):
+                            matches[i] = (0, index.paths[result.row])
+                    for i, fname, result in items:
+                        found = matches.get(i, (None, None))
+                        if isinstance(found, Exception):
+                            result, found = found, (None, None)
+                        dist, match, *orientation = found
+                        io_slots.acquire()
+                        io_pool.submit(copy_one, i, fname, result, dist, match, *orientation)
+        finally:
+            done_q.put(None)  # 保证重排循环总能结束
+
+    threading.Thread(target=feed, daemon=True).start()
+    threading.Thread(target=match_stage, daemon=True).start()
+
+    # 重排缓冲：按输入顺序输出
+    pending, next_i = {}, 0
+    while True:
+        item = done_q.get()
+        if item is None:
+            break
+        pending[item[0]] = item[1]
+        while next_i in pending:
+            emit(next_i, pending.pop(next_i))
+            next_i += 1
+    return dict(exact_stats)
+
+
+def match_folder(index, input_dir, output_dir, threshold=SIMILARITY_THRESHOLD, workers=None,
+                 on_log=_noop, on_progress=_noop, on_result=_noop, io_workers=IO_WORKERS, copy_mode="copy",
+                 debug=False, metrics=DISABLED, query_cache=QUERY_CACHE, any_orientation=ANY_ORIENTATION):
+    """匹配 input_dir 下的全部低清图，结果复制到 output_dir，返回汇总字典。
+
+    workers 为解码/哈希线程数，io_workers 为复制线程数，copy_mode 见 fast_copy.CopyEngine。
+    debug=False 时不生成逐张的 [DEBUG] 日志。
+    metrics 启用时在 output_dir 写出 整理指标.json（开启 profile 时另有 .prof）。
+    query_cache=True 时低清图哈希读写 input_dir 下的持久缓存。
+    any_orientation=True 时容忍 90°/180°/270° 旋转与镜像，汇总的 orientation.rotated 为经变换才匹配上的张数。
+    每张图处理完按输入顺序调用 on_result(record)，record 含 file/status/match/distance/hash/size。
+    """
+    unmatched_dir = os.path.join(output_dir, UNMATCHED_DIR)
+    os.makedirs(unmatched_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    files = list_queries(input_dir)
+    total = len(files)
+    on_log(f"发现 {total} 张图片待匹配")
+
+    counts = {"matched": 0, "unmatched": 0, "errors": 0, "rotated": 0}
+
+    def emit(i, record):
+        metrics.distance(record["distance"])
+        on_progress(i + 1, total)
+        on_log(f"  处理 {i + 1}/{total}：{record['file']} …")
+        if debug and "size" in record:
+            width, height = record["size"]
+            on_log(f"[DEBUG] 图像尺寸: {width}x{height}，哈希: {record['hash']}")
+            on_log(f"[DEBUG] 当前比对图与最佳匹配的距离: {record['distance']}")
+        if record["status"] == "matched":
+            counts["matched"] += 1
+            if record.get("orientation"):
+                counts["rotated"] += 1
+                on_log(f"匹配成功（方向变换：{record['orientation']}）")
+            else:
+                on_log("匹配成功（逐字节相同）" if record.get("exact") else "匹配成功")
+        elif record["status"] == "unmatched":
+            counts["unmatched"] += 1
+            on_log("未匹配，已复制低清图")
+        else:
+            counts["unmatched"] += 1
+            counts["errors"] += 1
+            on_log(f"[ERROR] 处理失败：{record.get('error')}")
+        on_result(record)
+
+    copier = CopyEngine(copy_mode, workers=io_workers)
+    metrics.start()
+    cache = QueryHashCache(input_dir, HASH_SIZE, variants=any_orientation) if query_cache else None
+    try:
+        exact = _run_pipeline(files, input_dir, output_dir, index, threshold, workers, io_workers, copier, emit,
+                              metrics, cache, any_orientation)
+    finally:
+        if cache is not None:
+            cache.close()
+    cache_stats = cache.stats() if cache is not None else {"enabled": False, "hits": 0, "misses": 0}
+    exact["enabled"] = EXACT_FAST_PATH and getattr(index, "exact", None) is not None
+
+    matched, unmatched = counts["matched"], counts["unmatched"]
+    on_log(f"完成：匹配 {matched} 张（其中逐字节相同 {exact['hits']} 张），未匹配 {unmatched} 张。")
+    try:
+        with open(os.path.join(output_dir, REPORT_NAME), 'w', encoding='utf-8') as lf:
+            lf.write(f"匹配: {matched}\n未匹: {unmatched}\n")
+            if exact["enabled"]:
+                lf.write(f"精确命中: {exact['hits']}，未命中: {exact['misses']}（计算摘要 {exact['digests']} 次）\n")
+            else:
+                lf.write("精确命中: 索引不含内容摘要，未启用\n")
+            if cache_stats["enabled"]:
+                lf.write(f"哈希缓存: 命中 {cache_stats['hits']}，新计算 {cache_stats['misses']}\n")
+            if any_orientation:
+                lf.write(f"方向容错: 经旋转 / 镜像匹配 {counts['rotated']} 张\n")
+            lf.write(copier.summary_text())
+        on_log("整理日志已保存。")
+    except Exception as e:
+        on_log(f"[ERROR] 日志保存失败：{e}")
+
+    summary = {"total": total, "matched": matched, "unmatched": unmatched, "errors": counts["errors"],
+               "exact": exact, "cache": cache_stats, "copy": copier.summary(),
+               "orientation": {"enabled": any_orientation, "rotated": counts["rotated"]}}
+    if metrics.enabled:
+        metrics_path = os.path.join(output_dir, METRICS_NAME)
+        metrics.stop(os.path.splitext(metrics_path)[0] + ".prof")
+        metrics.written(copier.bytes)
+        metrics.extra["run"] = dict(summary)
+        try:
+            metrics.write_json(metrics_path)
+            summary["metrics_path"] = metrics_path
+            on_log(f"性能指标已保存：{metrics_path}")
+        except Exception as e:
+            on_log(f"[ERROR] 指标保存失败：{e}")
+    return summary
+
+
+def run(index_path, input_dir, output_dir, threshold=SIMILARITY_THRESHOLD, workers=None,
+        on_log=_noop, on_progress=_noop, on_result=_noop, io_workers=IO_WORKERS, copy_mode="copy",
+        debug=False, metrics=DISABLED, query_cache=QUERY_CACHE, use_server=USE_SERVER, any_orientation=ANY_ORIENTATION):
+    """加载索引（或连接常驻匹配服务）并匹配整个文件夹。"""
+    t0 = time.perf_counter()
+    index = open_index(index_path, on_log, on_progress, use_server)
+    metrics.add("load_index", time.perf_counter() - t0)
+    return match_folder(index, input_dir, output_dir, threshold, workers, on_log, on_progress, on_result,
+                        io_workers, copy_mode, debug, metrics, query_cache, any_orientation)
+
+
+# ========== 命令行 ==========
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="低清图 → 高清原图 批量匹配（无界面）")
+    parser.add_argument("index", help="原图索引（JSON、.phidx、.sqlite 或 .shards.json 清单）")
+    parser.add_argument("input_dir", help="低清图文件夹")
+    parser.add_argument("output_dir", help="输出文件夹")
+    parser.add_argument("--threshold", type=int, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--workers", type=int, default=None, help="解码/哈希线程数")
+    parser.add_argument("--io-workers", type=int, default=IO_WORKERS, help="复制线程数")
+    parser.add_argument("--copy-mode", choices=COPY_MODES, default="copy", help="输出方式：复制 / 硬链接 / 符号链接")
+    parser.add_argument("--quiet", action="store_true", help="不向 stderr 输出日志")
+    parser.add_argument("--debug", action="store_true", help="输出逐张的调试日志")
+    parser.add_argument("--metrics", action="store_true", help=f"记录分阶段耗时，写入输出文件夹的 {METRICS_NAME}")
+    parser.add_argument("--profile", action="store_true", help="同时用 cProfile 采样（隐含 --metrics）")
+    parser.add_argument("--no-cache", action="store_true", help="不读写低清图哈希缓存")
+    parser.add_argument("--no-server", action="store_true", help="不连接常驻匹配服务，在本进程加载索引")
+    parser.add_argument("--any-orientation", action="store_true", help="同时尝试 8 种旋转 / 镜像方向")
+    args = parser.parse_args(argv)
+    metrics = Metrics(profile=args.profile) if args.metrics or args.profile else DISABLED
+
+    def on_log(msg):
+        if not args.quiet:
+            print(msg, file=sys.stderr, flush=True)
+
+    def on_result(record):
+        # 每张图一行 JSON，便于脚本消费
+        print(json.dumps(record, ensure_ascii=False), flush=True)
+
+    summary = run(args.index, args.input_dir, args.output_dir, args.threshold, args.workers,
+                  on_log=on_log, on_result=on_result, io_workers=args.io_workers, copy_mode=args.copy_mode, debug=args.debug,
+                  metrics=metrics, query_cache=not args.no_cache, use_server=not args.no_server,
+                  any_orientation=args.any_orientation)
+    print(json.dumps({"summary": summary}, ensure_ascii=False), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+
+from hash_search import HammingIndex, ShardedIndex
+from match_engine import load_index, match_hashes, SIMILARITY_THRESHOLD, FINE_THRESHOLD
+from match_client import SERVER_HOST, SERVER_PORT
+from shards import MANIFEST_EXT, read_manifest
+from index_store import StoreIndex, INDEX_STORE_EXT
+
+# ========== 配置 ==========
+RELOAD_POLL = 2.0  # 检查索引文件是否变化的间隔（秒）
+MAX_QUERIES = 10_000  # 单次请求最多的查询数
+
+
+def _signature(path):
+    """(mtime_ns, 大小)；SQLite 索引库连同 -wal 文件一起比较。"""
+    sig = []
+    for p in (path, path + "-wal") if path.endswith(INDEX_STORE_EXT) else (path,):
+        try:
+            st = os.stat(p)
+            sig.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            sig.append(None)
+    return tuple(sig)
+
+
+def _exact_sizes(index):
+    """索引中全部精确查重记录的文件大小（去重、升序）。"""
+    shards = index.shards if isinstance(index, ShardedIndex) else [index]
+    parts = [s.exact.file_sizes for s in shards if getattr(s, "exact", None) is not None]
+    if not parts:
+        return np.zeros(0, dtype=np.uint64)
+    return np.unique(np.concatenate(parts).astype(np.uint64))
+
+
+# ========== 常驻索引 ==========
+
+class IndexHolder:
+    """常驻内存的检索结构；后台线程轮询文件变化并原地替换。
+
+    分片清单只重新加载发生变化的分片，其余分片保留；加载失败时继续使用旧索引，下次轮询再试。
+    查询线程拿到的是某一时刻的 index 引用，替换不影响进行中的查询。
+    """
+
+    def __init__(self, index_path, on_log=print):
+        self.index_path = os.path.realpath(index_path)
+        self.on_log = on_log
+        self.manifest = self.index_path.endswith(MANIFEST_EXT)
+        self.index = None
+        self.generation = 0
+        self.loaded_at = None
+        self.exact_sizes = None
+        self._sigs = {}
+        self._shards = {}  # 分片路径 -> (签名, HammingIndex)
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _load(self, path, shard=False):
+        index = load_index(path, self.on_log, in_memory=shard)
+        if not isinstance(index, (HammingIndex, ShardedIndex, StoreIndex)):
+            raise ValueError(f"索引无法加载或不支持多索引检索：{path}")
+        return index
+
+    def reload(self, force=False):
+        """检查文件签名，有变化（或 force）时重新加载，返回是否替换了索引。"""
+        with self._lock:
+            if not self.manifest:
+                sig = _signature(self.index_path)
+                if not force and self.index is not None and sig == self._sigs.get(self.index_path):
+                    return False
+                index = self._load(self.index_path)
+                self._sigs = {self.index_path: sig}
+            else:
+                sig = _signature(self.index_path)
+                listed = read_manifest(self.index_path)
+                shards, remaps, names, changed = [], [], [], force or sig != self._sigs.get(self.index_path)
+                kept = {}
+                for path, name, remap in listed:
+                    shard_sig = _signature(path)
+                    cached = self._shards.get(path)
+                    if cached is not None and cached[0] == shard_sig and not force:
+                        shard = cached[1]
+                    else:
+                        self.on_log(f"加载分片：{name}")
+                        shard = self._load(path, shard=True)
+                        changed = True
+                    kept[path] = (shard_sig, shard)
+                    shards.append(shard)
+                    remaps.append(remap)
+                    names.append(name)
+                changed = changed or set(kept) != set(self._shards)
+                if not changed and self.index is not None:
+                    return False
+                index = ShardedIndex(shards, remaps, names)
+                self._shards = kept
+                self._sigs = {self.index_path: sig}
+            self.index = index
+            self.exact_sizes = _exact_sizes(index)
+            self.generation += 1
+            self.loaded_at = time.time()
+        self.on_log(f"索引就绪（第 {self.generation} 版），共 {len(index)} 条记录。")
+        return True
+
+    def watch(self, interval=RELOAD_POLL):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload()
+                except Exception as e:
+                    self.on_log(f"[ERROR] 重新加载失败，继续使用旧索引：{e}")
+        threading.Thread(target=loop, daemon=True).start()
+
+    def status(self):
+        index = self.index
+        shards = []
+        if isinstance(index, ShardedIndex):
+            shards = [{"name": n, "entries": len(s)} for n, s in zip(index.names, index.shards)]
+        return {"index": self.index_path, "entries": len(index), "generation": self.generation,
+                "loaded_at": self.loaded_at, "bits": index.bits, "fine": index.fine is not None,
+                "exact": index.exact is not None, "shards": shards}
+
+
+# ========== 请求处理 ==========
+
+def handle_match(index, body):
+    queries = body.get("queries") or []
+    if len(queries) > MAX_QUERIES:
+        raise ValueError(f"单次最多 {MAX_QUERIES} 条查询")
+    threshold = int(body.get("threshold", SIMILARITY_THRESHOLD))
+    hashes = [q["phash"] for q in queries]
+    fines = [q.get("fine") for q in queries]
+    if body.get("mode") == "largest":
+        fine_threshold = body.get("fine_threshold", FINE_THRESHOLD)
+        results = []
+        for h, f in zip(hashes, fines):
+            best = index.largest_within(h, threshold, f, fine_threshold)
+            results.append({"distance": best[0], "pixels": best[1], "path": best[2]} if best else None)
+        return results
+    if body.get("mode") == "variants":
+        # 每条查询为 8 个方向的哈希，一次检索
+        return [{"distance": d, "path": p, "orientation": v} if p is not None else None
+                for d, p, v in match_hashes(index, hashes, fines, threshold, any_orientation=True)]
+    return [{"distance": d, "path": p} if p is not None else None
+            for d, p in match_hashes(index, hashes, fines, threshold)]
+
+
+def handle_exact(index, body):
+    results = []
+    for item in body.get("items") or []:
+        row = index.exact.lookup(int(item["size"]), item["digest"]) if index.exact is not None else -1
+        if row < 0:
+            results.append(None)
+            continue
+        w, h = (int(x) for x in index.sizes[row]) if index.sizes is not None else (0, 0)
+        results.append({"path": index.paths[row], "size": [w, h], "phash": str(index.hash_at(row))})
+    return results
+
+
+def make_handler(holder):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, payload):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, holder.status())
+            elif self.path == "/exact_sizes":
+                sizes = holder.exact_sizes.astype("<u8").tobytes()
+                self._reply(200, {"generation": holder.generation, "sizes": base64.b64encode(sizes).decode("ascii")})
+            else:
+                self._reply(404, {"error": self.path})
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                index = holder.index
+                if self.path == "/match":
+                    self._reply(200, {"generation": holder.generation, "results": handle_match(index, body)})
+                elif self.path == "/exact":
+                    self._reply(200, {"generation": holder.generation, "results": handle_exact(index, body)})
+                elif self.path == "/reload":
+                    holder.reload(force=bool(body.get("force")))
+                    self._reply(200, holder.status())
+                else:
+                    self._reply(404, {"error": self.path})
+            except Exception as e:
+                self._reply(400, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            pass  # 不逐条打印请求
+
+    return Handler
+
+
+def serve(index_path, host=SERVER_HOST, port=SERVER_PORT, poll=RELOAD_POLL, on_log=print):
+    holder = IndexHolder(index_path, on_log)
+    holder.watch(poll)
+    server = ThreadingHTTPServer((host, port), make_handler(holder))
+    server.daemon_threads = True
+    on_log(f"常驻匹配服务已启动：http://{host}:{port}  索引 {holder.index_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻匹配服务：索引只加载一次，供 file.py / fileintegrate.py / match_engine.py 查询")
+    parser.add_argument("index", help="原图索引（JSON、.phidx、.sqlite 或 .shards.json 清单）")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--poll", type=float, default=RELOAD_POLL, help="检查索引文件变化的间隔（秒）")
+    args = parser.parse_args()
+    if not os.path.exists(args.index):
+        sys.exit(f"找不到索引：{args.index}")
+    serve(args.index, args.host, args.port, args.poll)
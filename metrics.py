@@ -0,0 +1,165 @@
+import sys
+import json
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# ========== 配置 ==========
+SLOWEST_N = 10
+PROFILE_TOP = 30  # cProfile 报告保留的函数行数
+METRICS_SUFFIX = ".metrics.json"
+
+
+class Metrics:
+    """分阶段计时与统计，线程安全。
+
+    add(stage, seconds, path) 记录一次阶段耗时；per-file 总耗时用于找出最慢的文件。
+    enabled=False 时各方法直接返回，流水线里不需要判断开关。
+    profile=True 时 start()/stop() 之间启用 cProfile：调用 start() 的线程之外，
+    之后新启动的线程（流水线的线程池等）各用一个 profiler，stop() 时合并，报告写入 summary 与 .prof 文件。
+    """
+
+    def __init__(self, enabled=True, slowest=SLOWEST_N, profile=False):
+        self.enabled = enabled
+        self.slowest_n = slowest
+        self.profile = profile and enabled
+        self.stages = defaultdict(list)
+        self.per_file = defaultdict(float)
+        self.distances = Counter()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.extra = {}
+        self._lock = threading.Lock()
+        self._profiler = None
+        self._thread_profilers = []
+        self._profile_text = None
+
+    # ---------- 记录 ----------
+
+    def add(self, stage, seconds, path=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.stages[stage].append(seconds)
+            if path is not None:
+                self.per_file[path] += seconds
+
+    def add_timings(self, timings, path=None):
+        """合并 {阶段: 秒} 字典（如子进程带回的计时）；"bytes" 键计入读取字节数。"""
+        if not self.enabled or not timings:
+            return
+        with self._lock:
+            for stage, seconds in timings.items():
+                if stage == "bytes":
+                    self.bytes_read += seconds
+                    continue
+                self.stages[stage].append(seconds)
+                if path is not None:
+                    self.per_file[path] += seconds
+
+    def written(self, nbytes):
+        if self.enabled:
+            with self._lock:
+                self.bytes_written += nbytes
+
+    def distance(self, d):
+        if self.enabled and d is not None:
+            with self._lock:
+                self.distances[int(d)] += 1
+
+    # ---------- cProfile ----------
+
+    def start(self):
+        if self.profile and self._profiler is None:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            if sys.version_info < (3, 12):
+                # 3.12 起 cProfile 基于 sys.monitoring，一个 profiler 即覆盖全部线程
+                threading.setprofile(self._profile_thread)
+
+    def _profile_thread(self, frame, event, arg):
+        """新线程的第一个事件：换成该线程自己的 profiler。"""
+        import cProfile
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        with self._lock:
+            if self._profiler is None:
+                return  # 已经 stop()
+            self._thread_profilers.append(profiler)
+        profiler.enable()
+
+    def stop(self, prof_path=None):
+        if self._profiler is None:
+            return
+        import io
+        import pstats
+        threading.setprofile(None)
+        self._profiler.disable()
+        with self._lock:
+            profilers, self._thread_profilers = self._thread_profilers, []
+            main, self._profiler = self._profiler, None
+        stats = pstats.Stats(main)
+        for profiler in profilers:
+            try:
+                stats.add(profiler)
+            except TypeError:
+                continue  # 线程里没有记录到任何调用
+        if prof_path:
+            stats.dump_stats(prof_path)
+        buf = io.StringIO()
+        stats.stream = buf
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP)
+        self._profile_text = buf.getvalue()
+
+    # ---------- 汇总 ----------
+
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for stage, samples in self.stages.items():
+                arr = np.asarray(samples, dtype=np.float64)
+                stages[stage] = {
+                    "count": int(len(arr)),
+                    "total": float(arr.sum()),
+                    "p50": float(np.percentile(arr, 50)),
+                    "p95": float(np.percentile(arr, 95)),
+                    "max": float(arr.max()),
+                }
+            slowest = heapq.nlargest(self.slowest_n, self.per_file.items(), key=lambda kv: kv[1])
+            result = {
+                "stages": stages,
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+                "slowest_files": [{"file": f, "seconds": s} for f, s in slowest],
+                "distance_histogram": {str(d): n for d, n in sorted(self.distances.items())},
+            }
+        result.update(self.extra)
+        if self._profile_text:
+            result["profile"] = self._profile_text
+        return result
+
+    def summary_text(self):
+        """给界面与日志看的简短汇总。"""
+        s = self.summary()
+        lines = ["阶段        次数    合计(s)   p50(ms)   p95(ms)   max(ms)"]
+        for stage, st in sorted(s["stages"].items(), key=lambda kv: -kv[1]["total"]):
+            lines.append(f"{stage:<10}{st['count']:>6}{st['total']:>10.2f}{st['p50'] * 1e3:>10.1f}"
+                         f"{st['p95'] * 1e3:>10.1f}{st['max'] * 1e3:>10.1f}")
+        lines.append(f"读取 {s['bytes_read'] / (1 << 20):.1f} MB，写入 {s['bytes_written'] / (1 << 20):.1f} MB")
+        if s["distance_histogram"]:
+            lines.append("距离分布: " + "，".join(f"{d}:{n}" for d, n in s["distance_histogram"].items()))
+        if s["slowest_files"]:
+            lines.append("最慢文件:")
+            lines.extend(f"  {f['seconds'] * 1e3:.1f} ms  {f['file']}" for f in s["slowest_files"][:5])
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+
+# 关闭状态的共享实例
+DISABLED = Metrics(enabled=False)
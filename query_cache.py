@@ -0,0 +1,151 @@
+import os
+import time
+import sqlite3
+import threading
+
+import imagehash
+
+from fast_hash import phash_file_cascade, FINE_HASH_SIZE, VARIANTS
+
+# ========== 配置 ==========
+CACHE_NAME = ".phash_cache.sqlite"  # 放在低清图文件夹内
+MAX_ENTRIES = 200_000  # 超出后按最近使用时间淘汰
+ALGORITHM = f"phash-cascade-exif/{FINE_HASH_SIZE}"  # 哈希算法或细哈希尺寸变化时旧缓存自动失效
+VARIANTS_ALGORITHM = f"phash-dihedral-exif/{FINE_HASH_SIZE}"  # 8 种方向的哈希依次拼接存放
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_hash (
+    name      TEXT    NOT NULL,
+    file_size INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    algorithm TEXT    NOT NULL,
+    hash_size INTEGER NOT NULL,
+    width     INTEGER NOT NULL,
+    height    INTEGER NOT NULL,
+    phash     TEXT    NOT NULL,
+    phash_fine TEXT   NOT NULL,
+    last_used REAL    NOT NULL,
+    PRIMARY KEY (name, file_size, mtime_ns, algorithm, hash_size)
+);
+CREATE INDEX IF NOT EXISTS query_hash_last_used ON query_hash (last_used);
+"""
+
+
+def _split_hashes(joined):
+    """拼接存放的 8 个十六进制哈希 -> [ImageHash]。"""
+    width = len(joined) // len(VARIANTS)
+    return [imagehash.hex_to_hash(joined[i:i + width]) for i in range(0, len(joined), width)]
+
+
+class QueryHashCache:
+    """低清图哈希的持久缓存，键为 (文件名, 大小, mtime, 算法, hash_size)。
+
+    打开时把本算法的记录整表读入内存，查询不再访问磁盘；
+    新算出的哈希与命中记录的使用时间在 close() 时一次事务写回，并按 LRU 淘汰超出 max_entries 的记录。
+    多个线程可同时调用 hash()。文件夹不可写时自动退化为不缓存。
+    variants=True 时缓存 8 种旋转 / 镜像的哈希（见 fast_hash.VARIANTS），与单方向的记录互不干扰。
+    """
+
+    def __init__(self, folder, hash_size=8, max_entries=MAX_ENTRIES, path=None, variants=False):
+        self.folder = folder
+        self.hash_size = hash_size
+        self.variants = variants
+        self.algorithm = VARIANTS_ALGORITHM if variants else ALGORITHM
+        self.max_entries = max_entries
+        self.path = path or os.path.join(folder, CACHE_NAME)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._new = {}
+        self._touched = set()
+        self._conn = None
+        try:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(SCHEMA)
+            rows = self._conn.execute(
+                "SELECT name, file_size, mtime_ns, width, height, phash, phash_fine FROM query_hash "
+                "WHERE algorithm = ? AND hash_size = ?", (self.algorithm, hash_size))
+            for name, file_size, mtime_ns, width, height, phash, fine in rows:
+                self._entries[(name, file_size, mtime_ns)] = ((width, height), phash, fine)
+        except sqlite3.Error:
+            # 只读目录或损坏的缓存：关闭已打开的连接，本次不缓存
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._entries = {}
+        self.enabled = self._conn is not None
+
+    def _key(self, path, st):
+        return os.path.relpath(path, self.folder), st.st_size, st.st_mtime_ns
+
+    def get(self, path, st=None):
+        """命中时返回 (尺寸, 粗哈希, 细哈希)，否则 None。"""
+        key = self._key(path, st or os.stat(path))
+        with self._lock:
+            found = self._entries.get(key)
+            if found is None:
+                return None
+            self._touched.add(key)
+        size, phash, fine = found
+        if self.variants:
+            return size, _split_hashes(phash), _split_hashes(fine)
+        return size, imagehash.hex_to_hash(phash), imagehash.hex_to_hash(fine)
+
+    def put(self, path, st, result):
+        size, coarse, fine = result
+        if self.variants:
+            coarse, fine = "".join(map(str, coarse)), "".join(map(str, fine))
+        key = self._key(path, st)
+        with self._lock:
+            self._entries[key] = self._new[key] = (tuple(size), str(coarse), str(fine))
+
+    def hash(self, path, timings=None):
+        """带缓存的 phash_file_cascade，返回 (尺寸, 粗哈希, 细哈希)。"""
+        st = os.stat(path)
+        found = self.get(path, st)
+        if found is not None:
+            with self._lock:
+                self.hits += 1
+            return found
+        result = phash_file_cascade(path, hash_size=self.hash_size, timings=timings, variants=self.variants)
+        with self._lock:
+            self.misses += 1
+        self.put(path, st, result)
+        return result
+
+    def stats(self):
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._conn is None:
+            return
+        now = time.time()
+        with self._lock:
+            new, touched = self._new, self._touched - set(self._new)
+            self._new, self._touched = {}, set()
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO query_hash VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(name, file_size, mtime_ns, self.algorithm, self.hash_size, w, h, phash, fine, now)
+                     for (name, file_size, mtime_ns), ((w, h), phash, fine) in new.items()])
+                self._conn.executemany(
+                    "UPDATE query_hash SET last_used = ? WHERE name = ? AND file_size = ? AND mtime_ns = ? "
+                    "AND algorithm = ? AND hash_size = ?",
+                    [(now, *key, self.algorithm, self.hash_size) for key in touched])
+                # LRU：只保留最近使用的 max_entries 条
+                self._conn.execute(
+                    "DELETE FROM query_hash WHERE rowid IN (SELECT rowid FROM query_hash "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        except sqlite3.Error:
+            pass  # 写回失败只影响下次运行的命中率
+        finally:
+            self._conn.close()
+            self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,279 @@
+import os
+import re
+import sys
+import json
+import socket
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from hash_search import ShardedIndex, remap_path
+from binary_index import BINARY_INDEX_EXT, BinaryIndex, write_binary_index, load_json_entries
+from index_store import IndexStore, INDEX_STORE_EXT, STORE_BATCH
+
+# ========== 配置 ==========
+SHARD_META_SUFFIX = ".shard.json"  # 分片元数据，放在分片索引旁：<索引>.shard.json
+MANIFEST_EXT = ".shards.json"  # 分片清单，match_engine / file.py 可直接加载
+SHARD_FORMAT = 1
+SHARD_PARALLEL = 2  # 同时构建的分片数（哈希进程数在同时构建的分片之间平分）
+ROOT_SHARD = "root"  # 拆分顶层目录时，根目录下散放文件所在分片的后缀
+
+
+def shard_meta_path(index_path):
+    return index_path + SHARD_META_SUFFIX
+
+
+def read_shard_meta(index_path):
+    """读取分片元数据，没有时返回 None（普通索引也可作为分片）。"""
+    try:
+        with open(shard_meta_path(index_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _shard_name(*parts):
+    name = "_".join(p for p in parts if p)
+    return re.sub(r"[^\w.\-]+", "_", name).strip("_") or "shard"
+
+
+# ========== 构建 ==========
+
+def plan_shards(roots, split_top_level=False):
+    """返回 [(分片名, 目录, 是否递归)]；split_top_level 时每个顶层子目录一个分片，根目录散放文件另成一片。"""
+    plan, used = [], set()
+
+    def add(name, path, recursive):
+        unique, i = name, 1
+        while unique in used:
+            unique, i = f"{name}_{i}", i + 1
+        used.add(unique)
+        plan.append((unique, path, recursive))
+
+    for root in roots:
+        root = os.path.abspath(root)
+        volume = os.path.basename(root.rstrip("/\\")) or root
+        if not split_top_level:
+            add(_shard_name(volume), root, True)
+            continue
+        with os.scandir(root) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        if any(e.is_file() for e in entries):
+            add(_shard_name(volume, ROOT_SHARD), root, False)
+        for e in entries:
+            if e.is_dir() and not e.name.startswith("."):
+                add(_shard_name(volume, e.name), e.path, True)
+    return plan
+
+
+def build_shard(root, index_path, workers=None, recursive=True, incremental=True, name=None):
+    """构建（或增量更新）一个分片并写入元数据，返回元数据字典。"""
+    from build_image_index import build_image_index
+    stats = build_image_index(root, index_path, workers, incremental, recursive=recursive)
+    meta = {
+        "format": SHARD_FORMAT,
+        "name": name or _shard_name(os.path.basename(index_path)),
+        "root": os.path.abspath(root),
+        "recursive": recursive,
+        "index": os.path.basename(index_path),
+        "entries": stats["entries"],
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+    }
+    with open(shard_meta_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def build_shards(roots, out_dir, split_top_level=False, fmt=".json", workers=None, parallel=SHARD_PARALLEL,
+                 incremental=True):
+    """把每个根目录（或其顶层子目录）构建成独立分片，写出清单，返回清单路径。
+
+    分片之间互不依赖，也可以在不同机器上分别运行 build 后再用 manifest / merge 汇总。
+    workers 为总的哈希进程数（默认 CPU 核数），平分给同时构建的分片，避免进程数超过核数。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    plan = plan_shards(roots, split_top_level)
+    parallel = max(1, min(parallel, len(plan)))
+    per_shard = max(1, (workers or os.cpu_count() or 1) // parallel)
+    print(f"🧩 共 {len(plan)} 个分片，同时构建 {parallel} 个，每个 {per_shard} 个进程")
+    with ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = [pool.submit(build_shard, path, os.path.join(out_dir, name + fmt), per_shard, recursive,
+                               incremental, name)
+                   for name, path, recursive in plan]
+        metas = [f.result() for f in futures]
+    manifest = os.path.join(out_dir, "原图索引" + MANIFEST_EXT)
+    write_manifest([os.path.join(out_dir, m["index"]) for m in metas], manifest)
+    for m in metas:
+        print(f"  {m['name']}: {m['entries']} 条  ← {m['root']}")
+    return manifest
+
+
+# ========== 清单 ==========
+
+def parse_remap(items):
+    """["旧前缀=新前缀", ...] -> [(旧, 新)]。"""
+    pairs = []
+    for item in items or ():
+        old, sep, new = item.partition("=")
+        if not sep or not old:
+            raise ValueError(f"路径改写格式应为 旧前缀=新前缀：{item}")
+        pairs.append((old, new))
+    return pairs
+
+
+def write_manifest(shard_paths, manifest_path, remap=None):
+    """写分片清单；分片路径相对清单所在目录保存，remap 对所有分片生效。"""
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    shards = []
+    for path in shard_paths:
+        meta = read_shard_meta(path) or {}
+        shards.append({
+            "index": os.path.relpath(os.path.abspath(path), base),
+            "name": meta.get("name") or _shard_name(os.path.basename(path)),
+            "root": meta.get("root"),
+            "entries": meta.get("entries"),
+            "remap": [list(p) for p in remap or ()],
+        })
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"format": SHARD_FORMAT, "shards": shards}, f, ensure_ascii=False, indent=2)
+    return manifest_path
+
+
+def read_manifest(manifest_path):
+    """返回 [(分片索引绝对路径, 分片名, [(旧, 新)])]。"""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    return [(os.path.join(base, s["index"]), s.get("name") or s["index"], [tuple(p) for p in s.get("remap") or ()])
+            for s in data["shards"]]
+
+
+def load_manifest(manifest_path, on_log=print, on_progress=lambda done, total: None):
+    """加载清单中的全部分片，返回 ShardedIndex；每个分片沿用 match_engine.load_index 的缓存逻辑。"""
+    from match_engine import load_index
+    shards, remaps, names = [], [], []
+    for path, name, remap in read_manifest(manifest_path):
+        index = load_index(path, on_log, in_memory=True)  # 联合检索需要连续行号的 HammingIndex
+        if isinstance(index, dict):
+            raise ValueError(f"分片无法建立检索结构：{path}")
+        shards.append(index)
+        remaps.append(remap)
+        names.append(name)
+    sharded = ShardedIndex(shards, remaps, names)
+    on_progress(len(sharded), len(sharded))
+    on_log(f"分片索引加载完成：{len(shards)} 个分片，共 {len(sharded)} 条记录。")
+    return sharded
+
+
+# ========== 合并 ==========
+
+def iter_shard_entries(path):
+    """按记录字典逐条读出分片（.json / .sqlite / .phidx）。"""
+    if path.endswith(INDEX_STORE_EXT):
+        with IndexStore(path, readonly=True) as store:
+            yield from store.iter_entries()
+    elif path.endswith(BINARY_INDEX_EXT):
+        idx = BinaryIndex(path, verify=True)
+        try:
+            for row in range(len(idx)):
+                entry = {"path": idx[row], "phash": format(int(idx.hashes[row]), "016x"),
+                         "size": list(idx.size(row))}
+                if idx.fine is not None:
+                    entry["phash_fine"] = "".join(format(int(w), "016x") for w in idx.fine[row])
+                if idx.exact is not None and idx.exact[row]["file_size"]:
+                    # 精确查重表存的是摘要所覆盖的字节数（内嵌图片为图片本身），不是容器文件大小
+                    entry["content_size"] = int(idx.exact[row]["file_size"])
+                    entry["digest"] = idx.exact[row]["digest"].tobytes().hex()
+                if idx.algorithm:
+                    entry["algorithm"] = idx.algorithm
+                yield entry
+        finally:
+            idx.close()
+    else:
+        yield from load_json_entries(path)
+
+
+def merge_shards(shard_paths, out_path, remap=None, shard_remaps=None):
+    """把多个分片合并成一个索引文件（格式由扩展名决定），返回写入条数。
+
+    remap 为对所有分片生效的 [(旧前缀, 新前缀)]，shard_remaps 为各分片自己的规则（如清单中记录的），
+    写入时改写路径；同一原图出现在多个分片时，JSON / .phidx 全部保留，.sqlite 按 path 唯一保留最后一次。
+    """
+    def entries():
+        for k, path in enumerate(shard_paths):
+            rules = list(remap or ()) + list(shard_remaps[k] if shard_remaps else ())
+            for e in iter_shard_entries(path):
+                if rules:
+                    e = dict(e, path=remap_path(e["path"], rules))
+                yield e
+
+    if out_path.endswith(INDEX_STORE_EXT):
+        with IndexStore(out_path) as store:
+            store.clear()
+            batch = []
+            for e in entries():
+                batch.append(e)
+                if len(batch) >= STORE_BATCH:
+                    store.upsert(batch)
+                    batch = []
+            store.upsert(batch)
+            return store.image_count()
+    if out_path.endswith(BINARY_INDEX_EXT):
+        return write_binary_index(list(entries()), out_path)
+    merged = list(entries())
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, out_path)
+    return sum(1 for e in merged if "phash" in e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分片原图索引：按卷 / 顶层目录分别构建，再合并或联合查询")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="为每个根目录构建分片并写出清单")
+    p_build.add_argument("roots", nargs="+")
+    p_build.add_argument("--out", required=True, help="分片输出目录")
+    p_build.add_argument("--split", action="store_true", help="每个顶层子目录单独成片")
+    p_build.add_argument("--format", choices=[".json", INDEX_STORE_EXT, BINARY_INDEX_EXT], default=".json")
+    p_build.add_argument("--workers", type=int, default=None)
+    p_build.add_argument("--parallel", type=int, default=SHARD_PARALLEL)
+    p_build.add_argument("--full", action="store_true")
+    p_manifest = sub.add_parser("manifest", help="把已有分片（可来自不同机器）写成清单")
+    p_manifest.add_argument("manifest")
+    p_manifest.add_argument("shards", nargs="+")
+    p_manifest.add_argument("--remap", action="append", help="旧前缀=新前缀，可重复")
+    p_merge = sub.add_parser("merge", help="合并成单个索引文件（.json / .sqlite / .phidx）")
+    p_merge.add_argument("out")
+    p_merge.add_argument("shards", nargs="+", help="分片索引或清单")
+    p_merge.add_argument("--remap", action="append", help="旧前缀=新前缀，可重复")
+    p_info = sub.add_parser("info", help="列出清单中的分片")
+    p_info.add_argument("manifest")
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        if args.format == BINARY_INDEX_EXT:
+            sys.exit("二进制索引请先构建 .json 分片，再用 merge 输出 .phidx")
+        manifest = build_shards(args.roots, args.out, args.split, args.format, args.workers, args.parallel,
+                                not args.full)
+        print(f"📝 清单已保存至：{manifest}")
+    elif args.cmd == "manifest":
+        # 允许直接传 分片目录/*.json：跳过元数据与清单文件
+        shard_paths = [p for p in args.shards if not p.endswith((SHARD_META_SUFFIX, MANIFEST_EXT))]
+        write_manifest(shard_paths, args.manifest, parse_remap(args.remap))
+        print(f"📝 清单已保存至：{args.manifest}")
+    elif args.cmd == "merge":
+        paths, shard_remaps = [], []
+        for item in args.shards:
+            listed = read_manifest(item) if item.endswith(MANIFEST_EXT) else [(item, None, [])]
+            for path, _, shard_remap in listed:
+                paths.append(path)
+                shard_remaps.append(shard_remap)
+        count = merge_shards(paths, args.out, parse_remap(args.remap), shard_remaps)
+        print(f"✅ 已合并 {len(paths)} 个分片，共 {count} 条记录：{args.out}")
+    else:
+        for path, name, remap in read_manifest(args.manifest):
+            meta = read_shard_meta(path) or {}
+            print(f"{name}\t{meta.get('entries', '?')} 条\t{meta.get('root', '?')}\t{meta.get('built_at', '?')}"
+                  f"\t{meta.get('host', '?')}\t{path}" + (f"\t改写 {remap}" if remap else ""))
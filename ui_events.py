@@ -0,0 +1,108 @@
+import threading
+import traceback
+
+# ========== 配置 ==========
+DEFAULT_TICK_MS = 66  # 约 15 Hz 刷新界面
+LOG_LEVELS = {"DEBUG": 10, "INFO": 20, "ERROR": 40}
+
+
+def infer_level(msg):
+    """按消息前缀推断级别：[DEBUG] / [ERROR] / 其它为 INFO。"""
+    if msg.startswith("[DEBUG]"):
+        return "DEBUG"
+    if msg.startswith("[ERROR]"):
+        return "ERROR"
+    return "INFO"
+
+
+class EventBus:
+    """工作线程投递事件，Tk 主线程按固定节拍合并处理。
+
+    - log(msg)：日志行先进缓冲区，每个节拍合并成一次插入交给日志输出；
+      低于当前级别的消息直接丢弃。
+    - emit(name, *args)：进度类事件只保留最新一次的参数，每个节拍最多处理一次。
+    工作线程不再直接调用任何控件方法，也不再为每条记录排队一个 after(0) 回调。
+    """
+
+    def __init__(self, widget, tick_ms=DEFAULT_TICK_MS, level="INFO"):
+        self.widget = widget
+        self.tick_ms = tick_ms
+        self.level = LOG_LEVELS[level]
+        self._lock = threading.Lock()
+        self._lines = []
+        self._latest = {}
+        self._handlers = {}
+        self._log_sinks = []
+        self._running = False
+
+    # ---------- 注册 ----------
+
+    def add_log_sink(self, fn):
+        """fn(lines) 在主线程接收一批日志行。"""
+        self._log_sinks.append(fn)
+
+    def on(self, name, fn):
+        """fn(*args) 在主线程处理名为 name 的合并事件。"""
+        self._handlers[name] = fn
+
+    def set_level(self, level):
+        self.level = LOG_LEVELS[level]
+
+    def enabled(self, level):
+        return LOG_LEVELS[level] >= self.level
+
+    # ---------- 工作线程侧 ----------
+
+    def log(self, msg, level=None):
+        if LOG_LEVELS[level or infer_level(msg)] < self.level:
+            return
+        with self._lock:
+            self._lines.append(msg)
+
+    def emit(self, name, *args):
+        with self._lock:
+            self._latest[name] = args
+
+    def call(self, fn):
+        """在下一个节拍于主线程执行 fn()（用于弹窗等一次性操作）。"""
+        with self._lock:
+            self._latest[("call", id(fn))] = (fn,)
+
+    # ---------- 主线程侧 ----------
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self.widget.after(0, self._tick)
+
+    def stop(self):
+        self._running = False
+
+    def flush(self):
+        """处理本节拍积累的事件；单个输出或处理函数出错只打印到 stderr，不影响其余事件。"""
+        with self._lock:
+            lines, self._lines = self._lines, []
+            latest, self._latest = self._latest, {}
+        if lines:
+            for sink in self._log_sinks:
+                self._dispatch(sink, lines)
+        for name, args in latest.items():
+            if isinstance(name, tuple):
+                self._dispatch(args[0])
+            elif name in self._handlers:
+                self._dispatch(self._handlers[name], *args)
+
+    @staticmethod
+    def _dispatch(fn, *args):
+        try:
+            fn(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def _tick(self):
+        if not self._running:
+            return
+        try:
+            self.flush()
+        finally:
+            self.widget.after(self.tick_ms, self._tick)